@@ -1,20 +1,37 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+import hashlib
+import logging
 import os
+import secrets
+import uuid
 from models import User, UserResponse
+from utils import TrackedExecutor
+from cache import cache
+from invalidation import on_user_invalidation
+from database import database
 
 # Security configuration
 SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+logger = logging.getLogger(__name__)
+
+# Authenticated requests reuse the member's profile instead of reading it every time
+USER_CACHE_TTL_SECONDS = 60
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+# Lets anonymous requests through to endpoints where signing in is optional
+optional_security = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -24,6 +41,25 @@ def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash a batch of passwords; used by bulk imports through a process pool"""
+    return [pwd_context.hash(password) for password in passwords]
+
+def is_bcrypt_hash(value: str) -> bool:
+    """Whether a string is a bcrypt hash this app can verify"""
+    return pwd_context.identify(value) == "bcrypt"
+
+# bcrypt releases the GIL while hashing, so hashes run in parallel on this pool
+hash_executor = TrackedExecutor(max_workers=int(os.environ.get("BCRYPT_WORKERS", "4")), name="bcrypt")
+
+async def hash_password(password: str) -> str:
+    """Hash a password off the event loop"""
+    return await hash_executor.run(get_password_hash, password)
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password off the event loop"""
+    return await hash_executor.run(verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -36,6 +72,49 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are random and long, so a fast hash is enough at rest
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def issue_refresh_token(db: AsyncIOMotorDatabase, user_id: str, family: Optional[str] = None) -> str:
+    """Create a refresh token; each login starts a family that its rotations share"""
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    await db.refresh_tokens.insert_one({
+        "_id": hash_refresh_token(token),
+        "userId": user_id,
+        "family": family or str(uuid.uuid4()),
+        "createdAt": now,
+        "expiresAt": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        "usedAt": None
+    })
+    return token
+
+async def rotate_refresh_token(db: AsyncIOMotorDatabase, token: str) -> Optional[Tuple[str, str]]:
+    """Spend a refresh token and issue its successor; returns (user id, new token).
+    
+    A token can be spent once. Presenting a spent token means it was copied,
+    so the whole family is revoked and both holders must sign in again.
+    """
+    token_id = hash_refresh_token(token)
+    now = datetime.utcnow()
+    spent = await db.refresh_tokens.find_one_and_update(
+        {"_id": token_id, "usedAt": None, "expiresAt": {"$gt": now}},
+        {"$set": {"usedAt": now}},
+        projection={"userId": 1, "family": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if spent is None:
+        reused = await db.refresh_tokens.find_one(
+            {"_id": token_id, "usedAt": {"$ne": None}}, {"userId": 1, "family": 1}
+        )
+        if reused:
+            logger.warning("Refresh token reused for user %s; revoking its family", reused["userId"])
+            await db.refresh_tokens.delete_many({"family": reused["family"]})
+        return None
+    
+    return spent["userId"], await issue_refresh_token(db, spent["userId"], spent["family"])
+
 def verify_token(token: str) -> Optional[dict]:
     """Verify and decode a JWT token"""
     try:
@@ -47,6 +126,21 @@ def verify_token(token: str) -> Optional[dict]:
     except JWTError:
         return None
 
+def user_cache_key(email: str) -> str:
+    return f"user:{email}"
+
+async def evict_cached_users(*emails: str):
+    """Drop cached profiles in every worker after a change to these members"""
+    await cache.evict(*(user_cache_key(email) for email in emails if email))
+
+@on_user_invalidation
+async def evict_invalidated_users(user_ids: List[str]):
+    # Profiles are cached by the email tokens carry, so look those up first
+    users = await database.db.users.find(
+        {"_id": {"$in": user_ids}}, {"email": 1}
+    ).to_list(length=None)
+    await evict_cached_users(*(user["email"] for user in users))
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncIOMotorClient = Depends(lambda: None)  # Will be properly injected
@@ -71,9 +165,15 @@ async def get_current_user(
     if email is None:
         raise credentials_exception
     
+    cached = await cache.get(user_cache_key(email))
+    if cached is not None:
+        return UserResponse(**cached)
+    
     # Get database from app state (will be properly configured)
     from server import db
-    user_data = await db.users.find_one({"email": email})
+    # The QR card is a few KB of base64 that most requests never use, so it
+    # stays out of the cached profile; endpoints returning it load it themselves
+    user_data = await db.users.find_one({"email": email}, {"password": 0, "qrCode": 0})
     
     if user_data is None:
         raise credentials_exception
@@ -87,14 +187,14 @@ async def get_current_user(
         membershipType=user_data["membershipType"],
         membershipStatus=user_data["membershipStatus"],
         joinDate=user_data["joinDate"],
-        avatar=user_data.get("avatar"),
-        qrCode=user_data.get("qrCode")
+        avatar=user_data.get("avatar")
     )
+    await cache.set(user_cache_key(email), user_response.dict(exclude={"qrCode"}), USER_CACHE_TTL_SECONDS)
     
     return user_response
 
 async def get_optional_current_user(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
 ) -> Optional[UserResponse]:
     """Get the current user if authenticated, otherwise return None"""
     if not credentials:
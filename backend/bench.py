@@ -0,0 +1,494 @@
+"""Benchmark harness for the API hot paths.
+
+Drives the FastAPI app in-process through httpx's ASGI transport against
+either a local mongod or an in-memory Motor stand-in (mongomock-motor), and
+reports latency percentiles, throughput and database operations per request
+as JSON.
+
+    python bench.py run --backend memory --output base.json
+    python bench.py run --backend mongo --mongo-url mongodb://localhost:27017
+    python bench.py compare base.json head.json --threshold 0.1
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import typer
+from pymongo import IndexModel, monitoring
+
+ROOT_DIR = Path(__file__).parent
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+# The login scenario times bcrypt from one address; the limiter would refuse most of it
+os.environ.setdefault("LOGIN_IP_PER_MINUTE", "1000000000")
+sys.path.insert(0, str(ROOT_DIR))
+
+cli = typer.Typer(help="Benchmark the Athletics NT API hot paths")
+
+BENCH_PASSWORD = "bench-password"
+SEED = 1234
+
+# Collection methods that always cost at least one round trip
+DB_METHODS = {
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "aggregate",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "count_documents", "bulk_write", "distinct"
+}
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts commands sent to a real mongod"""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+class CountingCollection:
+    """Counts calls made against an in-memory collection"""
+
+    def __init__(self, collection, counter: "CountingDatabase"):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in DB_METHODS:
+            self._counter.count += 1
+        return attr
+
+    async def create_indexes(self, indexes: List[IndexModel]):
+        # mongomock drops partialFilterExpression and would index missing keys
+        # as null; sparse is the nearest filter it honours
+        stand_ins = []
+        for index in indexes:
+            options = dict(index.document)
+            if options.pop("partialFilterExpression", None) is not None:
+                index = IndexModel(list(options.pop("key").items()), sparse=True, **options)
+            stand_ins.append(index)
+        return await self._collection.create_indexes(stand_ins)
+
+class CountingDatabase:
+    """Wraps an in-memory database so operations can be attributed to requests"""
+
+    def __init__(self, db):
+        self._db = db
+        self.count = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if hasattr(attr, "find_one"):
+            return CountingCollection(attr, self)
+        return attr
+
+    def __getitem__(self, name):
+        return CountingCollection(self._db[name], self)
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: Callable[[int], str]
+    body: Optional[Callable[[int], dict]] = None
+    auth: bool = False
+    max_requests: Optional[int] = None
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def open_database(backend: str, mongo_url: str):
+    """Return (client, database, op counter) for the selected backend"""
+    db_name = f"athletics_bench_{os.getpid()}"
+    if backend == "memory":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise typer.BadParameter("the memory backend requires mongomock-motor")
+        client = AsyncMongoMockClient()
+        db = CountingDatabase(client[db_name])
+        return client, db, db
+    
+    from motor.motor_asyncio import AsyncIOMotorClient
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[counter])
+    return client, client[db_name], counter
+
+async def seed(db, users: int, events: int, posts: int) -> Dict[str, list]:
+    """Insert a deterministic data set and return ids and tokens to drive requests"""
+    import database
+    from auth import get_password_hash, create_access_token
+    from models import User, Event, EventType, CommunityPost
+    from utils import event_document
+    
+    rng = random.Random(SEED)
+    await database.ensure_schema()
+    
+    password_hash = get_password_hash(BENCH_PASSWORD)
+    user_docs = [
+        User(
+            name=f"Bench Athlete {i}",
+            email=f"athlete{i}@bench.example.com",
+            password=password_hash,
+            memberId=f"B{i:06d}",
+            membershipType=rng.choice(["basic", "premium", "elite"])
+        ).dict(by_alias=True)
+        for i in range(users)
+    ]
+    await db.users.insert_many(user_docs)
+    
+    event_docs = [
+        event_document(Event(
+            name=f"Bench Meet {i}",
+            description="Benchmark event",
+            date="March 15, 2030",
+            time="9:00 AM - 5:00 PM",
+            type=rng.choice(list(EventType)),
+            location="Darwin",
+            maxCapacity=users * 2,
+            registrationDeadline="March 1, 2030",
+            nameLower=f"bench meet {i}"
+        ))
+        for i in range(events)
+    ]
+    await db.events.insert_many(event_docs)
+    
+    post_docs = [
+        CommunityPost(
+            author=user_docs[i % users]["name"],
+            authorId=user_docs[i % users]["_id"],
+            title=f"Training log {i}",
+            content="Intervals and strides. " * 20
+        ).dict(by_alias=True)
+        for i in range(posts)
+    ]
+    await db.community_posts.insert_many(post_docs)
+    
+    return {
+        "users": user_docs,
+        "events": [event["_id"] for event in event_docs],
+        "tokens": [create_access_token({"sub": user["email"]}) for user in user_docs]
+    }
+
+def build_scenarios(data: Dict[str, list]) -> List[Scenario]:
+    users = data["users"]
+    events = data["events"]
+    
+    # Every request of the register scenario uses a distinct (user, event) pair
+    def register_path(i):
+        return f"/api/events/{events[(i // len(users)) % len(events)]}/register"
+    
+    return [
+        Scenario(
+            "auth_login", "POST", lambda i: "/api/auth/login",
+            body=lambda i: {"email": users[i % len(users)]["email"], "password": BENCH_PASSWORD},
+            max_requests=50
+        ),
+        Scenario("events_list", "GET", lambda i: "/api/events/?status_filter=upcoming", auth=True),
+        Scenario("events_register", "POST", register_path, auth=True),
+        Scenario("community_posts", "GET", lambda i: "/api/community/posts?limit=20", auth=True),
+        Scenario(
+            "qr_scan", "POST", lambda i: "/api/qr/scan",
+            body=lambda i: {"qrCode": f"NT-MEMBER-{users[i % len(users)]['_id']}-BASIC"},
+            auth=True
+        ),
+        Scenario("membership_my_card", "GET", lambda i: "/api/membership/my-card", auth=True),
+    ]
+
+async def run_scenario(client, scenario: Scenario, data, counter, requests: int, concurrency: int, warmup: int):
+    """Run one scenario and summarise its latency, throughput and DB usage"""
+    users = data["users"]
+    tokens = data["tokens"]
+    total = min(requests, scenario.max_requests or requests)
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def issue(i):
+        headers = {"Authorization": f"Bearer {tokens[i % len(users)]}"} if scenario.auth else None
+        body = scenario.body(i) if scenario.body else None
+        return await client.request(scenario.method, scenario.path(i), json=body, headers=headers)
+    
+    for i in range(warmup):
+        await issue(total + i)
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            started = time.perf_counter()
+            response = await issue(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+    
+    ops_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ops = counter.count - ops_before
+    
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "db_ops_per_request": round(ops / total, 2) if total else 0.0
+    }
+
+async def run_benchmarks(backend, mongo_url, requests, concurrency, warmup, users, events, posts, only):
+    import httpx
+    import database
+    import server
+    
+    client, db, counter = await open_database(backend, mongo_url)
+    database.database.client = client
+    database.database.db = db
+    server.db = db
+    
+    try:
+        data = await seed(db, users, events, posts)
+        scenarios = [s for s in build_scenarios(data) if not only or s.name in only]
+        results = {}
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            for scenario in scenarios:
+                results[scenario.name] = await run_scenario(
+                    http, scenario, data, counter, requests, concurrency, warmup
+                )
+                typer.echo(f"{scenario.name}: {results[scenario.name]}", err=True)
+    finally:
+        if backend == "mongo":
+            await client.drop_database(db.name)
+        client.close()
+    
+    return {
+        "commit": current_commit(),
+        "backend": backend,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "requests": requests, "concurrency": concurrency, "warmup": warmup,
+            "users": users, "events": events, "posts": posts
+        },
+        "scenarios": results
+    }
+
+@cli.command()
+def run(
+    backend: str = typer.Option("memory", help="memory (mongomock-motor) or mongo"),
+    mongo_url: str = typer.Option("mongodb://localhost:27017", help="Used with --backend mongo"),
+    requests: int = typer.Option(500, help="Requests per scenario"),
+    concurrency: int = typer.Option(10, help="Concurrent in-flight requests"),
+    warmup: int = typer.Option(20, help="Unmeasured requests per scenario"),
+    users: int = typer.Option(200),
+    events: int = typer.Option(50),
+    posts: int = typer.Option(200),
+    scenario: Optional[List[str]] = typer.Option(None, help="Only run these scenarios"),
+    output: Optional[Path] = typer.Option(None, help="Write the JSON report here"),
+):
+    """Run the benchmark scenarios and print a JSON report"""
+    import logging
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    
+    report = asyncio.run(run_benchmarks(
+        backend, mongo_url, requests, concurrency, warmup, users, events, posts, scenario
+    ))
+    text = json.dumps(report, indent=2)
+    if output:
+        output.write_text(text + "\n")
+    typer.echo(text)
+
+async def time_asgi(app, iterations: int) -> float:
+    """Mean microseconds per request for an ASGI app called directly"""
+    scope = {"type": "http", "method": "GET", "path": "/bench", "headers": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+    
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+async def run_overhead(iterations: int) -> Dict[str, float]:
+    from metrics import MetricsMiddleware
+
+    class Route:
+        path = "/bench/{item_id}"
+
+    async def endpoint(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+    
+    baseline = min([await time_asgi(endpoint, iterations) for _ in range(3)])
+    with_metrics = min([await time_asgi(MetricsMiddleware(endpoint), iterations) for _ in range(3)])
+    return {
+        "baseline_us": round(baseline, 3),
+        "metrics_middleware_us": round(with_metrics, 3),
+        "metrics_overhead_us": round(with_metrics - baseline, 3),
+        **time_rate_limiter(iterations)
+    }
+
+def time_rate_limiter(iterations: int) -> Dict[str, float]:
+    """Mean microseconds per token bucket check, for one hot key and for LRU churn"""
+    from ratelimit import RateLimiter
+
+    def per_call(keys: List[str]) -> float:
+        # High rate so every call takes the allowed path
+        limiter = RateLimiter("bench", rate=1e9, burst=10, max_keys=10000)
+        started = time.perf_counter()
+        for key in keys:
+            limiter.acquire(key)
+        return (time.perf_counter() - started) / len(keys) * 1e6
+    
+    hot = ["203.0.113.7"] * iterations
+    churn = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(iterations)]
+    return {
+        "rate_limit_hot_key_us": round(min(per_call(hot) for _ in range(3)), 3),
+        "rate_limit_lru_churn_us": round(min(per_call(churn) for _ in range(3)), 3)
+    }
+
+@cli.command()
+def overhead(iterations: int = typer.Option(100000, help="Requests per measurement")):
+    """Measure per-request overhead of the instrumentation middleware and rate limiter"""
+    typer.echo(json.dumps(asyncio.run(run_overhead(iterations)), indent=2))
+
+def sample_event_documents(count: int) -> List[dict]:
+    from models import Event, EventType
+    documents = []
+    for i in range(count):
+        document = Event(
+            name=f"Bench Meet {i}",
+            description="Benchmark event " * 10,
+            date="March 15, 2030",
+            time="9:00 AM - 5:00 PM",
+            type=EventType.SPRINT,
+            location="Darwin",
+            maxCapacity=200,
+            registrationDeadline="March 1, 2030",
+            registrationCount=i % 200
+        ).dict(by_alias=True)
+        documents.append(document)
+    return documents
+
+async def run_serialization(sizes: List[int], rounds: int) -> Dict[str, dict]:
+    """Time the model-per-document path against the projected orjson path"""
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from models import EventResponse
+    from routes.events import event_response_dict
+    
+    field = create_response_field(name="events", type_=List[EventResponse])
+    results = {}
+    for size in sizes:
+        documents = sample_event_documents(size)
+
+        async def model_path():
+            models = [
+                EventResponse(
+                    id=event["_id"], name=event["name"], description=event["description"],
+                    date=event["date"], time=event["time"], type=event["type"],
+                    location=event["location"], maxCapacity=event["maxCapacity"],
+                    memberOnly=event["memberOnly"], price=event["price"],
+                    registrationDeadline=event["registrationDeadline"], status=event["status"],
+                    registrations=len(event.get("registrations", [])), results=event.get("results")
+                )
+                for event in documents
+            ]
+            content = await serialize_response(field=field, response_content=models)
+            return JSONResponse(content).body
+
+        async def orjson_path():
+            return ORJSONResponse([event_response_dict(event) for event in documents]).body
+        
+        timings = {}
+        for name, path in (("model_ms", model_path), ("orjson_ms", orjson_path)):
+            best = float("inf")
+            for _ in range(rounds):
+                started = time.perf_counter()
+                await path()
+                best = min(best, time.perf_counter() - started)
+            timings[name] = round(best * 1000, 3)
+        timings["speedup"] = round(timings["model_ms"] / timings["orjson_ms"], 1)
+        results[str(size)] = timings
+    return results
+
+@cli.command()
+def serialize(
+    size: List[int] = typer.Option([100, 1000], help="List sizes to serialize"),
+    rounds: int = typer.Option(20, help="Best of this many runs per size"),
+):
+    """Compare list endpoint serialization paths"""
+    typer.echo(json.dumps(asyncio.run(run_serialization(size, rounds)), indent=2))
+
+@cli.command()
+def compare(
+    base: Path,
+    head: Path,
+    threshold: float = typer.Option(0.10, help="Allowed relative slowdown before flagging"),
+):
+    """Compare two reports and exit non-zero when head regresses against base"""
+    base_report = json.loads(base.read_text())
+    head_report = json.loads(head.read_text())
+    regressions = []
+    
+    for name, head_result in head_report["scenarios"].items():
+        base_result = base_report["scenarios"].get(name)
+        if not base_result:
+            typer.echo(f"{name}: new scenario, no baseline")
+            continue
+        
+        checks = [
+            ("p95_ms", head_result["p95_ms"] > base_result["p95_ms"] * (1 + threshold)),
+            ("p99_ms", head_result["p99_ms"] > base_result["p99_ms"] * (1 + threshold)),
+            ("throughput_rps", head_result["throughput_rps"] < base_result["throughput_rps"] * (1 - threshold)),
+            ("db_ops_per_request", head_result["db_ops_per_request"] > base_result["db_ops_per_request"]),
+        ]
+        for metric, regressed in checks:
+            marker = "REGRESSION" if regressed else "ok"
+            typer.echo(f"{name:22} {metric:20} {base_result[metric]:>10} -> {head_result[metric]:>10}  {marker}")
+            if regressed:
+                regressions.append((name, metric))
+    
+    if regressions:
+        typer.echo(f"{len(regressions)} regression(s) between {base_report.get('commit')} and {head_report.get('commit')}")
+        raise typer.Exit(code=1)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,59 @@
+import asyncio
+import json
+from typing import Optional, Set
+
+class Subscription:
+    """A single client's bounded buffer of pending broadcast messages"""
+
+    def __init__(self, hub: "BroadcastHub", buffer_size: int):
+        self.hub = hub
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Wait for the next message; returns None once the subscription was dropped"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        """Detach from the hub"""
+        self.hub.unsubscribe(self)
+
+class BroadcastHub:
+    """In-process fan-out of messages to many subscribers.
+
+    Messages are encoded once per publish and shared by every subscriber.
+    A subscriber whose buffer is full is dropped rather than slowing down the
+    publisher; it receives an end-of-stream marker and is expected to
+    reconnect and resync.
+    """
+
+    def __init__(self, buffer_size: int = 64):
+        self.buffer_size = buffer_size
+        self.subscribers: Set[Subscription] = set()
+        self.dropped_count = 0
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self, self.buffer_size)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, event: str, data: dict):
+        """Queue a server-sent event for every subscriber without blocking"""
+        message = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+        for subscription in list(self.subscribers):
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    def _drop(self, subscription: Subscription):
+        """Disconnect a slow consumer, discarding its backlog"""
+        self.unsubscribe(subscription)
+        self.dropped_count += 1
+        subscription.dropped = True
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
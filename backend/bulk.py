@@ -0,0 +1,556 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from pydantic import ValidationError
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple, Union
+from datetime import datetime
+from models import Event, EventCreate, MemberImport, ResultCreate, User
+from auth import hash_passwords, is_bcrypt_hash
+from member_ids import allocate_member_ids, is_mistyped_member_id
+from member_stats import record_members_added
+from utils import event_schedule_fields, server_stamped_insert
+from results import build_result, save_results, summarize_event_results
+from waitlist import SEAT_FREE_WITH_QUEUE, promote_waitlist
+from concurrent.futures import Executor
+import asyncio
+import csv
+import io
+import itertools
+import json
+import zlib
+
+BULK_CHUNK_SIZE = 500
+MEMBER_CHUNK_SIZE = 1000
+HASH_BATCH_SIZE = 50
+MAX_REPORTED_ERRORS = 1000
+CURSOR_BATCH_SIZE = 500
+EXPORT_CHUNK_CHARS = 64 * 1024
+
+EVENT_EXPORT_FIELDS = [
+    "externalId", "name", "description", "date", "time", "type", "location",
+    "maxCapacity", "memberOnly", "price", "registrationDeadline", "status", "registrationCount"
+]
+
+ACCESS_LOG_EXPORT_FIELDS = [
+    "id", "scannedAt", "userId", "memberId", "accessType", "valid", "operatorId", "qrCode", "error"
+]
+
+def detect_format(filename: Optional[str], requested: Optional[str] = None) -> str:
+    """Pick csv or ndjson from an explicit choice or the file extension"""
+    if requested:
+        return requested
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if filename and filename.lower().endswith(".lif"):
+        return "lif"
+    return "csv"
+
+def iter_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Union[dict, ValueError]]]:
+    """Yield (line number, row) pairs from a CSV, NDJSON or LIF text stream one at a time.
+    
+    Lines that cannot be decoded are yielded as a ValueError so the import can
+    report them and carry on with the rest of the file.
+    """
+    if fmt == "lif":
+        yield from iter_lif_rows(stream)
+        return
+    if fmt == "ndjson":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield line_number, ValueError("Row must be a JSON object")
+                continue
+            yield line_number, row
+        return
+    
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # Empty cells mean "not provided" so model defaults apply
+        yield reader.line_num, {k: v for k, v in row.items() if k and v not in ("", None)}
+
+def iter_lif_rows(stream: TextIO) -> Iterator[Tuple[int, Union[dict, ValueError]]]:
+    """Rows of a photo-finish LIF file as result rows.
+    
+    The first line describes the heat (event, round, heat, name, wind); each
+    following line is place, competitor id, lane, last name, first name,
+    affiliation, time. The competitor id is the athlete's member id, and a
+    place such as DNF or DQ stands in for the time. Every row carries the
+    header's heat; timing systems only number the round, so callers name it.
+    """
+    reader = csv.reader(stream)
+    header = None
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if header is None:
+            header = {}
+            cells = [cell.strip() for cell in row] + [""] * 5
+            if cells[2].isdigit():
+                header["heat"] = int(cells[2])
+            # NWI or an empty cell means no wind reading
+            try:
+                header["wind"] = float(cells[4])
+            except ValueError:
+                pass
+            continue
+        if len(row) < 7 or not row[1].strip():
+            yield reader.line_num, ValueError("Expected place, id, lane, last name, first name, affiliation and time")
+            continue
+        
+        place = row[0].strip().upper()
+        result = {**header, "memberId": row[1].strip(), "mark": row[6].strip()}
+        if place.isdigit():
+            result["placing"] = int(place)
+        else:
+            result["mark"] = place
+        yield reader.line_num, result
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+class ImportReport:
+    """Counts and per-row errors of a bulk import"""
+
+    def __init__(self):
+        self.processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.skipped = 0
+        self.errors: List[dict] = []
+
+    def add_error(self, row: int, error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": error})
+
+    def dict(self) -> dict:
+        return {
+            "processed": self.processed,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "errors": self.errors
+        }
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in error.errors()
+    )
+
+def event_upsert(event_data: EventCreate, now: datetime) -> UpdateOne:
+    """Upsert keyed by externalId that leaves registrations and status alone on update"""
+    fields = event_data.dict()
+    fields["nameLower"] = event_data.name.lower()
+    fields["updatedAt"] = now
+    fields.update(event_schedule_fields(event_data.date, event_data.time))
+    
+    new_event = Event(**fields).dict(by_alias=True)
+    on_insert = {
+        key: new_event[key]
+        for key in (
+            "_id", "status", "registrations", "registrationCount",
+            "waitlist", "waitlistCount", "results", "createdAt"
+        )
+    }
+    return UpdateOne(
+        {"externalId": event_data.externalId},
+        {"$set": fields, "$setOnInsert": on_insert},
+        upsert=True
+    )
+
+async def import_events(
+    db: AsyncIOMotorDatabase,
+    rows: Iterable[Tuple[int, Union[dict, ValueError]]],
+    on_promoted: Optional[Callable[[dict], None]] = None
+) -> ImportReport:
+    """Validate rows with EventCreate and upsert them in chunked bulk writes.
+    
+    Updated events whose capacity now leaves seats free for people on the
+    waitlist promote them; `on_promoted` gets each such event's new counts.
+    """
+    report = ImportReport()
+    
+    for chunk in chunked(rows, BULK_CHUNK_SIZE):
+        now = datetime.utcnow()
+        operations = []
+        row_numbers = []
+        external_ids = []
+        for row_number, row in chunk:
+            report.processed += 1
+            if isinstance(row, ValueError):
+                report.add_error(row_number, str(row))
+                continue
+            try:
+                event_data = EventCreate(**row)
+            except ValidationError as e:
+                report.add_error(row_number, validation_message(e))
+                continue
+            if not event_data.externalId:
+                report.add_error(row_number, "externalId is required for imports")
+                continue
+            operations.append(event_upsert(event_data, now))
+            row_numbers.append(row_number)
+            external_ids.append(event_data.externalId)
+        
+        if not operations:
+            continue
+        
+        try:
+            result = await db.events.bulk_write(operations, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for write_error in details["writeErrors"]:
+                report.add_error(row_numbers[write_error["index"]], write_error["errmsg"])
+        
+        report.inserted += details.get("nUpserted", 0)
+        report.updated += details.get("nModified", 0)
+        
+        # A raised maxCapacity frees seats that only the waitlist may take
+        promotable = db.events.find(
+            {"externalId": {"$in": external_ids}, **SEAT_FREE_WITH_QUEUE}, {"_id": 1}
+        )
+        async for event in promotable:
+            updated_event = await promote_waitlist(db, event["_id"])
+            if updated_event and on_promoted:
+                on_promoted(updated_event)
+    
+    return report
+
+async def import_members(
+    db: AsyncIOMotorDatabase,
+    rows: Iterable[Tuple[int, Union[dict, ValueError]]],
+    hash_pool: Executor,
+    job: str,
+    chunk_size: int = MEMBER_CHUNK_SIZE
+) -> ImportReport:
+    """Load members in ordered insert chunks, checkpointing after each one.
+    
+    Passwords are hashed on `hash_pool` while the previous chunk is being
+    inserted. Rerunning the same job skips every row up to the last
+    checkpoint, so an interrupted migration picks up where it stopped.
+    QR codes are not rendered here; cards are generated when first requested.
+    """
+    checkpoint = await db.import_checkpoints.find_one({"_id": job}) or {}
+    resume_after = checkpoint.get("lastRow", 0)
+    # Rows of a chunk whose insert was cut short may already be in the database
+    retry_through = checkpoint.get("insertingThrough", 0)
+    report = ImportReport()
+    pending_insert: Optional[asyncio.Task] = None
+    
+    for chunk in chunked(rows, chunk_size):
+        last_row = chunk[-1][0]
+        if last_row <= resume_after:
+            report.skipped += len(chunk)
+            continue
+        
+        documents, row_numbers = await prepare_members(
+            db, chunk, resume_after, retry_through, hash_pool, report
+        )
+        
+        # Inserts stay in file order so checkpoints only ever move forward
+        if pending_insert:
+            await pending_insert
+        pending_insert = asyncio.create_task(
+            insert_member_chunk(db, documents, row_numbers, job, last_row, report)
+        )
+    
+    if pending_insert:
+        await pending_insert
+    await db.import_checkpoints.update_one(
+        {"_id": job},
+        {"$set": {"completedAt": datetime.utcnow()}},
+        upsert=True
+    )
+    return report
+
+async def prepare_members(
+    db: AsyncIOMotorDatabase,
+    chunk: List[Tuple[int, Union[dict, ValueError]]],
+    resume_after: int,
+    retry_through: int,
+    hash_pool: Executor,
+    report: ImportReport
+) -> Tuple[List[dict], List[int]]:
+    """Validate a chunk, drop known emails, hash passwords and build user documents.
+    
+    Known emails up to `retry_through` were inserted by an interrupted run of
+    the same job, so they are skipped rather than reported as failures.
+    """
+    members = []
+    for row_number, row in chunk:
+        if row_number <= resume_after:
+            report.skipped += 1
+            continue
+        report.processed += 1
+        if isinstance(row, ValueError):
+            report.add_error(row_number, str(row))
+            continue
+        try:
+            member = MemberImport(**row)
+        except ValidationError as e:
+            report.add_error(row_number, validation_message(e))
+            continue
+        if bool(member.password) == bool(member.passwordHash):
+            report.add_error(row_number, "Provide exactly one of password or passwordHash")
+            continue
+        if member.passwordHash and not is_bcrypt_hash(member.passwordHash):
+            report.add_error(row_number, "passwordHash is not a bcrypt hash")
+            continue
+        members.append((row_number, member))
+    
+    # One query finds members that are already registered before any hashing
+    existing = {
+        user["email"] async for user in db.users.find(
+            {"email": {"$in": [member.email for _, member in members]}}, {"email": 1}
+        )
+    }
+    for row_number, member in members:
+        if member.email not in existing:
+            continue
+        if row_number <= retry_through:
+            report.skipped += 1
+        else:
+            report.add_error(row_number, "Email already registered")
+    members = [(row_number, member) for row_number, member in members if member.email not in existing]
+    if not members:
+        return [], []
+    
+    # Hash plain passwords in batches spread over the pool
+    loop = asyncio.get_running_loop()
+    plain = [member for _, member in members if member.password]
+    batches = await asyncio.gather(*(
+        loop.run_in_executor(hash_pool, hash_passwords, [m.password for m in batch])
+        for batch in chunked(plain, HASH_BATCH_SIZE)
+    ))
+    hashes = itertools.chain.from_iterable(batches)  # in the order of `plain`
+    
+    member_ids = await allocate_member_ids(db, len(members))
+    now = datetime.utcnow()
+    documents = []
+    for (row_number, member), member_id in zip(members, member_ids):
+        documents.append(User(
+            name=member.name,
+            nameLower=member.name.lower(),
+            email=member.email,
+            password=member.passwordHash or next(hashes),
+            memberId=member_id,
+            membershipType=member.membershipType,
+            membershipStatus=member.membershipStatus,
+            joinDate=member.joinDate or now
+        ).dict(by_alias=True))
+    return documents, [row_number for row_number, _ in members]
+
+async def insert_member_chunk(
+    db: AsyncIOMotorDatabase,
+    documents: List[dict],
+    row_numbers: List[int],
+    job: str,
+    last_row: int,
+    report: ImportReport
+):
+    """Insert a chunk in order, stepping over rows that fail, then checkpoint it"""
+    # A rerun treats these rows as possibly inserted until the checkpoint moves past them
+    await db.import_checkpoints.update_one(
+        {"_id": job},
+        {"$set": {"insertingThrough": last_row}},
+        upsert=True
+    )
+    
+    start = 0
+    inserted = 0
+    failed_rows = set()
+    while start < len(documents):
+        try:
+            result = await db.users.bulk_write([
+                UpdateOne({"_id": document["_id"]}, server_stamped_insert(document), upsert=True)
+                for document in documents[start:]
+            ], ordered=True)
+            inserted += result.upserted_count
+            break
+        except BulkWriteError as e:
+            # An ordered write stops at the first failure; resume right after it
+            inserted += e.details["nUpserted"]
+            write_error = e.details["writeErrors"][0]
+            failed = start + write_error["index"]
+            failed_rows.add(failed)
+            report.add_error(
+                row_numbers[failed],
+                "Email already registered" if write_error["code"] == 11000 else write_error["errmsg"]
+            )
+            start = failed + 1
+    
+    report.inserted += inserted
+    await record_members_added(
+        db, (document for index, document in enumerate(documents) if index not in failed_rows)
+    )
+    await db.import_checkpoints.update_one(
+        {"_id": job},
+        {
+            "$set": {"lastRow": last_row, "updatedAt": datetime.utcnow()},
+            "$inc": {"inserted": inserted}
+        },
+        upsert=True
+    )
+
+def event_export_row(event: dict) -> dict:
+    return {field: event.get(field) for field in EVENT_EXPORT_FIELDS}
+
+async def export_events(db: AsyncIOMotorDatabase, query: dict, fmt: str) -> AsyncIterator[bytes]:
+    """Stream events as CSV or NDJSON as they come off the cursor"""
+    projection = {field: 1 for field in EVENT_EXPORT_FIELDS}
+    cursor = db.events.find(query, projection).sort("date", 1).batch_size(CURSOR_BATCH_SIZE)
+    rows = (event_export_row(event) async for event in cursor)
+    async for chunk in format_rows(rows, EVENT_EXPORT_FIELDS, fmt):
+        yield chunk
+
+def access_log_export_row(log: dict) -> dict:
+    scanned_at = log.get("scannedAt") or log.get("accessedAt")
+    return {
+        "id": str(log["_id"]),
+        "scannedAt": scanned_at.isoformat() if scanned_at else None,
+        "userId": log.get("userId"),
+        "memberId": log.get("memberId"),
+        "accessType": log.get("accessType", "qr_scan"),
+        "valid": log.get("valid"),
+        "operatorId": log.get("scannedById") or log.get("verifiedById"),
+        "qrCode": log.get("qrCode"),
+        "error": log.get("error")
+    }
+
+async def export_access_logs(db: AsyncIOMotorDatabase, query: dict, fmt: str) -> AsyncIterator[bytes]:
+    """Stream access logs oldest first as CSV or NDJSON"""
+    cursor = db.access_logs.find(query).sort("scannedAt", 1).batch_size(CURSOR_BATCH_SIZE)
+    rows = (access_log_export_row(log) async for log in cursor)
+    async for chunk in format_rows(rows, ACCESS_LOG_EXPORT_FIELDS, fmt):
+        yield chunk
+
+async def format_rows(rows: AsyncIterator[dict], fields: List[str], fmt: str) -> AsyncIterator[bytes]:
+    """Encode rows as CSV (with a header) or NDJSON in chunks of about EXPORT_CHUNK_CHARS"""
+    buffer = io.StringIO()
+    if fmt == "ndjson":
+        def write(row: dict):
+            buffer.write(json.dumps(row, default=str))
+            buffer.write("\n")
+    else:
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        write = writer.writerow
+    
+    async for row in rows:
+        write(row)
+        if buffer.tell() >= EXPORT_CHUNK_CHARS:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip a byte stream incrementally"""
+    compressor = zlib.compressobj(wbits=31)  # 31 selects the gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+async def fill_lookup(collection, known: Dict[str, Optional[dict]], keys: Set[str], field: str, projection: dict):
+    """Resolve keys not seen before with one $in query, remembering misses too"""
+    missing = [key for key in keys if key and key not in known]
+    if not missing:
+        return
+    async for document in collection.find({field: {"$in": missing}}, projection):
+        known[document[field]] = document
+    for key in missing:
+        known.setdefault(key, None)
+
+class ResultLookups:
+    """Athletes and events resolved so far, shared by every file of one ingest"""
+
+    def __init__(self):
+        self.athletes: Dict[str, Optional[dict]] = {}  # memberId -> user
+        self.events: Dict[str, Optional[dict]] = {}  # eventId -> event
+        self.touched_events: Set[str] = set()
+
+async def ingest_results(
+    db: AsyncIOMotorDatabase,
+    rows: Iterable[Tuple[int, Union[dict, ValueError]]],
+    defaults: dict,
+    overrides: Optional[dict] = None,
+    lookups: Optional[ResultLookups] = None,
+    chunk_size: int = BULK_CHUNK_SIZE
+) -> ImportReport:
+    """Validate timing-system rows and write them as results in chunked bulk writes.
+    
+    Rows name athletes by member id; `defaults` supplies the event, discipline,
+    round and age group for files that do not carry them per row, and
+    `overrides` replaces what the rows say. Each member id and event is looked
+    up once per ingest, and the summary of every event touched is refreshed
+    once at the end. Files ingested together share one `lookups`; the caller
+    then summarizes `lookups.touched_events` after the last file instead.
+    """
+    report = ImportReport()
+    shared = lookups is not None
+    lookups = lookups or ResultLookups()
+    athletes, events = lookups.athletes, lookups.events
+    
+    for chunk in chunked(rows, chunk_size):
+        entries = []
+        for row_number, row in chunk:
+            report.processed += 1
+            if isinstance(row, ValueError):
+                report.add_error(row_number, str(row))
+                continue
+            entries.append((row_number, {**defaults, **row, **(overrides or {})}))
+        
+        member_ids = {str(entry.get("memberId", "")) for _, entry in entries}
+        await fill_lookup(
+            db.users, athletes, {member_id for member_id in member_ids if not is_mistyped_member_id(member_id)},
+            "memberId", {"name": 1, "memberId": 1}
+        )
+        await fill_lookup(
+            db.events, events, {str(entry.get("eventId", "")) for _, entry in entries},
+            "_id", {"startsAt": 1}
+        )
+        
+        results = []
+        for row_number, entry in entries:
+            member_id = str(entry.pop("memberId", ""))
+            if is_mistyped_member_id(member_id):
+                report.add_error(row_number, "Invalid memberId check digits")
+                continue
+            athlete = athletes.get(member_id)
+            event = events.get(str(entry.get("eventId", "")))
+            if athlete is None:
+                report.add_error(row_number, "Unknown memberId")
+                continue
+            if event is None:
+                report.add_error(row_number, "Unknown eventId")
+                continue
+            try:
+                results.append(build_result(ResultCreate(**{**entry, "userId": athlete["_id"]}), event, athlete))
+            except ValidationError as e:
+                report.add_error(row_number, validation_message(e))
+            except ValueError as e:
+                report.add_error(row_number, str(e))
+        
+        if results:
+            details = await save_results(db, results)
+            report.inserted += details.get("nUpserted", 0)
+            report.updated += details.get("nMatched", 0)
+            lookups.touched_events.update(result["eventId"] for result in results)
+    
+    if not shared:
+        await summarize_event_results(db, lookups.touched_events)
+    return report
@@ -0,0 +1,351 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import PyMongoError
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+from leader import WORKER_ID
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# memory: per-worker only; sqlite: shared by the workers on one host; redis: shared by all hosts
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_URL = os.environ.get("CACHE_URL", "")
+# How evictions reach the other workers' local copies: redis, mongo or none
+CACHE_INVALIDATION = os.environ.get(
+    "CACHE_INVALIDATION", "redis" if CACHE_BACKEND == "redis" else "mongo"
+)
+# Redis-protocol server carrying evictions; the cache's own server by default
+CACHE_INVALIDATION_URL = os.environ.get(
+    "CACHE_INVALIDATION_URL", CACHE_URL if CACHE_BACKEND == "redis" else ""
+)
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get("CACHE_LOCAL_MAX_ENTRIES", "10000"))
+# Upper bound on how long a worker trusts its local copy, in case an eviction is missed
+CACHE_LOCAL_TTL_SECONDS = float(os.environ.get("CACHE_LOCAL_TTL_SECONDS", "30"))
+
+INVALIDATION_CHANNEL = "cache-invalidation"
+INVALIDATION_RETRY_SECONDS = 30
+
+class MemoryCache:
+    """Bounded LRU of live objects with per-entry expiry"""
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def delete(self, keys: Iterable[str]):
+        for key in keys:
+            self.entries.pop(key, None)
+
+class SQLiteCache:
+    """Cache file shared by the workers on one host.
+    
+    WAL mode lets readers in every process proceed while one writes. Calls
+    run on a worker thread so the event loop never waits on the file lock.
+    """
+    
+    # Expired rows are purged on every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.lock = threading.Lock()
+        self.writes = 0
+
+    def run(self, sql: str, params: tuple = ()) -> list:
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        rows = await asyncio.to_thread(
+            self.run, "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        )
+        return rows[0][0] if rows else None
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await asyncio.to_thread(
+            self.run, "INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, value, time.time() + ttl)
+        )
+        self.writes += 1
+        if self.writes % self.PURGE_EVERY == 0:
+            await asyncio.to_thread(self.run, "DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    async def delete(self, keys: List[str]):
+        placeholders = ",".join("?" * len(keys))
+        await asyncio.to_thread(self.run, f"DELETE FROM cache WHERE key IN ({placeholders})", tuple(keys))
+
+    async def close(self):
+        self.connection.close()
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+class RespConnection:
+    """Minimal client for the Redis serialization protocol (RESP2).
+    
+    Enough for GET/SET/DEL/PUBLISH/SUBSCRIBE against Redis or anything that
+    speaks its protocol. Commands on one connection are sent one at a time.
+    """
+
+    def __init__(self, url: str):
+        parts = urlsplit(url or "redis://localhost:6379/0")
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.database = int(parts.path.strip("/") or 0)
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self.send("AUTH", self.password)
+        if self.database:
+            await self.send("SELECT", self.database)
+
+    async def execute(self, *args) -> Any:
+        async with self.lock:
+            try:
+                if self.writer is None:
+                    await self.connect()
+                return await self.send(*args)
+            except (OSError, asyncio.IncompleteReadError):
+                # Reconnect on the next command
+                self.close()
+                raise
+
+    async def send(self, *args) -> Any:
+        self.writer.write(self.encode(args))
+        await self.writer.drain()
+        return await self.read_reply()
+
+    @staticmethod
+    def encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def read_reply(self) -> Any:
+        line = (await self.reader.readuntil(b"\r\n"))[:-2]
+        kind, body = line[:1], line[1:]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RespError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            return (await self.reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise RespError(f"Unexpected reply {line[:20]!r}")
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+class RedisCache:
+    """Cache shared by every worker through a Redis-protocol server"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.connection = RespConnection(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.connection.execute("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.connection.execute("SET", key, value, "PX", max(int(ttl * 1000), 1))
+
+    async def delete(self, keys: List[str]):
+        await self.connection.execute("DEL", *keys)
+
+    async def close(self):
+        self.connection.close()
+
+def build_shared_backend(backend: str, url: str):
+    if backend == "memory":
+        return None
+    if backend == "sqlite":
+        return SQLiteCache(url or "cache.sqlite3")
+    if backend == "redis":
+        return RedisCache(url)
+    raise ValueError(f"Unknown CACHE_BACKEND {backend!r}")
+
+class Cache:
+    """Per-worker LRU in front of an optional shared backend.
+    
+    Values must be JSON-serializable; the local copies are shared objects
+    and must not be modified. `evict` removes a key everywhere: from this
+    worker, from the shared backend, and, through the invalidation channel,
+    from every other worker's local copy. Backend failures degrade to cache
+    misses rather than failing the request.
+    """
+
+    def __init__(
+        self,
+        shared=None,
+        invalidation: str = "none",
+        invalidation_url: str = CACHE_INVALIDATION_URL,
+        worker_id: str = WORKER_ID
+    ):
+        self.local = MemoryCache()
+        self.shared = shared
+        self.invalidation = invalidation
+        self.invalidation_url = invalidation_url
+        self.worker_id = worker_id
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.publisher: Optional[RespConnection] = None
+        self.listener: Optional[asyncio.Task] = None
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None or self.shared is None:
+            return value
+        try:
+            data = await self.shared.get(key)
+        except Exception:
+            logger.warning("Shared cache read of %s failed", key, exc_info=True)
+            return None
+        if data is None:
+            return None
+        value = orjson.loads(data)
+        self.local.set(key, value, CACHE_LOCAL_TTL_SECONDS)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self.local.set(key, value, min(ttl, CACHE_LOCAL_TTL_SECONDS))
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, orjson.dumps(value), ttl)
+            except Exception:
+                logger.warning("Shared cache write of %s failed", key, exc_info=True)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        value = await self.get(key)
+        if value is None:
+            value = await loader()
+            if value is not None:
+                await self.set(key, value, ttl)
+        return value
+
+    async def evict(self, *keys: str):
+        keys = [key for key in keys if key]
+        if not keys:
+            return
+        self.local.delete(keys)
+        if self.shared is not None:
+            try:
+                await self.shared.delete(keys)
+            except Exception:
+                logger.warning("Shared cache eviction of %s failed", keys, exc_info=True)
+        await self.publish_eviction(keys)
+
+    async def publish_eviction(self, keys: List[str]):
+        message = {"origin": self.worker_id, "keys": keys}
+        try:
+            if self.invalidation == "redis" and self.publisher is not None:
+                await self.publisher.execute("PUBLISH", INVALIDATION_CHANNEL, orjson.dumps(message))
+            elif self.invalidation == "mongo" and self.db is not None:
+                await self.db.cache_invalidations.insert_one({**message, "createdAt": datetime.utcnow()})
+        except Exception:
+            logger.warning("Could not broadcast eviction of %s", keys, exc_info=True)
+
+    def receive_eviction(self, message: Dict[str, Any]):
+        if message.get("origin") != self.worker_id:
+            self.local.delete(message.get("keys", []))
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Begin hearing other workers' evictions"""
+        self.db = db
+        if self.invalidation == "redis":
+            self.publisher = RespConnection(self.invalidation_url)
+            self.listener = asyncio.create_task(self.listen_redis())
+        elif self.invalidation == "mongo":
+            self.listener = asyncio.create_task(self.listen_mongo())
+
+    async def stop(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+            self.listener = None
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.shared is not None:
+            await self.shared.close()
+
+    async def listen_redis(self):
+        while True:
+            connection = RespConnection(self.invalidation_url)
+            try:
+                await connection.execute("SUBSCRIBE", INVALIDATION_CHANNEL)
+                while True:
+                    kind, _, payload = await connection.read_reply()
+                    if kind == b"message":
+                        self.receive_eviction(orjson.loads(payload))
+            except (OSError, asyncio.IncompleteReadError, RespError, ValueError):
+                logger.warning("Cache invalidation subscription lost; retrying", exc_info=True)
+            finally:
+                connection.close()
+            # Anything evicted while disconnected may be stale locally
+            self.local.entries.clear()
+            await asyncio.sleep(INVALIDATION_RETRY_SECONDS)
+
+    async def listen_mongo(self):
+        # Change streams need a replica set; without one, local copies fall back on their TTL
+        while True:
+            try:
+                async with self.db.cache_invalidations.watch(
+                    [{"$match": {"operationType": "insert"}}]
+                ) as stream:
+                    async for change in stream:
+                        self.receive_eviction(change["fullDocument"])
+            except (PyMongoError, NotImplementedError) as error:
+                logger.warning("Cache invalidation change stream unavailable: %s", error)
+            self.local.entries.clear()
+            await asyncio.sleep(INVALIDATION_RETRY_SECONDS)
+
+cache = Cache(build_shared_backend(CACHE_BACKEND, CACHE_URL), CACHE_INVALIDATION)
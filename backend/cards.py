@@ -0,0 +1,69 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Dict, Optional, Set, Tuple
+from utils import render_qr_code, create_qr_data, qr_executor
+from invalidation import invalidate_users
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Background renders are skipped once this many renders are queued;
+# those cards are rendered on first fetch instead
+CARD_BACKGROUND_QUEUE_LIMIT = int(os.environ.get("CARD_BACKGROUND_QUEUE_LIMIT", "8"))
+
+# Renders in progress in this process, keyed by user and card version
+rendering: Dict[Tuple[str, int], asyncio.Future] = {}
+background_renders: Set[asyncio.Task] = set()
+
+def card_is_current(user: dict) -> bool:
+    return bool(user.get("qrCode")) and user.get("qrCodeVersion") == user.get("cardVersion", 1)
+
+async def ensure_card(db: AsyncIOMotorDatabase, user: dict) -> Optional[str]:
+    """Return the member's QR card, rendering it if it is missing or stale.
+
+    Anything that changes what the card shows bumps `cardVersion`; the
+    stored image remembers which version it was rendered for. Concurrent
+    requests for the same version share one render.
+    """
+    if card_is_current(user):
+        return user["qrCode"]
+
+    key = (user["_id"], user.get("cardVersion", 1))
+    pending = rendering.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(render_card(db, user))
+        rendering[key] = pending
+        pending.add_done_callback(lambda _: rendering.pop(key, None))
+    return await asyncio.shield(pending)
+
+async def render_card(db: AsyncIOMotorDatabase, user: dict) -> str:
+    version = user.get("cardVersion", 1)
+    qr_code_image = await render_qr_code(
+        create_qr_data("member", user["_id"], user["membershipType"])
+    )
+
+    # Only store the image if no newer version was requested meanwhile
+    result = await db.users.update_one(
+        {"_id": user["_id"], "cardVersion": version},
+        {"$set": {"qrCode": qr_code_image, "qrCodeVersion": version}}
+    )
+    if result.modified_count:
+        # Cached profiles carry the card image
+        await invalidate_users([user["_id"]])
+    return qr_code_image
+
+def schedule_card_render(db: AsyncIOMotorDatabase, user: dict):
+    """Render a card after the response has gone out, unless the renderer is busy"""
+    if card_is_current(user) or qr_executor.pending >= CARD_BACKGROUND_QUEUE_LIMIT:
+        return
+
+    task = asyncio.create_task(render_in_background(db, user))
+    background_renders.add(task)
+    task.add_done_callback(background_renders.discard)
+
+async def render_in_background(db: AsyncIOMotorDatabase, user: dict):
+    try:
+        await ensure_card(db, user)
+    except Exception:
+        logger.exception("Background card render failed for user %s", user["_id"])
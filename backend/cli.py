@@ -0,0 +1,143 @@
+"""Administrative commands for bulk data work.
+
+Uses the same MONGO_URL and DB_NAME settings as the API server:
+
+    python cli.py import-events events.csv
+    python cli.py export-events --format csv --output events.csv
+    python cli.py import-members members.csv --job club-merger-2025
+    python cli.py ingest-results heat1.lif --event <event id> --discipline 100m
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / ".env")
+sys.path.insert(0, str(ROOT_DIR))
+
+import database
+from bulk import (
+    detect_format, iter_rows, import_events, export_events, import_members, ingest_results,
+    ResultLookups, MEMBER_CHUNK_SIZE
+)
+from results import summarize_event_results
+
+cli = typer.Typer(help="Athletics NT administrative commands")
+
+async def with_database(work):
+    await database.connect_to_mongo()
+    try:
+        return await work(database.db)
+    finally:
+        await database.close_mongo_connection()
+
+@cli.command("import-events")
+def import_events_command(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="CSV or NDJSON file"),
+    format: Optional[str] = typer.Option(None, help="csv or ndjson; guessed from the extension by default")
+):
+    """Create or update events keyed by externalId"""
+    async def work(db):
+        with path.open(encoding="utf-8-sig", newline="") as stream:
+            return await import_events(db, iter_rows(stream, detect_format(path.name, format)))
+    
+    report = asyncio.run(with_database(work))
+    typer.echo(json.dumps(report.dict(), indent=2))
+    if report.failed:
+        raise typer.Exit(code=1)
+
+@cli.command("export-events")
+def export_events_command(
+    format: str = typer.Option("ndjson", help="csv or ndjson"),
+    output: Optional[Path] = typer.Option(None, help="Write to this file instead of stdout")
+):
+    """Write every event as CSV or NDJSON"""
+    async def work(db):
+        target = output.open("wb") if output else sys.stdout.buffer
+        try:
+            async for chunk in export_events(db, {}, format):
+                target.write(chunk)
+        finally:
+            if output:
+                target.close()
+    
+    asyncio.run(with_database(work))
+
+@cli.command("import-members")
+def import_members_command(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="CSV or NDJSON file"),
+    job: Optional[str] = typer.Option(None, help="Checkpoint name; rerun with the same name to resume"),
+    workers: int = typer.Option(os.cpu_count() or 1, help="Processes used for password hashing"),
+    chunk_size: int = typer.Option(MEMBER_CHUNK_SIZE, help="Members per insert"),
+    format: Optional[str] = typer.Option(None, help="csv or ndjson; guessed from the extension by default")
+):
+    """Migrate members with either plain passwords or existing bcrypt hashes"""
+    async def work(db):
+        with path.open(encoding="utf-8-sig", newline="") as stream, \
+                ProcessPoolExecutor(max_workers=workers) as hash_pool:
+            return await import_members(
+                db, iter_rows(stream, detect_format(path.name, format)),
+                hash_pool, job or path.stem, chunk_size
+            )
+    
+    started = time.perf_counter()
+    report = asyncio.run(with_database(work))
+    elapsed = time.perf_counter() - started
+    summary = report.dict()
+    summary["perMinute"] = round(report.inserted / elapsed * 60) if elapsed else None
+    typer.echo(json.dumps(summary, indent=2))
+    if report.failed:
+        raise typer.Exit(code=1)
+
+@cli.command("ingest-results")
+def ingest_results_command(
+    paths: List[Path] = typer.Argument(..., exists=True, dir_okay=False, help="LIF, CSV or NDJSON result files"),
+    event: str = typer.Option(..., help="Event the results belong to"),
+    discipline: Optional[str] = typer.Option(None, help="For files that do not name it per row"),
+    round_name: Optional[str] = typer.Option(
+        None, "--round", help="Applies to every row; required for LIF files, which only number their rounds"
+    ),
+    age_group: str = typer.Option("Open"),
+    gender: Optional[str] = typer.Option(None),
+    format: Optional[str] = typer.Option(None, help="csv, ndjson or lif; guessed from the extension by default")
+):
+    """Load timing-system result files, matching athletes by memberId"""
+    formats = {path: detect_format(path.name, format) for path in paths}
+    if "lif" in formats.values() and not round_name:
+        raise typer.BadParameter("LIF files only number their rounds; pass --round, such as heats or final")
+    defaults = {"eventId": event, "discipline": discipline, "ageGroup": age_group, "gender": gender}
+    defaults = {key: value for key, value in defaults.items() if value is not None}
+    overrides = {"round": round_name} if round_name else None
+
+    async def work(db):
+        # Heat files of one meet name the same athletes and event, so they
+        # are looked up once and the event is summarized after the last file
+        lookups = ResultLookups()
+        reports = {}
+        for path in paths:
+            with path.open(encoding="utf-8-sig", newline="") as stream:
+                reports[path.name] = await ingest_results(
+                    db, iter_rows(stream, formats[path]), defaults, overrides, lookups
+                )
+        await summarize_event_results(db, lookups.touched_events)
+        return reports
+    
+    started = time.perf_counter()
+    reports = asyncio.run(with_database(work))
+    typer.echo(json.dumps({
+        "files": {name: report.dict() for name, report in reports.items()},
+        "seconds": round(time.perf_counter() - started, 2)
+    }, indent=2))
+    if any(report.failed for report in reports.values()):
+        raise typer.Exit(code=1)
+
+if __name__ == "__main__":
+    cli()
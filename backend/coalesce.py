@@ -0,0 +1,47 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from metrics import coalesced_requests
+import asyncio
+import os
+
+# How long a finished result keeps answering identical requests. Short enough
+# that readers never notice, long enough to absorb a burst after an announcement.
+COALESCE_TTL_SECONDS = float(os.environ.get("COALESCE_TTL_SECONDS", "0.25"))
+
+def request_key(route: str, **params) -> tuple:
+    """Key identical requests alike regardless of parameter order or omitted defaults"""
+    return (route,) + tuple(sorted((name, value) for name, value in params.items() if value is not None))
+
+class SingleFlight:
+    """Lets concurrent identical requests share one database call.
+    
+    The first caller for a key starts the call; everyone arriving while it
+    runs, or within `ttl` seconds of it finishing, gets the same result.
+    Failures are not kept, so the next caller retries. Results are shared
+    objects and must not be modified by callers.
+    """
+
+    def __init__(self, name: str, ttl: float = COALESCE_TTL_SECONDS):
+        self.name = name
+        self.ttl = ttl
+        self.calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        pending = self.calls.get(key)
+        if pending is not None:
+            coalesced_requests.inc(self.name, "recent" if pending.done() else "in_flight")
+        else:
+            pending = asyncio.ensure_future(fn())
+            self.calls[key] = pending
+            pending.add_done_callback(lambda done: self.finished(key, done))
+        # Shielded so one caller disconnecting does not cancel the others
+        return await asyncio.shield(pending)
+
+    def finished(self, key: Hashable, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None or self.ttl <= 0:
+            self.forget(key, future)
+        else:
+            asyncio.get_running_loop().call_later(self.ttl, self.forget, key, future)
+
+    def forget(self, key: Hashable, future: Optional[asyncio.Future] = None):
+        if self.calls.get(key) is future:
+            del self.calls[key]
@@ -1,7 +1,18 @@
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import DeleteOne, IndexModel, UpdateOne
 from typing import Optional
+from datetime import datetime, timedelta
+import asyncio
+import logging
 import os
+import time
 from models import MembershipPlan, FeaturedMember
+from profiling import DBCommandListener
+from metrics import MongoMetricsListener, MongoPoolMetricsListener
+from leader import run_once
+from member_ids import repair_duplicate_member_ids
+from member_stats import recount_members
+from utils import event_schedule_fields
 
 class Database:
     client: Optional[AsyncIOMotorClient] = None
@@ -9,132 +20,322 @@ class Database:
 
 database = Database()
 
+logger = logging.getLogger(__name__)
+
+# Bump whenever INDEXES, default data or backfills change so that workers
+# re-run startup work once; otherwise startup is a single read
+SCHEMA_VERSION = 13
+
+INDEXES = {
+    "users": [
+        IndexModel("email", unique=True),
+        IndexModel("memberId", unique=True),
+        IndexModel([("updatedAt", 1), ("_id", 1)]),
+        # Member directory: equality filters first, then the sort/range key
+        IndexModel([("joinDate", -1), ("_id", -1)]),
+        IndexModel([("membershipType", 1), ("joinDate", -1), ("_id", -1)]),
+        IndexModel([("membershipStatus", 1), ("joinDate", -1), ("_id", -1)]),
+        IndexModel([("membershipType", 1), ("membershipStatus", 1), ("joinDate", -1), ("_id", -1)]),
+        IndexModel([("nameLower", 1), ("_id", 1)]),
+        # Expiry sweeper: active members whose period has ended
+        IndexModel([("membershipStatus", 1), ("membershipExpiresAt", 1)]),
+    ],
+    "events": [
+        IndexModel("date"),
+        IndexModel("status"),
+        IndexModel("type"),
+        IndexModel("nameLower"),
+        IndexModel("nextTransitionAt"),
+        IndexModel(
+            "externalId", unique=True,
+            partialFilterExpression={"externalId": {"$type": "string"}}
+        ),
+        IndexModel(
+            [("name", "text"), ("location", "text"), ("description", "text")],
+            weights={"name": 10, "location": 5, "description": 1},
+            name="events_text"
+        ),
+    ],
+    "community_posts": [
+        IndexModel("createdAt"),
+        IndexModel("authorId"),
+        IndexModel(
+            [("title", "text"), ("content", "text")],
+            weights={"title": 10, "content": 2},
+            name="community_posts_text"
+        ),
+    ],
+    "membership_plans": [
+        IndexModel("planId", unique=True),
+    ],
+    "event_registrations": [
+        IndexModel([("userId", 1), ("eventId", 1)]),
+    ],
+    "access_logs": [
+        IndexModel("scannedAt"),
+        IndexModel([("userId", 1), ("scannedAt", 1)]),
+    ],
+    "results": [
+        IndexModel([("eventId", 1), ("discipline", 1), ("round", 1), ("userId", 1)], unique=True),
+        IndexModel([("eventId", 1), ("discipline", 1), ("round", 1), ("heat", 1), ("placing", 1)]),
+        # Recomputing one athlete's bests after a correction
+        IndexModel([("userId", 1), ("discipline", 1), ("sortKey", 1)]),
+    ],
+    "personal_bests": [
+        # One per leaderboard filter combination, each ending in the sort key
+        IndexModel([("discipline", 1), ("scope", 1), ("rankingGroup", 1), ("sortKey", 1)]),
+        IndexModel([("discipline", 1), ("scope", 1), ("gender", 1), ("rankingGroup", 1), ("sortKey", 1)]),
+        IndexModel([("userId", 1), ("discipline", 1)]),
+    ],
+    "refresh_tokens": [
+        IndexModel("expiresAt", expireAfterSeconds=0),
+        IndexModel("family"),
+    ],
+    "cache_invalidations": [
+        # Evictions only matter to workers listening at the time
+        IndexModel("createdAt", expireAfterSeconds=300),
+    ],
+}
+
+# Shared by every Motor client in the process
+mongo_event_listeners = [DBCommandListener(), MongoMetricsListener(), MongoPoolMetricsListener()]
+
 async def get_database() -> AsyncIOMotorDatabase:
     return database.db
 
 async def connect_to_mongo():
     """Create database connection"""
     mongo_url = os.environ.get("MONGO_URL")
-    database.client = AsyncIOMotorClient(mongo_url)
+    database.client = AsyncIOMotorClient(mongo_url, event_listeners=mongo_event_listeners)
     database.db = database.client[os.environ.get("DB_NAME", "athletics_nt")]
     
-    # Create indexes
-    await create_indexes()
-    
-    # Initialize default data
-    await initialize_default_data()
+    await ensure_schema()
 
 async def close_mongo_connection():
     """Close database connection"""
     if database.client:
         database.client.close()
 
+async def schema_is_current() -> bool:
+    schema = await database.db.meta.find_one({"_id": "schema"})
+    return bool(schema) and schema.get("version", 0) >= SCHEMA_VERSION
+
+async def ensure_schema():
+    """Create indexes and default data unless this schema version is already in place"""
+    started = time.perf_counter()
+    
+    # One worker applies the schema while the others wait for it to finish
+    await run_once(database.db, "schema", apply_schema, schema_is_current)
+    
+    logger.info(
+        "Database schema v%d ready in %.1f ms",
+        SCHEMA_VERSION, (time.perf_counter() - started) * 1000
+    )
+
+async def apply_schema():
+    """Create indexes, seed default data and record the schema version"""
+    # Duplicates would stop the unique memberId index from building
+    await repair_duplicate_member_ids(database.db)
+    
+    # Unique indexes must exist before seeding so the upserts stay unique
+    await create_indexes()
+    await asyncio.gather(initialize_default_data(), backfill_derived_fields())
+    await recount_members(database.db)
+    
+    await database.db.meta.update_one(
+        {"_id": "schema"},
+        {"$set": {"version": SCHEMA_VERSION, "updatedAt": datetime.utcnow()}},
+        upsert=True
+    )
+    logger.info("Applied database schema v%d", SCHEMA_VERSION)
+
 async def create_indexes():
     """Create database indexes for better performance"""
     db = database.db
     
-    # User indexes
-    await db.users.create_index("email", unique=True)
-    await db.users.create_index("memberId", unique=True)
+    # One createIndexes command per collection, all collections concurrently
+    await asyncio.gather(*(
+        db[collection].create_indexes(indexes)
+        for collection, indexes in INDEXES.items()
+    ))
+
+async def backfill_derived_fields():
+    """Populate derived fields on documents created before they existed"""
+    db = database.db
     
-    # Event indexes
-    await db.events.create_index("date")
-    await db.events.create_index("status")
-    await db.events.create_index("type")
+    await db.events.update_many(
+        {"nameLower": {"$exists": False}},
+        [{"$set": {"nameLower": {"$toLower": "$name"}}}]
+    )
+    await db.events.update_many(
+        {"registrationCount": {"$exists": False}},
+        [{"$set": {"registrationCount": {"$size": {"$ifNull": ["$registrations", []]}}}}]
+    )
+    await db.community_posts.update_many(
+        {"likeCount": {"$exists": False}},
+        [{"$set": {
+            "likeCount": {"$size": {"$ifNull": ["$likes", []]}},
+            "commentCount": {"$size": {"$ifNull": ["$comments", []]}}
+        }}]
+    )
+    await backfill_event_schedules()
+    await backfill_event_registrations()
+    await db.users.update_many(
+        {"nameLower": {"$exists": False}},
+        [{"$set": {"nameLower": {"$toLower": "$name"}}}]
+    )
+    await db.users.update_many(
+        {"cardVersion": {"$exists": False}},
+        {"$set": {"cardVersion": 1}}
+    )
+    await db.access_logs.update_many(
+        {"scannedAt": {"$exists": False}, "accessedAt": {"$exists": True}},
+        [{"$set": {"scannedAt": "$accessedAt"}}]
+    )
+
+async def backfill_event_schedules():
+    """Parse start and end times for events created before they were stored"""
+    db = database.db
+    updates = []
+    async for event in db.events.find({"startsAt": {"$exists": False}}, {"date": 1, "time": 1, "status": 1}):
+        fields = event_schedule_fields(event.get("date", ""), event.get("time", ""))
+        if event.get("status") not in ("upcoming", "ongoing"):
+            fields["nextTransitionAt"] = None
+        updates.append(UpdateOne({"_id": event["_id"]}, {"$set": fields}))
+    if updates:
+        await db.events.bulk_write(updates, ordered=False)
+
+REGISTRATION_SETTLE_TIME = timedelta(minutes=1)
+
+async def backfill_event_registrations():
+    """Reconcile the per-user lookup collection with the embedded event registrations.
     
-    # Community post indexes
-    await db.community_posts.create_index("createdAt")
-    await db.community_posts.create_index("authorId")
+    Seats without a lookup record get one, and records left behind by a seat
+    that is gone (an unregistration interrupted between the two writes) are
+    removed.
+    """
+    db = database.db
+    # Registrations in flight write their record just before taking the seat,
+    # so only records older than any request still running can be stale
+    settled_before = datetime.utcnow() - REGISTRATION_SETTLE_TIME
+    upserts = []
+    seated = set()
+    async for event in db.events.find({"registrationCount": {"$gt": 0}}, {"registrations": 1}):
+        for registration in event.get("registrations", []):
+            seated.add(f"{event['_id']}:{registration['userId']}")
+            upserts.append(UpdateOne(
+                {"_id": f"{event['_id']}:{registration['userId']}"},
+                {"$setOnInsert": {
+                    "eventId": event["_id"],
+                    "userId": registration["userId"],
+                    "registeredAt": registration.get("registrationDate")
+                }},
+                upsert=True
+            ))
+    if upserts:
+        await db.event_registrations.bulk_write(upserts, ordered=False)
     
-    # Membership plan indexes
-    await db.membership_plans.create_index("planId", unique=True)
+    stale = [
+        DeleteOne({"_id": record["_id"]})
+        async for record in db.event_registrations.find({"registeredAt": {"$lt": settled_before}}, {"_id": 1})
+        if record["_id"] not in seated
+    ]
+    if stale:
+        await db.event_registrations.bulk_write(stale, ordered=False)
 
 async def initialize_default_data():
     """Initialize default membership plans and featured members"""
     db = database.db
     
-    # Check if membership plans exist
-    plans_count = await db.membership_plans.count_documents({})
+    # Default membership plans
+    default_plans = [
+        MembershipPlan(
+            planId="basic",
+            name="Basic Membership",
+            price=50.0,
+            duration="Annual",
+            features=[
+                "Access to regular training sessions",
+                "Basic event participation",
+                "Monthly newsletter",
+                "Community forum access"
+            ],
+            popular=False
+        ),
+        MembershipPlan(
+            planId="premium",
+            name="Premium Membership",
+            price=120.0,
+            duration="Annual",
+            features=[
+                "All Basic features",
+                "Priority event registration",
+                "Free coaching sessions (2/month)",
+                "Equipment discounts",
+                "Exclusive member events",
+                "Digital reward card"
+            ],
+            popular=True
+        ),
+        MembershipPlan(
+            planId="elite",
+            name="Elite Membership",
+            price=200.0,
+            duration="Annual",
+            features=[
+                "All Premium features",
+                "Personal coaching sessions",
+                "Competition entry fees included",
+                "Advanced performance analytics",
+                "VIP event access",
+                "Custom training programs"
+            ],
+            popular=False
+        )
+    ]
     
-    if plans_count == 0:
-        # Create default membership plans
-        default_plans = [
-            MembershipPlan(
-                planId="basic",
-                name="Basic Membership",
-                price=50.0,
-                duration="Annual",
-                features=[
-                    "Access to regular training sessions",
-                    "Basic event participation",
-                    "Monthly newsletter",
-                    "Community forum access"
-                ],
-                popular=False
-            ),
-            MembershipPlan(
-                planId="premium",
-                name="Premium Membership",
-                price=120.0,
-                duration="Annual",
-                features=[
-                    "All Basic features",
-                    "Priority event registration",
-                    "Free coaching sessions (2/month)",
-                    "Equipment discounts",
-                    "Exclusive member events",
-                    "Digital reward card"
-                ],
-                popular=True
-            ),
-            MembershipPlan(
-                planId="elite",
-                name="Elite Membership",
-                price=200.0,
-                duration="Annual",
-                features=[
-                    "All Premium features",
-                    "Personal coaching sessions",
-                    "Competition entry fees included",
-                    "Advanced performance analytics",
-                    "VIP event access",
-                    "Custom training programs"
-                ],
-                popular=False
-            )
-        ]
-        
-        for plan in default_plans:
-            await db.membership_plans.insert_one(plan.dict(by_alias=True))
-    
-    # Check if featured members exist
-    members_count = await db.featured_members.count_documents({})
+    # Default featured members
+    default_members = [
+        FeaturedMember(
+            name="Alex Chen",
+            role="Sprint Coach",
+            speciality="100m & 200m",
+            experience="8 years",
+            avatar="https://images.unsplash.com/photo-1507003211169-0a1dd7228f2d?w=150&h=150&fit=crop&crop=face"
+        ),
+        FeaturedMember(
+            name="Maria Rodriguez",
+            role="Distance Runner",
+            speciality="Marathon",
+            experience="12 years",
+            avatar="https://images.unsplash.com/photo-1438761681033-6461ffad8d80?w=150&h=150&fit=crop&crop=face"
+        ),
+        FeaturedMember(
+            name="David Park",
+            role="Field Events Specialist",
+            speciality="Javelin & Shot Put",
+            experience="15 years",
+            avatar="https://images.unsplash.com/photo-1472099645785-5658abf4ff4e?w=150&h=150&fit=crop&crop=face"
+        )
+    ]
     
-    if members_count == 0:
-        # Create default featured members
-        default_members = [
-            FeaturedMember(
-                name="Alex Chen",
-                role="Sprint Coach",
-                speciality="100m & 200m",
-                experience="8 years",
-                avatar="https://images.unsplash.com/photo-1507003211169-0a1dd7228f2d?w=150&h=150&fit=crop&crop=face"
-            ),
-            FeaturedMember(
-                name="Maria Rodriguez",
-                role="Distance Runner",
-                speciality="Marathon",
-                experience="12 years",
-                avatar="https://images.unsplash.com/photo-1438761681033-6461ffad8d80?w=150&h=150&fit=crop&crop=face"
-            ),
-            FeaturedMember(
-                name="David Park",
-                role="Field Events Specialist",
-                speciality="Javelin & Shot Put",
-                experience="15 years",
-                avatar="https://images.unsplash.com/photo-1472099645785-5658abf4ff4e?w=150&h=150&fit=crop&crop=face"
+    # Upserts only insert what is missing, so re-running never overwrites
+    # edits and concurrent workers converge on the same documents
+    await asyncio.gather(
+        db.membership_plans.bulk_write([
+            UpdateOne(
+                {"planId": plan.planId},
+                {"$setOnInsert": plan.dict(by_alias=True)},
+                upsert=True
+            )
+            for plan in default_plans
+        ]),
+        db.featured_members.bulk_write([
+            UpdateOne(
+                {"name": member.name},
+                {"$setOnInsert": member.dict(by_alias=True)},
+                upsert=True
             )
-        ]
-        
-        for member in default_members:
-            await db.featured_members.insert_one(member.dict(by_alias=True))
\ No newline at end of file
+            for member in default_members
+        ])
+    )
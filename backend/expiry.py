@@ -0,0 +1,57 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+from leader import scheduler
+from member_stats import record_status_change
+from invalidation import invalidate_users
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_SWEEP_SECONDS = float(os.environ.get("EXPIRY_SWEEP_SECONDS", "300"))
+EXPIRY_BATCH_SIZE = 1000
+
+@scheduler.periodic("membership-expiry", interval=EXPIRY_SWEEP_SECONDS)
+async def expire_lapsed_memberships(db: AsyncIOMotorDatabase) -> float:
+    """Move active members past their expiry date to expired, a batch at a time.
+    
+    Returns the delay until the next membership lapses, capped at the
+    regular sweep interval, so expiries are applied close to on time.
+    """
+    now = datetime.utcnow()
+    lapsed = {"membershipStatus": "active", "membershipExpiresAt": {"$lte": now}}
+    expired = 0
+    
+    while True:
+        batch = await db.users.find(lapsed, {"_id": 1}).sort(
+            "membershipExpiresAt", 1
+        ).limit(EXPIRY_BATCH_SIZE).to_list(length=EXPIRY_BATCH_SIZE)
+        if not batch:
+            break
+        
+        # Re-check the condition so members renewed meanwhile are left alone
+        user_ids = [user["_id"] for user in batch]
+        result = await db.users.update_many(
+            {"_id": {"$in": user_ids}, **lapsed},
+            {"$set": {"membershipStatus": "expired"}, "$currentDate": {"updatedAt": True}}
+        )
+        if result.modified_count:
+            await record_status_change(db, "active", "expired", result.modified_count)
+        await invalidate_users(user_ids)
+        expired += result.modified_count
+        
+        if len(batch) < EXPIRY_BATCH_SIZE:
+            break
+    
+    if expired:
+        logger.info("Expired %d lapsed memberships", expired)
+    
+    upcoming = await db.users.find_one(
+        {"membershipStatus": "active", "membershipExpiresAt": {"$gt": now}},
+        {"membershipExpiresAt": 1},
+        sort=[("membershipExpiresAt", 1)]
+    )
+    if upcoming:
+        until_next = (upcoming["membershipExpiresAt"] - now).total_seconds()
+        return min(EXPIRY_SWEEP_SECONDS, until_next + 1)
+    return EXPIRY_SWEEP_SECONDS
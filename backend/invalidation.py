@@ -0,0 +1,25 @@
+from typing import Awaitable, Callable, Iterable, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+UserInvalidationHandler = Callable[[List[str]], Awaitable[None]]
+
+# Caches holding per-user data register here to hear about bulk changes
+user_invalidation_handlers: List[UserInvalidationHandler] = []
+
+def on_user_invalidation(handler: UserInvalidationHandler) -> UserInvalidationHandler:
+    """Register a handler for changed user ids; usable as a decorator"""
+    user_invalidation_handlers.append(handler)
+    return handler
+
+async def invalidate_users(user_ids: Iterable[str]):
+    """Tell every registered cache that these users changed"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    for handler in user_invalidation_handlers:
+        try:
+            await handler(user_ids)
+        except Exception:
+            logger.exception("User invalidation handler %r failed", handler)
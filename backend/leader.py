@@ -0,0 +1,204 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Identifies this worker process in lock documents
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class Lease:
+    """A time-limited lock held in the `locks` collection.
+    
+    The lease can be taken over once it expires, so a crashed holder never
+    blocks the others for longer than `lease_seconds`. Leases rely on worker
+    clocks agreeing to within a small fraction of the lease length.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, name: str, lease_seconds: float = 30):
+        self.db = db
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.held_until = 0.0  # monotonic deadline of the lease we last secured
+
+    @property
+    def held(self) -> bool:
+        return time.monotonic() < self.held_until
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; returns False while another worker holds it"""
+        now = datetime.utcnow()
+        requested = time.monotonic()
+        try:
+            await self.db.locks.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [{"owner": WORKER_ID}, {"expiresAt": {"$lt": now}}]
+                },
+                {"$set": {
+                    "owner": WORKER_ID,
+                    "expiresAt": now + timedelta(seconds=self.lease_seconds),
+                    "renewedAt": now
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The lock exists and is live, so the upsert collided with it
+            self.held_until = 0.0
+            return False
+        self.held_until = requested + self.lease_seconds
+        return True
+
+    async def release(self):
+        self.held_until = 0.0
+        await self.db.locks.delete_one({"_id": self.name, "owner": WORKER_ID})
+
+    async def keep_alive(self):
+        """Renew the lease until cancelled"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await self.acquire()
+
+async def run_once(
+    db: AsyncIOMotorDatabase,
+    name: str,
+    work: Callable[[], Awaitable[None]],
+    is_done: Callable[[], Awaitable[bool]],
+    lease_seconds: float = 60,
+    poll_seconds: float = 0.5
+):
+    """Run work in exactly one worker; the others wait until is_done() holds"""
+    lease = Lease(db, name, lease_seconds)
+    while not await is_done():
+        if await lease.acquire():
+            heartbeat = asyncio.create_task(lease.keep_alive())
+            try:
+                # Another worker may have finished between the check and the acquire
+                if not await is_done():
+                    await work()
+            finally:
+                heartbeat.cancel()
+                await lease.release()
+            return
+        await asyncio.sleep(poll_seconds)
+
+JobFunction = Callable[[AsyncIOMotorDatabase], Awaitable[Optional[float]]]
+
+class Job:
+    def __init__(self, name: str, fn: JobFunction, interval: float):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+class Scheduler:
+    """Runs registered periodic jobs in the one worker that holds the leader lease.
+    
+    A job is an async function taking the database. It runs every `interval`
+    seconds, or after the number of seconds it returns, or as soon as
+    `wake(name)` is called in the leader process.
+    """
+
+    def __init__(self, name: str = "scheduler", lease_seconds: float = 30):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.jobs: Dict[str, Job] = {}
+        self.lease: Optional[Lease] = None
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.election_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lease is not None and self.lease.held
+
+    def periodic(self, name: str, interval: float):
+        """Register a job; usable as a decorator"""
+        def register(fn: JobFunction) -> JobFunction:
+            self.jobs[name] = Job(name, fn, interval)
+            return fn
+        return register
+
+    def wake(self, name: str):
+        """Run a job early if this worker is the leader"""
+        job = self.jobs.get(name)
+        if job:
+            job.wakeup.set()
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.lease = Lease(db, self.name, self.lease_seconds)
+        self.election_task = asyncio.create_task(self.run_election())
+
+    async def stop(self):
+        if self.election_task:
+            self.election_task.cancel()
+            try:
+                await self.election_task
+            except asyncio.CancelledError:
+                pass
+        self.stop_jobs()
+        if self.lease and self.lease.held:
+            await self.lease.release()
+
+    async def run_election(self):
+        """Heartbeat the leader lease, starting and stopping jobs as leadership changes"""
+        while True:
+            try:
+                await self.lease.acquire()
+            except PyMongoError:
+                logger.exception("Leader lease renewal failed")
+            
+            # Stay leader only while the last successful renewal is still valid
+            if self.lease.held:
+                if not self.jobs_running:
+                    logger.info("Worker %s became %s leader", WORKER_ID, self.name)
+                    self.start_jobs()
+            elif self.jobs_running:
+                logger.info("Worker %s lost %s leadership", WORKER_ID, self.name)
+                self.stop_jobs()
+            
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    @property
+    def jobs_running(self) -> bool:
+        return any(job.task for job in self.jobs.values())
+
+    def start_jobs(self):
+        for job in self.jobs.values():
+            job.task = asyncio.create_task(self.run_job(job))
+
+    def stop_jobs(self):
+        for job in self.jobs.values():
+            if job.task:
+                job.task.cancel()
+                job.task = None
+
+    async def run_job(self, job: Job):
+        while True:
+            delay = job.interval
+            job.wakeup.clear()
+            try:
+                result = await job.fn(self.db)
+                if result is not None:
+                    delay = max(0.0, float(result))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduled job %s failed", job.name)
+            
+            try:
+                await asyncio.wait_for(job.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+scheduler = Scheduler()
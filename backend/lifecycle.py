@@ -0,0 +1,62 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+from leader import scheduler
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+EVENT_LIFECYCLE_JOB = "event-lifecycle"
+
+# Longest sleep between runs. Events created on another worker only wake the
+# leader through this, so it bounds how late a transition can be applied.
+EVENT_LIFECYCLE_MAX_SLEEP = float(os.environ.get("EVENT_LIFECYCLE_MAX_SLEEP", "900"))
+
+def lifecycle_update(now: datetime) -> list:
+    """Pipeline update deriving status and the next due time from the event times"""
+    return [
+        {"$set": {"status": {"$switch": {
+            "branches": [
+                {"case": {"$not": [{"$in": ["$status", ["upcoming", "ongoing"]]}]}, "then": "$status"},
+                {"case": {"$lte": ["$endsAt", now]}, "then": "completed"},
+                {"case": {"$lte": ["$startsAt", now]}, "then": "ongoing"},
+            ],
+            "default": "$status"
+        }}}},
+        {"$set": {
+            "nextTransitionAt": {"$switch": {
+                "branches": [
+                    {"case": {"$eq": ["$status", "upcoming"]}, "then": "$startsAt"},
+                    {"case": {"$eq": ["$status", "ongoing"]}, "then": "$endsAt"},
+                ],
+                "default": None
+            }},
+            "updatedAt": now
+        }}
+    ]
+
+@scheduler.periodic(EVENT_LIFECYCLE_JOB, interval=EVENT_LIFECYCLE_MAX_SLEEP)
+async def advance_event_lifecycle(db: AsyncIOMotorDatabase) -> float:
+    """Move every due event to the status its start and end times imply.
+    
+    Runs only on the scheduler leader and sleeps until the next due
+    transition. Each event's status is recomputed from its own times, so
+    applying an update twice is harmless.
+    """
+    now = datetime.utcnow()
+    result = await db.events.update_many(
+        {"nextTransitionAt": {"$lte": now}},
+        lifecycle_update(now)
+    )
+    if result.modified_count:
+        logger.info("Advanced the lifecycle of %d events", result.modified_count)
+    
+    upcoming = await db.events.find_one(
+        {"nextTransitionAt": {"$type": "date"}},
+        {"nextTransitionAt": 1},
+        sort=[("nextTransitionAt", 1)]
+    )
+    if upcoming:
+        until_next = (upcoming["nextTransitionAt"] - datetime.utcnow()).total_seconds()
+        return min(EVENT_LIFECYCLE_MAX_SLEEP, max(until_next, 0) + 0.5)
+    return EVENT_LIFECYCLE_MAX_SLEEP
@@ -0,0 +1,104 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from datetime import datetime
+from typing import Iterator, List
+from invalidation import invalidate_users
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MEMBER_ID_SEQUENCE = "memberId"
+
+# Ids each worker reserves per round trip; unused ids are skipped on restart
+MEMBER_ID_BLOCK_SIZE = int(os.environ.get("MEMBER_ID_BLOCK_SIZE", "100"))
+
+async def reserve_sequence_block(db: AsyncIOMotorDatabase, name: str, count: int) -> range:
+    """Atomically reserve `count` consecutive numbers from a named counter"""
+    counter = await db.counters.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"value": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    end = counter["value"] + 1
+    return range(end - count, end)
+
+def member_id_check_digits(body: str) -> str:
+    """ISO 7064 MOD 97-10 check digits, as used by IBANs.
+
+    They catch every single-digit typo and every swap of adjacent digits.
+    """
+    return f"{98 - int(body) * 100 % 97:02d}"
+
+def format_member_id(number: int, year: int) -> str:
+    """Year, zero-padded sequence number and two check digits, e.g. 202500004217"""
+    body = f"{year}{number:06d}"
+    return body + member_id_check_digits(body)
+
+def is_valid_member_id(member_id: str) -> bool:
+    """Whether an id in the current format has correct check digits"""
+    return member_id.isdigit() and len(member_id) >= 12 and int(member_id) % 97 == 1
+
+def is_mistyped_member_id(member_id: str) -> bool:
+    """Whether an id is as long as a current one but fails its check digits.
+
+    Ids issued before the current format are shorter and have no check
+    digits, so they are never reported as mistyped.
+    """
+    return member_id.isdigit() and len(member_id) >= 12 and not is_valid_member_id(member_id)
+
+class MemberIdAllocator:
+    """Hands out member ids from blocks reserved on the shared sequence.
+
+    Blocks come from an atomic $inc, so ids never collide across workers and
+    most allocations are served from memory without touching the database.
+    """
+
+    def __init__(self, block_size: int = MEMBER_ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self.block: Iterator[int] = iter(())
+        self.lock = asyncio.Lock()
+
+    async def next_id(self, db: AsyncIOMotorDatabase) -> str:
+        async with self.lock:
+            number = next(self.block, None)
+            if number is None:
+                self.block = iter(await reserve_sequence_block(db, MEMBER_ID_SEQUENCE, self.block_size))
+                number = next(self.block)
+        return format_member_id(number, datetime.utcnow().year)
+
+member_id_allocator = MemberIdAllocator()
+
+async def allocate_member_ids(db: AsyncIOMotorDatabase, count: int) -> Iterator[str]:
+    """Reserve a dedicated block for a bulk insert with a single round trip"""
+    year = datetime.utcnow().year
+    block = await reserve_sequence_block(db, MEMBER_ID_SEQUENCE, count)
+    return (format_member_id(number, year) for number in block)
+
+async def repair_duplicate_member_ids(db: AsyncIOMotorDatabase) -> int:
+    """Give fresh ids to every member sharing a memberId except the earliest joiner.
+
+    Must run before the unique memberId index is built, which fails while
+    duplicates exist. Returns the number of members that were renumbered.
+    """
+    duplicates = db.users.aggregate([
+        {"$sort": {"joinDate": 1, "_id": 1}},
+        {"$group": {"_id": "$memberId", "userIds": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    renumber: List[str] = []
+    async for group in duplicates:
+        renumber.extend(group["userIds"][1:])
+    if not renumber:
+        return 0
+
+    new_ids = await allocate_member_ids(db, len(renumber))
+    await db.users.bulk_write([
+        UpdateOne({"_id": user_id}, {"$set": {"memberId": member_id}, "$currentDate": {"updatedAt": True}})
+        for user_id, member_id in zip(renumber, new_ids)
+    ], ordered=False)
+    await invalidate_users(renumber)
+    logger.warning("Renumbered %d members with duplicate member ids", len(renumber))
+    return len(renumber)
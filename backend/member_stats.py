@@ -0,0 +1,74 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from leader import scheduler
+from collections import Counter
+
+# Member totals by type and status, kept in one document so counts are a
+# single primary-key read instead of a collection scan
+MEMBER_STATS_ID = "members"
+
+def member_count_keys(user: dict) -> list:
+    # Documents built from models hold enums rather than their string values
+    membership_type = getattr(user["membershipType"], "value", user["membershipType"])
+    membership_status = getattr(user["membershipStatus"], "value", user["membershipStatus"])
+    return ["total", f"byType.{membership_type}", f"byStatus.{membership_status}"]
+
+async def apply_member_count_changes(db: AsyncIOMotorDatabase, changes: Dict[str, int]):
+    changes = {key: amount for key, amount in changes.items() if amount}
+    if changes:
+        await db.stats.update_one(
+            {"_id": MEMBER_STATS_ID},
+            {"$inc": changes, "$set": {"updatedAt": datetime.utcnow()}},
+            upsert=True
+        )
+
+async def record_members_added(db: AsyncIOMotorDatabase, users: Iterable[dict]):
+    """Count newly inserted members"""
+    changes = Counter()
+    for user in users:
+        changes.update(member_count_keys(user))
+    await apply_member_count_changes(db, changes)
+
+async def record_member_change(db: AsyncIOMotorDatabase, before: dict, after: dict):
+    """Move one member between type and status buckets"""
+    changes = Counter(member_count_keys(after))
+    changes.subtract(member_count_keys(before))
+    await apply_member_count_changes(db, changes)
+
+async def record_status_change(db: AsyncIOMotorDatabase, old_status: str, new_status: str, count: int):
+    """Move `count` members between status buckets after a bulk update"""
+    await apply_member_count_changes(db, {
+        f"byStatus.{old_status}": -count,
+        f"byStatus.{new_status}": count
+    })
+
+async def get_member_counts(db: AsyncIOMotorDatabase) -> Optional[dict]:
+    return await db.stats.find_one({"_id": MEMBER_STATS_ID})
+
+@scheduler.periodic("member-stats-recount", interval=3600)
+async def recount_members(db: AsyncIOMotorDatabase):
+    """Rebuild the counters from the users collection to repair any drift"""
+    groups = await db.users.aggregate([
+        {"$group": {
+            "_id": {"type": "$membershipType", "status": "$membershipStatus"},
+            "count": {"$sum": 1}
+        }}
+    ]).to_list(length=None)
+    
+    by_type = Counter()
+    by_status = Counter()
+    for group in groups:
+        by_type[group["_id"]["type"]] += group["count"]
+        by_status[group["_id"]["status"]] += group["count"]
+    
+    await db.stats.replace_one(
+        {"_id": MEMBER_STATS_ID},
+        {
+            "total": sum(by_type.values()),
+            "byType": dict(by_type),
+            "byStatus": dict(by_status),
+            "updatedAt": datetime.utcnow()
+        },
+        upsert=True
+    )
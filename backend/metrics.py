@@ -0,0 +1,263 @@
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Approximates process boot; this module is imported before the app is built
+PROCESS_STARTED = time.perf_counter()
+
+# Latency buckets in seconds, from sub-millisecond Mongo reads to slow bcrypt logins
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """Labelled histogram; observations are a bisect and two additions"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            # [per-bucket counts (last one is +Inf), sum]
+            series = self.series.setdefault(label_values, [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in list(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = format_labels(self.labels, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+class Gauge:
+    """Gauge that is either set directly or read from a callback at scrape time"""
+
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self.lock:
+            self.value -= amount
+
+    def render(self) -> List[str]:
+        value = self.callback() if self.callback else self.value
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {value}"
+        ]
+
+class Counter:
+    """Labelled monotonically increasing counter"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in list(self.series.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    labels=("method", "route", "status")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled"
+))
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "Mongo command latency by collection and operation",
+    labels=("collection", "command", "outcome")
+))
+mongo_connections_in_use = registry.register(Gauge(
+    "mongo_pool_connections_in_use", "Mongo connections checked out of the pool"
+))
+mongo_checkouts_waiting = registry.register(Gauge(
+    "mongo_pool_checkouts_waiting", "Operations waiting for a Mongo connection"
+))
+coalesced_requests = registry.register(Counter(
+    "coalesced_requests_total", "Requests answered by another request's in-flight or recent result",
+    labels=("endpoint", "source")
+))
+auth_requests_rejected = registry.register(Counter(
+    "auth_requests_rejected_total", "Auth requests refused by rate limits or load shedding",
+    labels=("endpoint", "reason")
+))
+
+app_startup_seconds = registry.register(Gauge(
+    "app_startup_seconds", "Time from process boot until startup handlers finished"
+))
+app_first_request_seconds = registry.register(Gauge(
+    "app_first_request_seconds", "Time from process boot until the first response was served"
+))
+first_request_served = False
+
+def record_startup_complete():
+    app_startup_seconds.value = time.perf_counter() - PROCESS_STARTED
+    logger.info("Startup completed %.1f ms after boot", app_startup_seconds.value * 1000)
+
+def record_first_request():
+    global first_request_served
+    first_request_served = True
+    app_first_request_seconds.value = time.perf_counter() - PROCESS_STARTED
+    logger.info("First request served %.1f ms after boot", app_first_request_seconds.value * 1000)
+
+def register_executor_gauge(name: str, documentation: str, executor) -> Gauge:
+    """Expose the queued and running work of a TrackedExecutor"""
+    return registry.register(Gauge(name, documentation, callback=lambda: executor.pending))
+
+class MetricsMiddleware:
+    """Records per-route latency and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+        
+        # Only touched from the event loop thread, so no lock is needed
+        http_requests_in_flight.value += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.value -= 1
+            # The matched route is added to the scope by the router; using its
+            # template keeps ids out of the label set
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                scope["method"], route.path if route else "unmatched", str(status_code)
+            )
+            if not first_request_served:
+                record_first_request()
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """Times every Mongo command by collection and command name"""
+
+    def __init__(self):
+        self.pending: Dict[Tuple[int, object], Tuple[str, str]] = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        with self.lock:
+            self.pending[(event.request_id, event.connection_id)] = (
+                collection if isinstance(collection, str) else "", event.command_name
+            )
+
+    def succeeded(self, event):
+        self.record(event, "success")
+
+    def failed(self, event):
+        self.record(event, "failure")
+
+    def record(self, event, outcome: str):
+        with self.lock:
+            collection, command = self.pending.pop(
+                (event.request_id, event.connection_id), ("", event.command_name)
+            )
+            mongo_command_duration.observe(event.duration_micros / 1e6, collection, command, outcome)
+
+class MongoPoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks connection pool saturation"""
+
+    def connection_check_out_started(self, event):
+        mongo_checkouts_waiting.inc()
+
+    def connection_check_out_failed(self, event):
+        mongo_checkouts_waiting.dec()
+
+    def connection_checked_out(self, event):
+        mongo_checkouts_waiting.dec()
+        mongo_connections_in_use.inc()
+
+    def connection_checked_in(self, event):
+        mongo_connections_in_use.dec()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
@@ -33,14 +33,18 @@ class EventType(str, Enum):
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
     name: str
+    nameLower: Optional[str] = None  # Lowercased name for directory prefix search
     email: EmailStr
     password: str
-    memberId: str = Field(default_factory=lambda: f"2024{str(uuid.uuid4().int)[:3]}")
+    memberId: str  # Allocated by member_ids.member_id_allocator
     membershipType: MembershipType = MembershipType.BASIC
     membershipStatus: MembershipStatus = MembershipStatus.ACTIVE
     joinDate: datetime = Field(default_factory=datetime.utcnow)
+    membershipExpiresAt: Optional[datetime] = None  # End of the paid period; None never lapses
     avatar: Optional[str] = None
-    qrCode: Optional[str] = None
+    qrCode: Optional[str] = None  # Rendered lazily, see cards.ensure_card
+    cardVersion: int = 1  # Bumped whenever the card content changes
+    qrCodeVersion: Optional[int] = None  # cardVersion that qrCode was rendered for
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
 
@@ -54,6 +58,16 @@ class UserCreate(BaseModel):
     password: str
     membershipType: Optional[MembershipType] = MembershipType.BASIC
 
+class MemberImport(BaseModel):
+    """One row of a member migration file; exactly one of password or passwordHash"""
+    name: str
+    email: EmailStr
+    password: Optional[str] = None
+    passwordHash: Optional[str] = None  # Existing bcrypt hash from the old system
+    membershipType: MembershipType = MembershipType.BASIC
+    membershipStatus: MembershipStatus = MembershipStatus.ACTIVE
+    joinDate: Optional[datetime] = None
+
 class UserUpdate(BaseModel):
     name: Optional[str] = None
     email: Optional[EmailStr] = None
@@ -79,13 +93,28 @@ class UserLogin(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
     user: UserResponse
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 # Event Models
 class EventRegistration(BaseModel):
     userId: str
     registrationDate: datetime = Field(default_factory=datetime.utcnow)
 
+class WaitlistEntry(BaseModel):
+    userId: str
+    joinedAt: datetime = Field(default_factory=datetime.utcnow)
+
+class WaitlistPosition(BaseModel):
+    eventId: str
+    registered: bool
+    waitlisted: bool
+    position: Optional[int] = None  # 1 is next in line
+    waitlistLength: int
+
 class EventResults(BaseModel):
     winner: Optional[str] = None
     participants: int = 0
@@ -104,7 +133,15 @@ class Event(BaseModel):
     price: float = 0.0
     registrationDeadline: str
     status: EventStatus = EventStatus.UPCOMING
+    startsAt: Optional[datetime] = None  # UTC, parsed from date and time
+    endsAt: Optional[datetime] = None
+    nextTransitionAt: Optional[datetime] = None  # When the lifecycle job next looks at this event
+    externalId: Optional[str] = None  # Key of the event in an external calendar, used by imports
+    nameLower: Optional[str] = None  # Lowercased name for prefix search
     registrations: List[EventRegistration] = []
+    registrationCount: int = 0  # Kept in step with registrations
+    waitlist: List[WaitlistEntry] = []  # First in, first promoted
+    waitlistCount: int = 0  # Kept in step with waitlist
     results: Optional[EventResults] = None
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
@@ -124,6 +161,7 @@ class EventCreate(BaseModel):
     memberOnly: bool = False
     price: float = 0.0
     registrationDeadline: str
+    externalId: Optional[str] = None
 
 class EventUpdate(BaseModel):
     name: Optional[str] = None
@@ -152,8 +190,67 @@ class EventResponse(BaseModel):
     registrationDeadline: str
     status: EventStatus
     registrations: int  # Count of registrations
+    waitlistCount: int = 0
+    registered: bool = False  # Whether the signed-in user is registered
     results: Optional[EventResults] = None
 
+# Result Models
+class ResultCreate(BaseModel):
+    eventId: str
+    discipline: str  # Code from results.DISCIPLINES, e.g. "100m" or "LJ"
+    userId: str
+    mark: str  # As shown on the result sheet: "10.52", "1:52.34", "7.45"
+    wind: Optional[float] = None  # m/s, for sprints, hurdles and horizontal jumps
+    placing: Optional[int] = None
+    round: str = "final"
+    heat: Optional[int] = None  # Within the round; None for a straight final
+    ageGroup: str = "Open"  # Competition age group, e.g. "U18"
+    gender: Optional[str] = None
+
+class Result(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
+    eventId: str
+    discipline: str
+    userId: str
+    athleteName: str
+    memberId: str
+    mark: str
+    value: Optional[float] = None  # Seconds, metres or points; None for DNF, NM and the like
+    sortKey: Optional[float] = None  # Ascending is better for every discipline
+    wind: Optional[float] = None
+    windLegal: bool = True  # Wind-assisted marks never count as bests
+    placing: Optional[int] = None
+    round: str = "final"
+    heat: Optional[int] = None
+    ageGroup: str = "Open"
+    gender: Optional[str] = None
+    season: str
+    competedAt: datetime
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        populate_by_name = True
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    userId: str
+    athleteName: str
+    memberId: str
+    mark: str
+    wind: Optional[float] = None
+    ageGroup: str
+    gender: Optional[str] = None
+    eventId: str
+    competedAt: datetime
+
+class PersonalBest(BaseModel):
+    discipline: str
+    scope: str  # "pb" for all time, otherwise the season
+    mark: str
+    wind: Optional[float] = None
+    eventId: str
+    competedAt: datetime
+
 # Community Models
 class Comment(BaseModel):
     userId: str
@@ -173,6 +270,8 @@ class CommunityPost(BaseModel):
     content: str
     likes: List[Like] = []
     comments: List[Comment] = []
+    likeCount: int = 0  # Kept in step with likes
+    commentCount: int = 0  # Kept in step with comments
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
 
@@ -227,6 +326,26 @@ class MembershipPlanResponse(BaseModel):
     popular: bool
 
 # Statistics Models
+class MemberDirectoryEntry(BaseModel):
+    id: str
+    name: str
+    email: EmailStr
+    memberId: str
+    membershipType: MembershipType
+    membershipStatus: MembershipStatus
+    joinDate: datetime
+    avatar: Optional[str] = None
+
+class MemberDirectoryPage(BaseModel):
+    members: List[MemberDirectoryEntry]
+    nextCursor: Optional[str] = None  # Pass as `after` to fetch the next page
+
+class MemberCounts(BaseModel):
+    total: int
+    byType: Dict[str, int]
+    byStatus: Dict[str, int]
+    updatedAt: Optional[datetime] = None
+
 class MembershipStats(BaseModel):
     totalMembers: int
     activeEvents: int
@@ -256,6 +375,25 @@ class QRScanResponse(BaseModel):
     message: str
     user: Optional[UserResponse] = None
 
+# Search Models
+class SearchHit(BaseModel):
+    type: str  # "event" or "post"
+    id: str
+    title: str
+    subtitle: Optional[str] = None
+    score: float
+
+class SearchResponse(BaseModel):
+    query: str
+    skip: int
+    limit: int
+    hits: List[SearchHit]
+
+class EventSuggestion(BaseModel):
+    id: str
+    name: str
+    date: str
+
 # Featured Member Model
 class FeaturedMember(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
@@ -0,0 +1,159 @@
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import Counter
+from typing import Optional
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this, or issuing more Mongo commands than this, are logged
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_DB_COUNT = int(os.environ.get("SLOW_REQUEST_DB_COUNT", "20"))
+
+# Fraction of requests to profile, and whether an X-Profile: 1 header may force it
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER_ENABLED = os.environ.get("PROFILE_HEADER_ENABLED", "false").lower() == "true"
+PROFILE_HEADER = b"x-profile"
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:  # pragma: no cover - optional dependency
+    PyinstrumentProfiler = None
+
+_cprofile_active = False
+
+class RequestStats:
+    """Mongo command accounting for a single request"""
+
+    def __init__(self):
+        self.db_count = 0
+        self.db_ms = 0.0
+        self.commands = Counter()
+        self.lock = threading.Lock()
+
+    def record_command(self, command_name: str, collection: Optional[str]):
+        with self.lock:
+            self.db_count += 1
+            self.commands[f"{command_name} {collection}" if collection else command_name] += 1
+
+    def record_duration(self, duration_micros: int):
+        with self.lock:
+            self.db_ms += duration_micros / 1000
+
+    def server_timing(self, handler_ms: float) -> str:
+        return (
+            f'db;dur={self.db_ms:.2f};desc="{self.db_count} commands", '
+            f"handler;dur={handler_ms:.2f}"
+        )
+
+current_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request_stats", default=None
+)
+
+class DBCommandListener(monitoring.CommandListener):
+    """Attributes every Mongo command to the request that issued it.
+    
+    Motor runs pymongo calls on a thread pool with a copy of the caller's
+    context, so the request's RequestStats is visible from these callbacks.
+    """
+
+    def started(self, event):
+        stats = current_request_stats.get()
+        if stats is not None:
+            collection = event.command.get(event.command_name)
+            stats.record_command(
+                event.command_name, collection if isinstance(collection, str) else None
+            )
+
+    def succeeded(self, event):
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.record_duration(event.duration_micros)
+
+    def failed(self, event):
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.record_duration(event.duration_micros)
+
+class ProfilingMiddleware:
+    """Adds Server-Timing headers, logs slow requests and samples profiles"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        profiler = self.start_profiler(scope)
+        started = time.perf_counter()
+        handler_ms = None
+
+        async def send_with_timing(message):
+            nonlocal handler_ms
+            if message["type"] == "http.response.start":
+                handler_ms = (time.perf_counter() - started) * 1000
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing(handler_ms))
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request_stats.reset(token)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if profiler is not None:
+                self.stop_profiler(profiler, scope)
+            if elapsed_ms >= SLOW_REQUEST_MS or stats.db_count >= SLOW_REQUEST_DB_COUNT:
+                logger.warning(
+                    "Slow request %s %s: %.1f ms, %d db commands in %.1f ms (%s)",
+                    scope["method"], scope["path"], elapsed_ms, stats.db_count, stats.db_ms,
+                    ", ".join(f"{name} x{count}" for name, count in stats.commands.most_common(5))
+                )
+
+    def start_profiler(self, scope):
+        """Start a profiler if this request is sampled or explicitly asked for one"""
+        forced = PROFILE_HEADER_ENABLED and (PROFILE_HEADER, b"1") in scope["headers"]
+        if not forced and (PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE):
+            return None
+        
+        if PyinstrumentProfiler is not None:
+            profiler = PyinstrumentProfiler(async_mode="enabled")
+            profiler.start()
+            return profiler
+        
+        # cProfile sees every coroutine on the event loop thread, so
+        # concurrent requests can show up in the capture, and only one
+        # capture can be active at a time
+        global _cprofile_active
+        if _cprofile_active:
+            return None
+        _cprofile_active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler, scope):
+        if isinstance(profiler, cProfile.Profile):
+            global _cprofile_active
+            profiler.disable()
+            _cprofile_active = False
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(30)
+            report = output.getvalue()
+        else:
+            profiler.stop()
+            report = profiler.output_text(unicode=False, color=False)
+        
+        logger.info("Profile for %s %s\n%s", scope["method"], scope["path"], report)
@@ -0,0 +1,80 @@
+from fastapi import HTTPException, Request, status
+from collections import OrderedDict
+from typing import List
+from auth import hash_executor
+from metrics import auth_requests_rejected
+import math
+import os
+import time
+
+# Beyond this many queued or running hashes, new password work is turned away
+# rather than queued behind work that will already take seconds to clear
+AUTH_SHED_PENDING = int(os.environ.get("AUTH_SHED_PENDING", "32"))
+
+class RateLimiter:
+    """Token buckets per key, e.g. per client IP or per account.
+    
+    Each key may spend `burst` requests at once and regains `rate` per
+    second. Buckets live in an LRU capped at `max_keys`; a key pushed out
+    starts again with a full bucket, which bounds memory at the cost of
+    forgetting the quietest keys first.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, max_keys: int = 10000):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, monotonic time of last update]
+        self.buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def acquire(self, key: str) -> float:
+        """Spend a token; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(self.burst), now]
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+def per_minute(name: str, default: float) -> float:
+    return float(os.environ.get(name, default)) / 60
+
+# Logins: a household behind one address, and a member mistyping a password
+login_ip_limiter = RateLimiter("login-ip", rate=per_minute("LOGIN_IP_PER_MINUTE", 10), burst=20)
+login_account_limiter = RateLimiter("login-account", rate=per_minute("LOGIN_ACCOUNT_PER_MINUTE", 2), burst=5)
+register_ip_limiter = RateLimiter("register-ip", rate=per_minute("REGISTER_IP_PER_MINUTE", 2), burst=5)
+
+def client_ip(request: Request) -> str:
+    # Behind a proxy, run uvicorn with --proxy-headers so this is the real client
+    return request.client.host if request.client else "unknown"
+
+def enforce_rate_limit(limiter: RateLimiter, key: str, endpoint: str):
+    """Raise 429 with Retry-After once `key` has used up its bucket"""
+    retry_after = limiter.acquire(key)
+    if retry_after:
+        auth_requests_rejected.inc(endpoint, limiter.name)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+def shed_if_overloaded(endpoint: str):
+    """Raise 503 while the password hashing queue is too deep to serve in time"""
+    if hash_executor.pending >= AUTH_SHED_PENDING:
+        auth_requests_rejected.inc(endpoint, "overloaded")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Sign-in is busy, please try again shortly",
+            headers={"Retry-After": "1"}
+        )
@@ -0,0 +1,298 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne, UpdateOne
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from models import Result, ResultCreate
+from utils import EVENT_TIMEZONE
+import re
+
+# Discipline code -> (kind, whether wind is measured). Times are seconds,
+# distances and heights metres, combined events points.
+DISCIPLINES = {
+    "60m": ("time", False),
+    "100m": ("time", True),
+    "200m": ("time", True),
+    "400m": ("time", False),
+    "800m": ("time", False),
+    "1500m": ("time", False),
+    "3000m": ("time", False),
+    "5000m": ("time", False),
+    "10000m": ("time", False),
+    "100mH": ("time", True),
+    "110mH": ("time", True),
+    "400mH": ("time", False),
+    "2000mSC": ("time", False),
+    "3000mSC": ("time", False),
+    "HJ": ("height", False),
+    "PV": ("height", False),
+    "LJ": ("distance", True),
+    "TJ": ("distance", True),
+    "SP": ("distance", False),
+    "DT": ("distance", False),
+    "HT": ("distance", False),
+    "JT": ("distance", False),
+    "HEP": ("points", False),
+    "DEC": ("points", False),
+}
+
+# Largest mark accepted for each kind, to catch misplaced decimal points
+MARK_LIMITS = {"time": 4 * 3600, "height": 7.0, "distance": 110.0, "points": 10000}
+
+# Entries that count as participation but have no mark
+NON_MARKS = {"DNF", "DNS", "DQ", "NM", "NH"}
+
+# Faster tailwinds make a mark wind-assisted
+MAX_LEGAL_WIND = 2.0
+
+# Ranking group of the bests across every age group; the others are named
+# after the age group the mark was set in
+ALL_AGE_GROUPS = "all"
+
+TIME_MARK = re.compile(r"^(?:(?:(\d+):)?(\d{1,2}):)?(\d{1,2}(?:\.\d+)?)$")
+
+def parse_mark(discipline: str, mark: str) -> Optional[float]:
+    """Read a mark as shown on a result sheet; None for DNF, NM and the like.
+    
+    Raises ValueError for unknown disciplines and unreadable or implausible marks.
+    """
+    if discipline not in DISCIPLINES:
+        raise ValueError(f"Unknown discipline {discipline!r}")
+    mark = mark.strip().upper()
+    if mark in NON_MARKS:
+        return None
+    
+    kind, _ = DISCIPLINES[discipline]
+    if kind == "time":
+        match = TIME_MARK.match(mark)
+        if not match:
+            raise ValueError(f"Unreadable time {mark!r}")
+        hours, minutes, seconds = match.groups()
+        value = int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)
+    else:
+        try:
+            value = float(mark.rstrip("M"))
+        except ValueError:
+            raise ValueError(f"Unreadable mark {mark!r}")
+    
+    if not 0 < value <= MARK_LIMITS[kind]:
+        raise ValueError(f"Implausible mark {mark!r} for {discipline}")
+    return value
+
+def sort_key(discipline: str, value: Optional[float]) -> Optional[float]:
+    """Normalize a mark so that ascending order is best first for every discipline"""
+    if value is None:
+        return None
+    return value if DISCIPLINES[discipline][0] == "time" else -value
+
+def wind_is_legal(discipline: str, wind: Optional[float]) -> bool:
+    return not DISCIPLINES[discipline][1] or wind is None or wind <= MAX_LEGAL_WIND
+
+def season_of(when: datetime) -> str:
+    """Season a naive UTC time falls in; seasons follow the calendar year at the venue"""
+    return str(when.replace(tzinfo=timezone.utc).astimezone(EVENT_TIMEZONE).year)
+
+def build_result(entry: ResultCreate, event: dict, athlete: dict) -> dict:
+    """Result document for one validated entry; raises ValueError for a bad mark"""
+    value = parse_mark(entry.discipline, entry.mark)
+    competed_at = event.get("startsAt") or datetime.utcnow()
+    result = Result(
+        eventId=entry.eventId,
+        discipline=entry.discipline,
+        userId=entry.userId,
+        athleteName=athlete["name"],
+        memberId=athlete["memberId"],
+        mark=entry.mark.strip().upper(),
+        value=value,
+        sortKey=sort_key(entry.discipline, value),
+        wind=entry.wind,
+        windLegal=wind_is_legal(entry.discipline, entry.wind),
+        placing=entry.placing,
+        round=entry.round,
+        heat=entry.heat,
+        ageGroup=entry.ageGroup,
+        gender=entry.gender,
+        season=season_of(competed_at),
+        competedAt=competed_at
+    )
+    return result.dict(by_alias=True)
+
+# An athlete has one result per event, discipline and round
+RESULT_KEY_FIELDS = ("eventId", "discipline", "round", "userId")
+
+def result_key(result: dict) -> Tuple[str, ...]:
+    return tuple(result[field] for field in RESULT_KEY_FIELDS)
+
+def counts_as_best(result: dict) -> bool:
+    return result.get("sortKey") is not None and result.get("windLegal", True)
+
+def ranking_groups(result: dict) -> Tuple[str, str]:
+    """Leaderboards a result can be a best in: all ages, and its own age group"""
+    return ALL_AGE_GROUPS, result["ageGroup"]
+
+def best_fields(result: dict, scope: str, group: str) -> dict:
+    return {
+        "userId": result["userId"],
+        "discipline": result["discipline"],
+        "scope": scope,
+        "rankingGroup": group,
+        "athleteName": result["athleteName"],
+        "memberId": result["memberId"],
+        "mark": result["mark"],
+        "value": result["value"],
+        "sortKey": result["sortKey"],
+        "wind": result.get("wind"),
+        "ageGroup": result["ageGroup"],
+        "gender": result.get("gender"),
+        "eventId": result["eventId"],
+        "resultId": result["_id"],
+        "competedAt": result["competedAt"]
+    }
+
+def best_id(user_id: str, discipline: str, scope: str, group: str) -> str:
+    return f"{user_id}:{discipline}:{scope}:{group}"
+
+def best_update(result: dict, scope: str, group: str) -> UpdateOne:
+    """Upsert that only takes the result if it beats the stored best.
+    
+    The comparison happens inside the update, so concurrent writers for the
+    same athlete cannot overwrite a better mark with a worse one.
+    """
+    is_better = {"$lt": [result["sortKey"], {"$ifNull": ["$sortKey", float("inf")]}]}
+    return UpdateOne(
+        {"_id": best_id(result["userId"], result["discipline"], scope, group)},
+        [{"$set": {
+            field: {"$cond": [is_better, {"$literal": value}, f"${field}"]}
+            for field, value in best_fields(result, scope, group).items()
+        }}],
+        upsert=True
+    )
+
+async def update_bests(db: AsyncIOMotorDatabase, results: Iterable[dict]):
+    """Fold new results into the personal and season best table"""
+    updates = []
+    for result in results:
+        if counts_as_best(result):
+            for group in ranking_groups(result):
+                updates.append(best_update(result, "pb", group))
+                updates.append(best_update(result, result["season"], group))
+    if updates:
+        await db.personal_bests.bulk_write(updates, ordered=False)
+
+async def recompute_bests(db: AsyncIOMotorDatabase, pairs: Set[Tuple[str, str]]):
+    """Rebuild bests from the results, for athletes whose marks were corrected downwards
+    or moved to another age group or gender
+    """
+    for user_id, discipline in pairs:
+        results_cursor = db.results.find(
+            {"userId": user_id, "discipline": discipline, "sortKey": {"$ne": None}}
+        ).sort("sortKey", 1)
+        bests: Dict[Tuple[str, str], dict] = {}
+        async for result in results_cursor:
+            if not result.get("windLegal", True):
+                continue
+            for group in ranking_groups(result):
+                bests.setdefault(("pb", group), result)
+                bests.setdefault((result["season"], group), result)
+        
+        await db.personal_bests.delete_many({"userId": user_id, "discipline": discipline})
+        if bests:
+            await db.personal_bests.bulk_write([
+                ReplaceOne(
+                    {"_id": best_id(user_id, discipline, scope, group)},
+                    best_fields(result, scope, group),
+                    upsert=True
+                )
+                for (scope, group), result in bests.items()
+            ])
+
+async def save_results(db: AsyncIOMotorDatabase, results: List[dict]) -> dict:
+    """Write results keyed by event, discipline, round and athlete, then update the bests.
+    
+    Re-sending a result replaces it. A replacement that is worse than before,
+    or in another age group or gender, may have been someone's best, so those
+    athletes are recomputed instead.
+    Returns the bulk write summary of the results collection.
+    """
+    if not results:
+        return {}
+    
+    # Previous marks of any results being replaced
+    previous = {}
+    existing_cursor = db.results.find(
+        {
+            "eventId": {"$in": list({result["eventId"] for result in results})},
+            "userId": {"$in": list({result["userId"] for result in results})}
+        },
+        {**{field: 1 for field in RESULT_KEY_FIELDS}, "sortKey": 1, "windLegal": 1, "ageGroup": 1, "gender": 1}
+    )
+    async for existing in existing_cursor:
+        previous[result_key(existing)] = existing
+    
+    written = await db.results.bulk_write([
+        UpdateOne(
+            {field: result[field] for field in RESULT_KEY_FIELDS},
+            {
+                "$set": {k: v for k, v in result.items() if k not in ("_id", "createdAt")},
+                "$setOnInsert": {"_id": result["_id"], "createdAt": result["createdAt"]}
+            },
+            upsert=True
+        )
+        for result in results
+    ], ordered=False)
+    
+    # Stored results keep their original id, which the bests point to
+    for result in results:
+        if result_key(result) in previous:
+            result["_id"] = previous[result_key(result)]["_id"]
+    
+    downgraded = set()
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None or not counts_as_best(before):
+            continue
+        moved = (result["ageGroup"], result.get("gender")) != (before.get("ageGroup"), before.get("gender"))
+        if moved or not counts_as_best(result) or result["sortKey"] > before["sortKey"]:
+            downgraded.add((result["userId"], result["discipline"]))
+    
+    await update_bests(db, [
+        result for result in results if (result["userId"], result["discipline"]) not in downgraded
+    ])
+    await recompute_bests(db, downgraded)
+    return written.bulk_api_result
+
+async def summarize_event_results(db: AsyncIOMotorDatabase, event_ids: Iterable[str]):
+    """Refresh each event's results summary from its stored results, one pass per event.
+    
+    The winner is the athlete placed first in the final; meets with several
+    disciplines have one per discipline, so they only get a participant count.
+    """
+    for event_id in event_ids:
+        summary = await db.results.aggregate([
+            {"$match": {"eventId": event_id}},
+            {"$group": {
+                "_id": None,
+                "athletes": {"$addToSet": "$userId"},
+                "disciplines": {"$addToSet": "$discipline"},
+                "winners": {"$addToSet": {"$cond": [
+                    {"$and": [{"$eq": ["$placing", 1]}, {"$eq": ["$round", "final"]}]},
+                    "$athleteName",
+                    None
+                ]}}
+            }}
+        ]).to_list(length=1)
+        if not summary:
+            continue
+        
+        winners = [name for name in summary[0]["winners"] if name]
+        single_winner = len(summary[0]["disciplines"]) == 1 and len(winners) == 1
+        await db.events.update_one(
+            {"_id": event_id},
+            {"$set": {
+                "results": {
+                    "winner": winners[0] if single_winner else None,
+                    "participants": len(summary[0]["athletes"]),
+                    "completed": True
+                },
+                "updatedAt": datetime.utcnow()
+            }}
+        )
@@ -1,28 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from datetime import timedelta, datetime
-from models import UserCreate, UserLogin, Token, UserResponse, User
+from pymongo import ReturnDocument
+from datetime import timedelta
+from models import UserCreate, UserLogin, Token, UserResponse, User, RefreshRequest
 from auth import (
-    get_password_hash, 
-    verify_password, 
+    hash_password, 
+    check_password, 
     create_access_token, 
     get_current_user,
+    evict_cached_users,
+    issue_refresh_token,
+    rotate_refresh_token,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from database import get_database
-from utils import generate_qr_code, create_qr_data, generate_member_id
-import uuid
+from utils import render_qr_code, create_qr_data, server_stamped_insert
+from member_ids import member_id_allocator
+from cards import schedule_card_render
+from member_stats import record_members_added, record_member_change
+from ratelimit import (
+    login_ip_limiter, login_account_limiter, register_ip_limiter,
+    client_ip, enforce_rate_limit, shed_if_overloaded
+)
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
 @router.post("/register", response_model=Token)
 async def register_user(
     user_data: UserCreate,
+    request: Request,
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Register a new user"""
     
+    # Turn work away before it reaches the password hashing pool
+    shed_if_overloaded("register")
+    enforce_rate_limit(register_ip_limiter, client_ip(request), "register")
+    
     # Check if user already exists
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
@@ -32,12 +47,8 @@ async def register_user(
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
-    member_id = generate_member_id()
-    
-    # Generate QR code for new user
-    qr_data = create_qr_data("member", str(uuid.uuid4()), user_data.membershipType.value)
-    qr_code_image = generate_qr_code(qr_data)
+    hashed_password = await hash_password(user_data.password)
+    member_id = await member_id_allocator.next_id(db)
     
     new_user = User(
         name=user_data.name,
@@ -45,11 +56,16 @@ async def register_user(
         password=hashed_password,
         memberId=member_id,
         membershipType=user_data.membershipType,
-        qrCode=qr_code_image
+        nameLower=user_data.name.lower()
     )
     
     # Insert user into database
-    result = await db.users.insert_one(new_user.dict(by_alias=True))
+    user_document = new_user.dict(by_alias=True)
+    await db.users.update_one({"_id": new_user.id}, server_stamped_insert(user_document), upsert=True)
+    await record_members_added(db, [user_document])
+    
+    # The QR card is rendered after the response instead of during signup
+    schedule_card_render(db, user_document)
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -60,7 +76,7 @@ async def register_user(
     
     # Prepare user response
     user_response = UserResponse(
-        id=str(result.inserted_id),
+        id=new_user.id,
         name=new_user.name,
         email=new_user.email,
         memberId=new_user.memberId,
@@ -73,16 +89,23 @@ async def register_user(
     
     return Token(
         access_token=access_token,
+        refresh_token=await issue_refresh_token(db, user_response.id),
         user=user_response
     )
 
 @router.post("/login", response_model=Token)
 async def login_user(
     user_credentials: UserLogin,
+    request: Request,
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Login user"""
     
+    # Turn work away before it reaches the password hashing pool
+    shed_if_overloaded("login")
+    enforce_rate_limit(login_ip_limiter, client_ip(request), "login")
+    enforce_rate_limit(login_account_limiter, user_credentials.email.lower(), "login")
+    
     # Find user by email
     user_data = await db.users.find_one({"email": user_credentials.email})
     if not user_data:
@@ -92,7 +115,7 @@ async def login_user(
         )
     
     # Verify password
-    if not verify_password(user_credentials.password, user_data["password"]):
+    if not await check_password(user_credentials.password, user_data["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
@@ -120,15 +143,69 @@ async def login_user(
     
     return Token(
         access_token=access_token,
+        refresh_token=await issue_refresh_token(db, user_data["_id"]),
+        user=user_response
+    )
+
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(
+    refresh_request: RefreshRequest,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Exchange a refresh token for a new access token and refresh token"""
+    
+    # A lookup and a rotation; no password hashing
+    rotated = await rotate_refresh_token(db, refresh_request.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+    user_id, refresh_token = rotated
+    
+    user_data = await db.users.find_one({"_id": user_id}, {"password": 0})
+    if not user_data:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+    
+    # Create access token
+    access_token = create_access_token(
+        data={"sub": user_data["email"]},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    
+    user_response = UserResponse(
+        id=user_data["_id"],
+        name=user_data["name"],
+        email=user_data["email"],
+        memberId=user_data["memberId"],
+        membershipType=user_data["membershipType"],
+        membershipStatus=user_data["membershipStatus"],
+        joinDate=user_data["joinDate"],
+        avatar=user_data.get("avatar"),
+        qrCode=user_data.get("qrCode")
+    )
+    
+    return Token(
+        access_token=access_token,
+        refresh_token=refresh_token,
         user=user_response
     )
 
+async def with_qr_code(db: AsyncIOMotorDatabase, user: UserResponse) -> UserResponse:
+    """The profile with its stored QR card, which the cached profile leaves out"""
+    stored = await db.users.find_one({"_id": user.id}, {"qrCode": 1})
+    return user.copy(update={"qrCode": (stored or {}).get("qrCode")})
+
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_profile(
-    current_user: UserResponse = Depends(get_current_user)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get current user profile"""
-    return current_user
+    return await with_qr_code(db, current_user)
 
 @router.put("/profile", response_model=UserResponse)
 async def update_user_profile(
@@ -141,14 +218,25 @@ async def update_user_profile(
     # Prepare update data
     update_data = {k: v for k, v in user_update.items() if v is not None}
     if update_data:
-        update_data["updatedAt"] = datetime.utcnow()
+        if isinstance(update_data.get("name"), str):
+            update_data["nameLower"] = update_data["name"].lower()
         
-        # Update user in database
-        await db.users.update_one(
+        # Update user in database; the cached profile may be stale, so the
+        # counters move from the stored type and status
+        before = await db.users.find_one_and_update(
             {"_id": current_user.id},
-            {"$set": update_data}
+            {"$set": update_data, "$currentDate": {"updatedAt": True}},
+            projection={"membershipType": 1, "membershipStatus": 1},
+            return_document=ReturnDocument.BEFORE
         )
         
+        # Keep the member counters in step with type or status changes
+        if before and ("membershipType" in update_data or "membershipStatus" in update_data):
+            await record_member_change(db, before, {**before, **update_data})
+        
+        # Every worker drops its cached copy, under the new email too if it changed
+        await evict_cached_users(current_user.email, update_data.get("email"))
+        
         # Get updated user data
         updated_user = await db.users.find_one({"_id": current_user.id})
         
@@ -164,7 +252,7 @@ async def update_user_profile(
             qrCode=updated_user.get("qrCode")
         )
     
-    return current_user
+    return await with_qr_code(db, current_user)
 
 @router.post("/qr-generate")
 async def generate_user_qr(
@@ -173,7 +261,7 @@ async def generate_user_qr(
     """Generate new QR code for current user"""
     
     qr_data = create_qr_data("member", current_user.id, current_user.membershipType.value)
-    qr_code_image = generate_qr_code(qr_data)
+    qr_code_image = await render_qr_code(qr_data)
     
     return {
         "qrCode": qr_code_image,
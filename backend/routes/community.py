@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Optional
 from models import (
@@ -8,10 +9,32 @@ from models import (
 from auth import get_current_user, get_optional_current_user
 from database import get_database
 from utils import format_timestamp
+from coalesce import SingleFlight, request_key
 from datetime import datetime
 
 router = APIRouter(prefix="/community", tags=["community"])
 
+community_stats_flight = SingleFlight("community-stats")
+
+# Fields needed to build a PostResponse; likes and comments arrays are never loaded
+POST_RESPONSE_PROJECTION = {
+    "author": 1, "authorId": 1, "title": 1, "content": 1,
+    "likeCount": 1, "commentCount": 1, "createdAt": 1
+}
+
+def post_response_dict(post: dict) -> dict:
+    """Shape a projected post document like PostResponse without building the model"""
+    return {
+        "id": post["_id"],
+        "author": post["author"],
+        "authorId": post["authorId"],
+        "title": post["title"],
+        "content": post["content"],
+        "likes": post.get("likeCount", 0),
+        "comments": post.get("commentCount", 0),
+        "timestamp": format_timestamp(post["createdAt"])
+    }
+
 @router.get("/posts", response_model=List[PostResponse])
 async def get_community_posts(
     limit: int = Query(10, ge=1, le=50),
@@ -21,24 +44,11 @@ async def get_community_posts(
 ):
     """Get community posts with pagination"""
     
-    posts_cursor = db.community_posts.find().sort("createdAt", -1).skip(skip).limit(limit)
+    posts_cursor = db.community_posts.find({}, POST_RESPONSE_PROJECTION).sort("createdAt", -1).skip(skip).limit(limit)
     posts = await posts_cursor.to_list(length=limit)
     
-    post_responses = []
-    for post in posts:
-        post_response = PostResponse(
-            id=post["_id"],
-            author=post["author"],
-            authorId=post["authorId"],
-            title=post["title"],
-            content=post["content"],
-            likes=len(post.get("likes", [])),
-            comments=len(post.get("comments", [])),
-            timestamp=format_timestamp(post["createdAt"])
-        )
-        post_responses.append(post_response)
-    
-    return post_responses
+    # Documents go straight to JSON bytes; response_model still documents the schema
+    return ORJSONResponse([post_response_dict(post) for post in posts])
 
 @router.post("/posts", response_model=PostResponse)
 async def create_post(
@@ -163,19 +173,26 @@ async def toggle_post_like(
     likes = post.get("likes", [])
     user_liked = any(like["userId"] == current_user.id for like in likes)
     
+    # The filters keep likeCount in step if the same user toggles concurrently
     if user_liked:
         # Unlike the post
         await db.community_posts.update_one(
-            {"_id": post_id},
-            {"$pull": {"likes": {"userId": current_user.id}}}
+            {"_id": post_id, "likes.userId": current_user.id},
+            {
+                "$pull": {"likes": {"userId": current_user.id}},
+                "$inc": {"likeCount": -1}
+            }
         )
         return {"message": "Post unliked", "liked": False}
     else:
         # Like the post
         new_like = Like(userId=current_user.id)
         await db.community_posts.update_one(
-            {"_id": post_id},
-            {"$push": {"likes": new_like.dict()}}
+            {"_id": post_id, "likes.userId": {"$ne": current_user.id}},
+            {
+                "$push": {"likes": new_like.dict()},
+                "$inc": {"likeCount": 1}
+            }
         )
         return {"message": "Post liked", "liked": True}
 
@@ -206,7 +223,10 @@ async def add_comment(
     # Add comment to post
     await db.community_posts.update_one(
         {"_id": post_id},
-        {"$push": {"comments": new_comment.dict()}}
+        {
+            "$push": {"comments": new_comment.dict()},
+            "$inc": {"commentCount": 1}
+        }
     )
     
     return {
@@ -277,31 +297,29 @@ async def get_community_stats(
 ):
     """Get community statistics"""
     
+    # Every concurrent caller gets the same counts from one set of queries
+    return await community_stats_flight.do(request_key("community-stats"), lambda: load_community_stats(db))
+
+async def load_community_stats(db: AsyncIOMotorDatabase) -> dict:
     # Get total members
     total_members = await db.users.count_documents({})
     
-    # Get total posts
-    total_posts = await db.community_posts.count_documents({})
-    
-    # Get total comments (aggregate from all posts)
-    pipeline = [
-        {"$project": {"commentCount": {"$size": {"$ifNull": ["$comments", []]}}}},
-        {"$group": {"_id": None, "totalComments": {"$sum": "$commentCount"}}}
-    ]
-    comment_result = await db.community_posts.aggregate(pipeline).to_list(length=1)
-    total_comments = comment_result[0]["totalComments"] if comment_result else 0
-    
-    # Get total likes (aggregate from all posts)
+    # Posts, comments and likes in one pass over the maintained counters,
+    # without loading the embedded likes and comments arrays
     pipeline = [
-        {"$project": {"likeCount": {"$size": {"$ifNull": ["$likes", []]}}}},
-        {"$group": {"_id": None, "totalLikes": {"$sum": "$likeCount"}}}
+        {"$group": {
+            "_id": None,
+            "totalPosts": {"$sum": 1},
+            "totalComments": {"$sum": "$commentCount"},
+            "totalLikes": {"$sum": "$likeCount"}
+        }}
     ]
-    like_result = await db.community_posts.aggregate(pipeline).to_list(length=1)
-    total_likes = like_result[0]["totalLikes"] if like_result else 0
+    totals = await db.community_posts.aggregate(pipeline).to_list(length=1)
+    totals = totals[0] if totals else {}
     
     return {
         "totalMembers": total_members,
-        "totalPosts": total_posts,
-        "totalComments": total_comments,
-        "totalLikes": total_likes
+        "totalPosts": totals.get("totalPosts", 0),
+        "totalComments": totals.get("totalComments", 0),
+        "totalLikes": totals.get("totalLikes", 0)
     }
\ No newline at end of file
@@ -1,17 +1,84 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List, Optional
+from pymongo import ReturnDocument
+from typing import List, Optional, Set
 from models import (
     Event, EventCreate, EventUpdate, EventResponse, EventRegistration, 
-    EventStatus, UserResponse
+    EventStatus, UserResponse, WaitlistEntry, WaitlistPosition
 )
 from auth import get_current_user, get_optional_current_user
 from database import get_database
+from broadcast import BroadcastHub
+from bulk import detect_format, iter_rows, import_events, export_events
+from utils import event_document, event_schedule_fields
+from leader import scheduler
+from lifecycle import EVENT_LIFECYCLE_JOB
+from coalesce import SingleFlight, request_key
+from waitlist import (
+    REGISTRATION_COUNT_PROJECTION, HAS_FREE_SEAT, NO_FREE_SEAT,
+    registration_id, record_registration, unregister_and_promote, promote_waitlist
+)
 from datetime import datetime
+import asyncio
+import csv
+import io
 import uuid
 
 router = APIRouter(prefix="/events", tags=["events"])
 
+# Live registration count updates for connected clients
+registration_hub = BroadcastHub(buffer_size=64)
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Event listings are the same for every user until the registered flags are added
+event_list_flight = SingleFlight("events")
+
+# Fields needed to build an EventResponse; registrations arrays are never loaded
+EVENT_RESPONSE_PROJECTION = {
+    "name": 1, "description": 1, "date": 1, "time": 1, "type": 1, "location": 1,
+    "maxCapacity": 1, "memberOnly": 1, "price": 1, "registrationDeadline": 1,
+    "status": 1, "registrationCount": 1, "waitlistCount": 1, "results": 1
+}
+
+def event_response_dict(event: dict, registered: bool = False) -> dict:
+    """Shape a projected event document like EventResponse without building the model"""
+    return {
+        "id": event["_id"],
+        "name": event["name"],
+        "description": event["description"],
+        "date": event["date"],
+        "time": event["time"],
+        "type": event["type"],
+        "location": event["location"],
+        "maxCapacity": event["maxCapacity"],
+        "memberOnly": event["memberOnly"],
+        "price": event["price"],
+        "registrationDeadline": event["registrationDeadline"],
+        "status": event["status"],
+        "registrations": event.get("registrationCount", 0),
+        "waitlistCount": event.get("waitlistCount", 0),
+        "registered": registered,
+        "results": event.get("results")
+    }
+
+async def registered_event_ids(db: AsyncIOMotorDatabase, user_id: str, event_ids: List[str]) -> Set[str]:
+    """Which of these events the user is registered for, from one indexed query"""
+    registrations_cursor = db.event_registrations.find(
+        {"userId": user_id, "eventId": {"$in": event_ids}},
+        {"_id": 0, "eventId": 1}
+    )
+    return {registration["eventId"] async for registration in registrations_cursor}
+
+def publish_registration_update(event: Optional[dict]):
+    """Push the current registration count of an event to stream subscribers"""
+    if event:
+        registration_hub.publish("registration", {
+            "eventId": event["_id"],
+            "registrationCount": event["registrationCount"],
+            "status": event["status"]
+        })
+
 @router.get("/", response_model=List[EventResponse])
 async def get_events(
     status_filter: Optional[str] = Query(None, description="Filter by status: upcoming, previous, all"),
@@ -29,6 +96,8 @@ async def get_events(
         query["status"] = EventStatus.UPCOMING
     elif status_filter == "previous":
         query["status"] = {"$in": [EventStatus.COMPLETED, EventStatus.CANCELLED]}
+    else:
+        status_filter = None  # Any other value lists every event
     
     if event_type:
         query["type"] = event_type
@@ -36,40 +105,122 @@ async def get_events(
     if member_only is not None:
         query["memberOnly"] = member_only
     
-    # Get events from database
-    events_cursor = db.events.find(query).sort("date", 1)
-    events = await events_cursor.to_list(length=100)
-    
-    # Convert to response format
-    event_responses = []
-    for event in events:
-        # Check if user is registered
-        user_registered = False
-        if current_user:
-            user_registered = any(
-                reg["userId"] == current_user.id 
-                for reg in event.get("registrations", [])
-            )
-        
-        event_response = EventResponse(
-            id=event["_id"],
-            name=event["name"],
-            description=event["description"],
-            date=event["date"],
-            time=event["time"],
-            type=event["type"],
-            location=event["location"],
-            maxCapacity=event["maxCapacity"],
-            memberOnly=event["memberOnly"],
-            price=event["price"],
-            registrationDeadline=event["registrationDeadline"],
-            status=event["status"],
-            registrations=len(event.get("registrations", [])),
-            results=event.get("results")
+    # Get events from database, shared by identical concurrent requests
+    async def load_events():
+        events_cursor = db.events.find(query, EVENT_RESPONSE_PROJECTION).sort("date", 1)
+        return await events_cursor.to_list(length=100)
+    
+    events = await event_list_flight.do(
+        request_key("events", status=status_filter, type=event_type or None, memberOnly=member_only),
+        load_events
+    )
+    
+    # Flag the events the signed-in user has entered
+    registered = set()
+    if current_user and events:
+        registered = await registered_event_ids(db, current_user.id, [event["_id"] for event in events])
+    
+    # Documents go straight to JSON bytes; response_model still documents the schema
+    return ORJSONResponse([
+        event_response_dict(event, event["_id"] in registered) for event in events
+    ])
+
+@router.get("/mine", response_model=List[EventResponse])
+async def get_my_events(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get the events the current user is registered for"""
+    
+    registrations_cursor = db.event_registrations.find(
+        {"userId": current_user.id},
+        {"_id": 0, "eventId": 1}
+    )
+    event_ids = [registration["eventId"] async for registration in registrations_cursor]
+    if not event_ids:
+        return ORJSONResponse([])
+    
+    events_cursor = db.events.find(
+        {"_id": {"$in": event_ids}}, EVENT_RESPONSE_PROJECTION
+    ).sort("date", 1)
+    events = await events_cursor.to_list(length=len(event_ids))
+    
+    return ORJSONResponse([event_response_dict(event, True) for event in events])
+
+@router.get("/stream")
+async def stream_registration_updates():
+    """Stream live registration count changes as server-sent events"""
+    
+    subscription = registration_hub.subscribe()
+    
+    async def event_stream():
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                try:
+                    message = await subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if message is None:
+                    # Dropped as a slow consumer; the client reconnects and resyncs
+                    break
+                yield message
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/export")
+async def export_event_list(
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$"),
+    status_filter: Optional[EventStatus] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Stream all events as CSV or NDJSON (admin only)"""
+    
+    # In a real app, check for admin privileges here
+    
+    query = {"status": status_filter} if status_filter else {}
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_events(db, query, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="events.{format}"'}
+    )
+
+@router.post("/import")
+async def import_event_list(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Create or update events from a CSV or NDJSON file keyed by externalId (admin only)"""
+    
+    # In a real app, check for admin privileges here
+    
+    # The upload is spooled to disk, so rows are parsed as they are read
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        report = await import_events(
+            db, iter_rows(stream, detect_format(file.filename, format)), publish_registration_update
+        )
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Could not parse file: {e}"
         )
-        event_responses.append(event_response)
+    finally:
+        stream.detach()
     
-    return event_responses
+    scheduler.wake(EVENT_LIFECYCLE_JOB)
+    return report.dict()
 
 @router.get("/{event_id}", response_model=EventResponse)
 async def get_event(
@@ -79,13 +230,19 @@ async def get_event(
 ):
     """Get specific event by ID"""
     
-    event = await db.events.find_one({"_id": event_id})
+    event = await db.events.find_one({"_id": event_id}, EVENT_RESPONSE_PROJECTION)
     if not event:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
         )
     
+    registered = False
+    if current_user:
+        registered = await db.event_registrations.find_one(
+            {"_id": registration_id(event_id, current_user.id)}, {"_id": 1}
+        ) is not None
+    
     return EventResponse(
         id=event["_id"],
         name=event["name"],
@@ -99,7 +256,9 @@ async def get_event(
         price=event["price"],
         registrationDeadline=event["registrationDeadline"],
         status=event["status"],
-        registrations=len(event.get("registrations", [])),
+        registrations=event.get("registrationCount", 0),
+        waitlistCount=event.get("waitlistCount", 0),
+        registered=registered,
         results=event.get("results")
     )
 
@@ -124,10 +283,14 @@ async def create_event(
         maxCapacity=event_data.maxCapacity,
         memberOnly=event_data.memberOnly,
         price=event_data.price,
-        registrationDeadline=event_data.registrationDeadline
+        registrationDeadline=event_data.registrationDeadline,
+        externalId=event_data.externalId,
+        nameLower=event_data.name.lower(),
+        **event_schedule_fields(event_data.date, event_data.time)
     )
     
-    result = await db.events.insert_one(new_event.dict(by_alias=True))
+    result = await db.events.insert_one(event_document(new_event))
+    scheduler.wake(EVENT_LIFECYCLE_JOB)
     
     return EventResponse(
         id=str(result.inserted_id),
@@ -146,16 +309,19 @@ async def create_event(
         results=new_event.results
     )
 
+# Attempts at registering or joining the waitlist while seats change hands
+REGISTER_ATTEMPTS = 3
+
 @router.post("/{event_id}/register")
 async def register_for_event(
     event_id: str,
     db: AsyncIOMotorDatabase = Depends(get_database),
     current_user: UserResponse = Depends(get_current_user)
 ):
-    """Register current user for an event"""
+    """Register current user for an event, or join its waitlist when it is full"""
     
     # Get event
-    event = await db.events.find_one({"_id": event_id})
+    event = await db.events.find_one({"_id": event_id}, {"name": 1, "memberOnly": 1})
     if not event:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -169,38 +335,84 @@ async def register_for_event(
             detail="This event requires premium or elite membership"
         )
     
-    # Check if event is full
-    current_registrations = len(event.get("registrations", []))
-    if current_registrations >= event["maxCapacity"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Event is full"
-        )
+    not_entered = {
+        "_id": event_id,
+        "registrations.userId": {"$ne": current_user.id},
+        "waitlist.userId": {"$ne": current_user.id}
+    }
+    
+    # The lookup record goes in before the seat is taken, so a failure in
+    # between cannot leave a seat without one; it is removed again unless
+    # this request wins the seat
+    registered_at = datetime.utcnow()
+    recorded = await record_registration(db, event_id, current_user.id, registered_at)
+    seated = False
+    try:
+        for _ in range(REGISTER_ATTEMPTS):
+            # Take a seat if one is free and nobody is queueing for it
+            new_registration = EventRegistration(
+                userId=current_user.id,
+                registrationDate=registered_at
+            )
+            updated_event = await db.events.find_one_and_update(
+                {**not_entered, **HAS_FREE_SEAT},
+                {
+                    "$push": {"registrations": new_registration.dict()},
+                    "$inc": {"registrationCount": 1}
+                },
+                projection=REGISTRATION_COUNT_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+            if updated_event:
+                seated = True
+                publish_registration_update(updated_event)
+                return {
+                    "message": "Successfully registered for event",
+                    "eventName": event["name"],
+                    "registrationDate": new_registration.registrationDate,
+                    "waitlisted": False
+                }
+        
+            # Seats left free while people queue (e.g. capacity was raised) go to the queue first
+            publish_registration_update(await promote_waitlist(db, event_id))
+        
+            # Otherwise queue, unless a seat was freed since the attempt above
+            entry = WaitlistEntry(userId=current_user.id)
+            updated_event = await db.events.find_one_and_update(
+                {**not_entered, **NO_FREE_SEAT},
+                {"$push": {"waitlist": entry.dict()}, "$inc": {"waitlistCount": 1}},
+                projection={"waitlistCount": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if updated_event:
+                return {
+                    "message": "Event is full; you have been added to the waitlist",
+                    "eventName": event["name"],
+                    "waitlisted": True,
+                    "position": updated_event["waitlistCount"]
+                }
+        
+            # Neither matched: already entered, or seats changed hands meanwhile
+            entered = await db.events.find_one(
+                {"_id": event_id, "$or": [
+                    {"registrations.userId": current_user.id},
+                    {"waitlist.userId": current_user.id}
+                ]},
+                {"_id": 1}
+            )
+            if entered:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Already registered for this event or on its waitlist"
+                )
     
-    # Check if user is already registered
-    registrations = event.get("registrations", [])
-    if any(reg["userId"] == current_user.id for reg in registrations):
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Already registered for this event"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Registration is busy, please try again"
         )
-    
-    # Add registration
-    new_registration = EventRegistration(
-        userId=current_user.id,
-        registrationDate=datetime.utcnow()
-    )
-    
-    await db.events.update_one(
-        {"_id": event_id},
-        {"$push": {"registrations": new_registration.dict()}}
-    )
-    
-    return {
-        "message": "Successfully registered for event",
-        "eventName": event["name"],
-        "registrationDate": new_registration.registrationDate
-    }
+    finally:
+        if recorded and not seated:
+            await db.event_registrations.delete_one({"_id": registration_id(event_id, current_user.id)})
 
 @router.delete("/{event_id}/register")
 async def unregister_from_event(
@@ -208,21 +420,71 @@ async def unregister_from_event(
     db: AsyncIOMotorDatabase = Depends(get_database),
     current_user: UserResponse = Depends(get_current_user)
 ):
-    """Unregister current user from an event"""
+    """Unregister current user from an event or its waitlist"""
     
-    # Remove registration
-    result = await db.events.update_one(
-        {"_id": event_id},
-        {"$pull": {"registrations": {"userId": current_user.id}}}
+    # Free the seat and promote the head of the waitlist in one update
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    updated_event = await db.events.find_one_and_update(
+        {"_id": event_id, "registrations.userId": current_user.id},
+        unregister_and_promote(current_user.id, now, token),
+        projection={**REGISTRATION_COUNT_PROJECTION, "lastPromotion": 1},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.modified_count == 0:
+    if updated_event is not None:
+        await db.event_registrations.delete_one({"_id": registration_id(event_id, current_user.id)})
+        promotion = updated_event.get("lastPromotion") or {}
+        if promotion.get("token") == token:
+            await record_registration(db, event_id, promotion["userId"], now)
+        publish_registration_update(updated_event)
+        return {"message": "Successfully unregistered from event"}
+    
+    # Not registered, so leave the waitlist instead
+    updated_event = await db.events.find_one_and_update(
+        {"_id": event_id, "waitlist.userId": current_user.id},
+        {"$pull": {"waitlist": {"userId": current_user.id}}, "$inc": {"waitlistCount": -1}},
+        projection={"_id": 1}
+    )
+    if updated_event is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Registration not found or event not found"
         )
     
-    return {"message": "Successfully unregistered from event"}
+    return {"message": "Successfully left the waitlist"}
+
+@router.get("/{event_id}/waitlist/position", response_model=WaitlistPosition)
+async def get_waitlist_position(
+    event_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Get the current user's place on an event's waitlist"""
+    
+    # Computed in the database so the waitlist array is not sent over
+    positions = await db.events.aggregate([
+        {"$match": {"_id": event_id}},
+        {"$project": {
+            "index": {"$indexOfArray": [{"$ifNull": ["$waitlist.userId", []]}, current_user.id]},
+            "registered": {"$in": [current_user.id, {"$ifNull": ["$registrations.userId", []]}]},
+            "waitlistCount": {"$ifNull": ["$waitlistCount", 0]}
+        }}
+    ]).to_list(length=1)
+    if not positions:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found"
+        )
+    
+    found = positions[0]
+    return WaitlistPosition(
+        eventId=event_id,
+        registered=found["registered"],
+        waitlisted=found["index"] >= 0,
+        position=found["index"] + 1 if found["index"] >= 0 else None,
+        waitlistLength=found["waitlistCount"]
+    )
 
 @router.get("/{event_id}/registrations")
 async def get_event_registrations(
@@ -241,10 +503,16 @@ async def get_event_registrations(
     
     registrations = event.get("registrations", [])
     
-    # Get user details for each registration
+    # Get user details for all registrants in one query
+    users_cursor = db.users.find(
+        {"_id": {"$in": [reg["userId"] for reg in registrations]}},
+        {"name": 1, "email": 1, "membershipType": 1}
+    )
+    users = {user["_id"]: user async for user in users_cursor}
+    
     registration_details = []
     for reg in registrations:
-        user = await db.users.find_one({"_id": reg["userId"]})
+        user = users.get(reg["userId"])
         if user:
             registration_details.append({
                 "userId": reg["userId"],
@@ -1,22 +1,40 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
 from typing import List
 from datetime import datetime
 from models import MembershipPlanResponse, UserResponse, MembershipStats
-from auth import get_current_user, get_optional_current_user
+from auth import get_current_user, get_optional_current_user, evict_cached_users
 from database import get_database
-from utils import generate_qr_code, create_qr_data
+from cards import ensure_card, schedule_card_render
+from member_stats import record_member_change
+from utils import plan_expiry
+from cache import cache
 
 router = APIRouter(prefix="/membership", tags=["membership"])
 
+# Plans only change with a deploy; stats move with every signup, so they live briefly
+PLANS_CACHE_KEY = "membership-plans"
+PLANS_CACHE_TTL_SECONDS = 300
+STATS_CACHE_KEY = "membership-stats"
+STATS_CACHE_TTL_SECONDS = 30
+
+async def load_active_plans(db: AsyncIOMotorDatabase) -> List[dict]:
+    plans_cursor = db.membership_plans.find(
+        {"active": True},
+        {"_id": 0, "planId": 1, "name": 1, "price": 1, "duration": 1, "features": 1, "popular": 1}
+    ).sort("price", 1)
+    return await plans_cursor.to_list(length=10)
+
 @router.get("/plans", response_model=List[MembershipPlanResponse])
 async def get_membership_plans(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get all active membership plans"""
     
-    plans_cursor = db.membership_plans.find({"active": True}).sort("price", 1)
-    plans = await plans_cursor.to_list(length=10)
+    plans = await cache.get_or_load(
+        PLANS_CACHE_KEY, lambda: load_active_plans(db), PLANS_CACHE_TTL_SECONDS
+    )
     
     plan_responses = []
     for plan in plans:
@@ -55,34 +73,42 @@ async def subscribe_to_plan(
             detail="Membership plan not found"
         )
     
-    # Update user's membership type
-    await db.users.update_one(
+    # Start a new membership period on the chosen plan
+    now = datetime.utcnow()
+    expires_at = plan_expiry(plan["duration"], now)
+    
+    # Update user's membership type; the card is re-rendered for the new version
+    before = await db.users.find_one_and_update(
         {"_id": current_user.id},
         {
             "$set": {
                 "membershipType": plan_id,
                 "membershipStatus": "active",
-                "updatedAt": datetime.utcnow()
-            }
-        }
-    )
-    
-    # Generate new QR code for the user
-    qr_data = create_qr_data("member", current_user.id, plan_id)
-    qr_code_image = generate_qr_code(qr_data)
-    
-    # Update user's QR code
-    await db.users.update_one(
-        {"_id": current_user.id},
-        {"$set": {"qrCode": qr_code_image}}
+                "membershipExpiresAt": expires_at
+            },
+            "$currentDate": {"updatedAt": True},
+            "$inc": {"cardVersion": 1}
+        },
+        projection={"membershipType": 1, "membershipStatus": 1, "cardVersion": 1},
+        return_document=ReturnDocument.BEFORE
     )
+    user = {
+        **before,
+        "membershipType": plan_id,
+        "membershipStatus": "active",
+        "cardVersion": before.get("cardVersion", 0) + 1
+    }
+    await record_member_change(db, before, user)
+    await evict_cached_users(current_user.email)
+    schedule_card_render(db, user)
     
     return {
         "message": f"Successfully subscribed to {plan['name']}",
         "planName": plan["name"],
         "planId": plan_id,
         "price": plan["price"],
-        "qrCode": qr_code_image
+        "expiresAt": expires_at,
+        "cardVersion": user["cardVersion"]
     }
 
 @router.get("/card/{user_id}")
@@ -118,7 +144,8 @@ async def get_membership_card(
         "membershipType": user["membershipType"],
         "membershipStatus": user["membershipStatus"],
         "joinDate": user["joinDate"],
-        "qrCode": user.get("qrCode"),
+        "expiresAt": user.get("membershipExpiresAt"),
+        "qrCode": await ensure_card(db, user),
         "planDetails": {
             "name": plan["name"] if plan else "Basic Membership",
             "features": plan["features"] if plan else [],
@@ -132,6 +159,12 @@ async def get_membership_stats(
 ):
     """Get membership statistics"""
     
+    stats = await cache.get_or_load(
+        STATS_CACHE_KEY, lambda: load_membership_stats(db), STATS_CACHE_TTL_SECONDS
+    )
+    return MembershipStats(**stats)
+
+async def load_membership_stats(db: AsyncIOMotorDatabase) -> dict:
     # Get total members
     total_members = await db.users.count_documents({})
     
@@ -150,7 +183,7 @@ async def get_membership_stats(
         activeEvents=active_events,
         completedEvents=completed_events,
         trainingHours=training_hours
-    )
+    ).dict()
 
 @router.get("/my-card")
 async def get_my_membership_card(
@@ -177,7 +210,8 @@ async def get_my_membership_card(
         "membershipType": user["membershipType"],
         "membershipStatus": user["membershipStatus"],
         "joinDate": user["joinDate"],
-        "qrCode": user.get("qrCode"),
+        "expiresAt": user.get("membershipExpiresAt"),
+        "qrCode": await ensure_card(db, user),
         "planDetails": {
             "name": plan["name"] if plan else "Basic Membership",
             "features": plan["features"] if plan else [],
@@ -192,15 +226,14 @@ async def generate_new_membership_card(
 ):
     """Generate a new membership card with QR code"""
     
-    # Generate new QR code
-    qr_data = create_qr_data("member", current_user.id, current_user.membershipType.value)
-    qr_code_image = generate_qr_code(qr_data)
-    
-    # Update user's QR code in database
-    await db.users.update_one(
+    # A new card version makes the stored image stale and renders a fresh one
+    user = await db.users.find_one_and_update(
         {"_id": current_user.id},
-        {"$set": {"qrCode": qr_code_image, "updatedAt": datetime.utcnow()}}
+        {"$inc": {"cardVersion": 1}, "$currentDate": {"updatedAt": True}},
+        projection={"membershipType": 1, "cardVersion": 1},
+        return_document=ReturnDocument.AFTER
     )
+    qr_code_image = await ensure_card(db, user)
     
     return {
         "message": "New membership card generated successfully",
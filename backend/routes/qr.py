@@ -1,11 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import Optional
 from models import QRCodeGenerate, QRCodeResponse, QRScanRequest, QRScanResponse, UserResponse
 from auth import get_current_user, get_optional_current_user
 from database import get_database
-from utils import generate_qr_code, create_qr_data, validate_qr_code
-from datetime import datetime
+from bulk import export_access_logs, gzip_chunks
+from cards import ensure_card
+from member_ids import is_mistyped_member_id
+from utils import (
+    render_qr_code, create_qr_data, validate_qr_code, parse_qr_data, membership_is_current,
+    gate_member_entry, pack_gate_snapshot, datetime_to_version, version_to_datetime
+)
+from datetime import datetime, timedelta
+import os
+
+# The first poll after a snapshot re-reads this far behind its version. A
+# write stamped before the snapshot was read but committed after it still
+# lands inside the window and is delivered.
+GATE_DELTA_OVERLAP_SECONDS = float(os.environ.get("GATE_DELTA_OVERLAP_SECONDS", "60"))
+
+GATE_PROJECTION = {
+    "memberId": 1,
+    "membershipStatus": 1,
+    "membershipType": 1,
+    "membershipExpiresAt": 1,
+    "updatedAt": 1
+}
 
 router = APIRouter(prefix="/qr", tags=["qr_codes"])
 
@@ -36,15 +57,11 @@ async def generate_qr_code_endpoint(
     # Create QR code data
     qr_code_data = create_qr_data(qr_data.type, qr_data.userId, user.get("membershipType"))
     
-    # Generate QR code image
-    qr_code_image = generate_qr_code(qr_code_data)
-    
-    # Update user's QR code in database if it's a member card
+    # Member cards are stored per card version; other codes are rendered on demand
     if qr_data.type == "member":
-        await db.users.update_one(
-            {"_id": qr_data.userId},
-            {"$set": {"qrCode": qr_code_image, "updatedAt": datetime.utcnow()}}
-        )
+        qr_code_image = await ensure_card(db, user)
+    else:
+        qr_code_image = await render_qr_code(qr_code_data)
     
     return QRCodeResponse(
         qrCode=qr_code_image,
@@ -79,7 +96,7 @@ async def generate_qr_code_by_params(
     qr_code_data = create_qr_data(qr_type, user_id, user.get("membershipType"))
     
     # Generate QR code image
-    qr_code_image = generate_qr_code(qr_code_data)
+    qr_code_image = await render_qr_code(qr_code_data)
     
     return QRCodeResponse(
         qrCode=qr_code_image,
@@ -98,23 +115,14 @@ async def scan_qr_code(
         # Parse QR code data
         qr_data = scan_request.qrCode
         
-        # Validate QR code format
-        if not (qr_data.startswith("NT-ACCESS-") or qr_data.startswith("NT-MEMBER-")):
-            return QRScanResponse(
-                valid=False,
-                message="Invalid QR code format"
-            )
-        
-        # Extract user ID from QR code
-        parts = qr_data.split("-")
-        if len(parts) < 3:
+        # Validate QR code format and extract user ID
+        user_id = parse_qr_data(qr_data)
+        if not user_id:
             return QRScanResponse(
                 valid=False,
                 message="Invalid QR code format"
             )
         
-        user_id = parts[2]
-        
         # Find user in database
         user = await db.users.find_one({"_id": user_id})
         if not user:
@@ -123,8 +131,8 @@ async def scan_qr_code(
                 message="User not found"
             )
         
-        # Check membership status
-        if user.get("membershipStatus") != "active":
+        # Check membership status and expiry
+        if not membership_is_current(user, datetime.utcnow()):
             return QRScanResponse(
                 valid=False,
                 message="Membership is not active"
@@ -197,6 +205,13 @@ async def verify_member_access(
             detail="Member ID is required"
         )
     
+    # A misread or mistyped id fails its check digits without a lookup
+    if is_mistyped_member_id(str(member_id)):
+        return {
+            "valid": False,
+            "message": "Member ID is mistyped"
+        }
+    
     # Find user by member ID
     user = await db.users.find_one({"memberId": member_id})
     if not user:
@@ -205,19 +220,21 @@ async def verify_member_access(
             "message": "Member not found"
         }
     
-    # Check membership status
-    if user.get("membershipStatus") != "active":
+    # Check membership status and expiry
+    if not membership_is_current(user, datetime.utcnow()):
         return {
             "valid": False,
             "message": "Membership is not active"
         }
     
-    # Log access
+    # Log access; scannedAt is the time every log is filtered and sorted on
+    now = datetime.utcnow()
     access_log = {
         "userId": user["_id"],
         "memberId": member_id,
         "accessType": "facility",
-        "accessedAt": datetime.utcnow(),
+        "accessedAt": now,
+        "scannedAt": now,
         "verifiedById": current_user.id if current_user else None,
         "valid": True
     }
@@ -256,7 +273,120 @@ async def get_access_logs(
             "error": log.get("error")
         })
     
-    return {
+    return ORJSONResponse({
         "totalLogs": len(formatted_logs),
         "logs": formatted_logs
+    })
+
+@router.get("/access-logs/export")
+async def export_access_log_list(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: Optional[str] = Query(None, alias="userId"),
+    valid: Optional[bool] = None,
+    compress: bool = False,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Stream access logs as CSV or NDJSON, optionally gzipped (admin only)"""
+    
+    # In a real app, check for admin privileges here
+    
+    query = {}
+    if start or end:
+        query["scannedAt"] = {}
+        if start:
+            query["scannedAt"]["$gte"] = start
+        if end:
+            query["scannedAt"]["$lt"] = end
+    if user_id:
+        query["userId"] = user_id
+    if valid is not None:
+        query["valid"] = valid
+    
+    body = export_access_logs(db, query, format)
+    filename = f"access-logs.{format}"
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    if compress:
+        body = gzip_chunks(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/gate/snapshot")
+async def get_gate_snapshot(
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Export a compact binary snapshot of member access status for gate devices"""
+    
+    # In a real app, check for gate device or admin privileges here
+    
+    # The snapshot version is the newest updatedAt across all members
+    latest = await db.users.find_one({}, {"updatedAt": 1}, sort=[("updatedAt", -1)])
+    version = datetime_to_version(latest.get("updatedAt")) if latest else 0
+    etag = f'"{version}"'
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    # Changes racing with the scan are newer than the version read above, so
+    # devices replay them from the delta feed instead of missing them
+    entries = []
+    async for user in db.users.find({}, GATE_PROJECTION):
+        entries.append(gate_member_entry(user))
+    
+    return Response(
+        content=pack_gate_snapshot(entries, version),
+        media_type="application/octet-stream",
+        headers={"ETag": etag, "X-Snapshot-Version": str(version)}
+    )
+
+@router.get("/gate/delta")
+async def get_gate_delta(
+    since: int = Query(0, ge=0, description="Snapshot or delta version to resume from"),
+    after: Optional[str] = Query(None, description="Cursor from the previous poll; omitted only when resuming from a snapshot"),
+    limit: int = Query(1000, ge=1, le=5000),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get member access changes since a snapshot or delta version"""
+    
+    # In a real app, check for gate device or admin privileges here
+    
+    # Changes are ordered by (updatedAt, _id) so a page can end in the middle
+    # of a bulk update sharing one timestamp without skipping the rest of it.
+    # Only a device resuming from a snapshot has no cursor yet; it starts an
+    # overlap window back and re-applies the entries it already has.
+    since_dt = version_to_datetime(since)
+    if after:
+        query = {"$or": [
+            {"updatedAt": {"$gt": since_dt}},
+            {"updatedAt": since_dt, "_id": {"$gt": after}}
+        ]}
+    else:
+        query = {"updatedAt": {"$gt": since_dt - timedelta(seconds=GATE_DELTA_OVERLAP_SECONDS)}}
+    
+    users_cursor = db.users.find(query, GATE_PROJECTION).sort(
+        [("updatedAt", 1), ("_id", 1)]
+    ).limit(limit + 1)
+    users = await users_cursor.to_list(length=limit + 1)
+    
+    has_more = len(users) > limit
+    users = users[:limit]
+    
+    # The cursor is the last entry returned; with nothing new it stays put
+    return {
+        "since": since,
+        "version": datetime_to_version(users[-1]["updatedAt"]) if users else since,
+        "after": users[-1]["_id"] if users else after,
+        "hasMore": has_more,
+        "members": [gate_member_entry(user) for user in users]
     }
\ No newline at end of file
@@ -0,0 +1,224 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi.responses import ORJSONResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import List, Optional
+from datetime import datetime
+from models import ResultCreate, LeaderboardEntry, PersonalBest, UserResponse
+from auth import get_current_user
+from database import get_database
+from results import ALL_AGE_GROUPS, DISCIPLINES, build_result, save_results, season_of, summarize_event_results
+from bulk import detect_format, iter_rows, ingest_results
+import csv
+import io
+
+router = APIRouter(prefix="/results", tags=["results"])
+
+# Leaderboards read the materialized bests table; these fields are all they show
+LEADERBOARD_PROJECTION = {
+    "userId": 1, "athleteName": 1, "memberId": 1, "mark": 1, "wind": 1,
+    "ageGroup": 1, "gender": 1, "eventId": 1, "competedAt": 1, "sortKey": 1
+}
+
+def check_discipline(discipline: str):
+    if discipline not in DISCIPLINES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown discipline"
+        )
+
+@router.post("/")
+async def record_results(
+    entries: List[ResultCreate],
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Record results and update personal and season bests (admin only)"""
+    
+    # In a real app, check for admin privileges here
+    
+    # Events and athletes for the whole batch in two reads
+    events = {
+        event["_id"]: event async for event in db.events.find(
+            {"_id": {"$in": list({entry.eventId for entry in entries})}}, {"startsAt": 1}
+        )
+    }
+    athletes = {
+        user["_id"]: user async for user in db.users.find(
+            {"_id": {"$in": list({entry.userId for entry in entries})}}, {"name": 1, "memberId": 1}
+        )
+    }
+    
+    # Nothing is written unless every entry is valid
+    results = []
+    errors = []
+    for index, entry in enumerate(entries):
+        if entry.eventId not in events:
+            errors.append({"index": index, "message": "Event not found"})
+        elif entry.userId not in athletes:
+            errors.append({"index": index, "message": "Athlete not found"})
+        else:
+            try:
+                results.append(build_result(entry, events[entry.eventId], athletes[entry.userId]))
+            except ValueError as error:
+                errors.append({"index": index, "message": str(error)})
+    if errors:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=errors
+        )
+    
+    await save_results(db, results)
+    await summarize_event_results(db, {result["eventId"] for result in results})
+    
+    return {"message": "Results recorded", "recorded": len(results)}
+
+@router.post("/ingest")
+async def ingest_result_file(
+    event_id: str = Query(..., alias="eventId"),
+    discipline: Optional[str] = Query(None, description="For files that do not name it per row"),
+    round: Optional[str] = Query(None, description="Applies to every row; required for LIF files, which only number their rounds"),
+    age_group: str = Query("Open", alias="ageGroup"),
+    gender: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson|lif)$"),
+    file: UploadFile = File(...),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Load a timing-system result file into an event's results (admin only)"""
+    
+    # In a real app, check for admin privileges here
+    
+    if discipline:
+        check_discipline(discipline)
+    fmt = detect_format(file.filename, format)
+    if fmt == "lif" and not round:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="LIF files only number their rounds; pass round, such as heats or final"
+        )
+    defaults = {"eventId": event_id, "discipline": discipline, "ageGroup": age_group, "gender": gender}
+    
+    # The upload is spooled to disk, so rows are parsed as they are read
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        report = await ingest_results(
+            db, iter_rows(stream, fmt),
+            {key: value for key, value in defaults.items() if value is not None},
+            {"round": round} if round else None
+        )
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Could not parse file: {e}"
+        )
+    finally:
+        stream.detach()
+    
+    return report.dict()
+
+@router.get("/leaderboard", response_model=List[LeaderboardEntry])
+async def get_leaderboard(
+    discipline: str,
+    season: Optional[str] = Query(None, description="Defaults to the current season"),
+    all_time: bool = Query(False, alias="allTime", description="Rank personal bests instead of season bests"),
+    age_group: Optional[str] = Query(None, alias="ageGroup"),
+    gender: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Best athletes in a discipline for a season or of all time"""
+    
+    check_discipline(discipline)
+    
+    # Equality filters plus the sort key, so each leaderboard is one index range
+    query = {
+        "discipline": discipline,
+        "scope": "pb" if all_time else season or season_of(datetime.utcnow()),
+        "rankingGroup": age_group or ALL_AGE_GROUPS
+    }
+    if gender:
+        query["gender"] = gender
+    
+    bests_cursor = db.personal_bests.find(query, LEADERBOARD_PROJECTION).sort("sortKey", 1).limit(limit)
+    bests = await bests_cursor.to_list(length=limit)
+    
+    # Equal marks share a rank
+    entries = []
+    for position, best in enumerate(bests, start=1):
+        tied = entries and best["sortKey"] == bests[position - 2]["sortKey"]
+        entries.append({
+            "rank": entries[-1]["rank"] if tied else position,
+            "userId": best["userId"],
+            "athleteName": best["athleteName"],
+            "memberId": best["memberId"],
+            "mark": best["mark"],
+            "wind": best.get("wind"),
+            "ageGroup": best["ageGroup"],
+            "gender": best.get("gender"),
+            "eventId": best["eventId"],
+            "competedAt": best["competedAt"]
+        })
+    
+    return ORJSONResponse(entries)
+
+@router.get("/athletes/{user_id}/bests", response_model=List[PersonalBest])
+async def get_athlete_bests(
+    user_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Personal and season bests of one athlete in every discipline"""
+    
+    bests_cursor = db.personal_bests.find(
+        {"userId": user_id, "rankingGroup": ALL_AGE_GROUPS},
+        {"discipline": 1, "scope": 1, "mark": 1, "wind": 1, "eventId": 1, "competedAt": 1}
+    ).sort([("discipline", 1), ("scope", -1)])
+    bests = await bests_cursor.to_list(length=None)
+    
+    return ORJSONResponse([
+        {
+            "discipline": best["discipline"],
+            "scope": best["scope"],
+            "mark": best["mark"],
+            "wind": best.get("wind"),
+            "eventId": best["eventId"],
+            "competedAt": best["competedAt"]
+        }
+        for best in bests
+    ])
+
+@router.get("/events/{event_id}")
+async def get_event_results(
+    event_id: str,
+    discipline: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Results of an event in placing order, by discipline, round and heat"""
+    
+    query = {"eventId": event_id}
+    if discipline:
+        check_discipline(discipline)
+        query["discipline"] = discipline
+    
+    results_cursor = db.results.find(
+        query,
+        {"discipline": 1, "round": 1, "heat": 1, "placing": 1, "userId": 1, "athleteName": 1,
+         "memberId": 1, "mark": 1, "wind": 1, "ageGroup": 1, "gender": 1}
+    ).sort([("discipline", 1), ("round", 1), ("heat", 1), ("placing", 1)])
+    results = await results_cursor.to_list(length=None)
+    
+    return ORJSONResponse([
+        {
+            "discipline": result["discipline"],
+            "round": result["round"],
+            "heat": result.get("heat"),
+            "placing": result.get("placing"),
+            "userId": result["userId"],
+            "athleteName": result["athleteName"],
+            "memberId": result["memberId"],
+            "mark": result["mark"],
+            "wind": result.get("wind"),
+            "ageGroup": result["ageGroup"],
+            "gender": result.get("gender")
+        }
+        for result in results
+    ])
@@ -0,0 +1,106 @@
+from fastapi import APIRouter, Depends, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import List, Optional
+from models import SearchHit, SearchResponse, EventSuggestion
+from database import get_database
+from utils import format_timestamp
+import asyncio
+import re
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+TEXT_SCORE = {"$meta": "textScore"}
+
+async def search_events(db: AsyncIOMotorDatabase, q: str, limit: int) -> List[SearchHit]:
+    """Get the best scoring events for a text query"""
+    
+    events_cursor = db.events.find(
+        {"$text": {"$search": q}},
+        {"name": 1, "date": 1, "location": 1, "score": TEXT_SCORE}
+    ).sort([("score", TEXT_SCORE)]).limit(limit)
+    events = await events_cursor.to_list(length=limit)
+    
+    return [
+        SearchHit(
+            type="event",
+            id=event["_id"],
+            title=event["name"],
+            subtitle=f"{event['date']} · {event['location']}",
+            score=event["score"]
+        )
+        for event in events
+    ]
+
+async def search_posts(db: AsyncIOMotorDatabase, q: str, limit: int) -> List[SearchHit]:
+    """Get the best scoring community posts for a text query"""
+    
+    posts_cursor = db.community_posts.find(
+        {"$text": {"$search": q}},
+        {"title": 1, "author": 1, "createdAt": 1, "score": TEXT_SCORE}
+    ).sort([("score", TEXT_SCORE)]).limit(limit)
+    posts = await posts_cursor.to_list(length=limit)
+    
+    return [
+        SearchHit(
+            type="post",
+            id=post["_id"],
+            title=post["title"],
+            subtitle=f"{post['author']} · {format_timestamp(post['createdAt'])}",
+            score=post["score"]
+        )
+        for post in posts
+    ]
+
+@router.get("", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=100),
+    type: Optional[str] = Query(None, description="Restrict to: events, posts"),
+    limit: int = Query(10, ge=1, le=50),
+    skip: int = Query(0, ge=0, le=200),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Search events and community posts, ranked by relevance"""
+    
+    # Each collection only has to produce its top skip + limit hits for the
+    # merged page to be exact
+    window = skip + limit
+    searches = []
+    if type in (None, "events"):
+        searches.append(search_events(db, q, window))
+    if type in (None, "posts"):
+        searches.append(search_posts(db, q, window))
+    
+    results = await asyncio.gather(*searches)
+    hits = sorted(
+        (hit for result in results for hit in result),
+        key=lambda hit: hit.score,
+        reverse=True
+    )
+    
+    return SearchResponse(
+        query=q,
+        skip=skip,
+        limit=limit,
+        hits=hits[skip:window]
+    )
+
+@router.get("/events/autocomplete", response_model=List[EventSuggestion])
+async def autocomplete_events(
+    prefix: str = Query(..., min_length=1, max_length=50),
+    limit: int = Query(10, ge=1, le=20),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Suggest events whose name starts with the given prefix"""
+    
+    # An anchored, case-sensitive regex on the lowercased name is answered
+    # from the nameLower index bounds
+    events_cursor = db.events.find(
+        {"nameLower": {"$regex": f"^{re.escape(prefix.lower())}"}},
+        {"name": 1, "date": 1}
+    ).sort("nameLower", 1).limit(limit)
+    events = await events_cursor.to_list(length=limit)
+    
+    return [
+        EventSuggestion(id=event["_id"], name=event["name"], date=event["date"])
+        for event in events
+    ]
@@ -0,0 +1,142 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Optional
+from datetime import datetime
+from models import (
+    MemberDirectoryPage, MemberCounts, MembershipType, MembershipStatus, UserResponse
+)
+from auth import get_current_user
+from database import get_database
+from member_stats import get_member_counts
+import base64
+import json
+import re
+
+router = APIRouter(prefix="/users", tags=["users"])
+
+# Directory fields only; password hashes and QR images never leave the database
+DIRECTORY_PROJECTION = {
+    "name": 1, "email": 1, "memberId": 1, "membershipType": 1,
+    "membershipStatus": 1, "joinDate": 1, "avatar": 1, "nameLower": 1
+}
+
+# Sort orders and the key each one pages on
+DIRECTORY_SORTS = {
+    "joinDate": ("joinDate", -1),  # Newest members first
+    "name": ("nameLower", 1),
+}
+
+def encode_cursor(value, last_id: str) -> str:
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps({"v": value, "id": last_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str):
+    """Return the sort value and id the previous page ended on"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = data["v"]
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["$date"])
+        return value, data["id"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+def directory_entry_dict(user: dict) -> dict:
+    """Shape a projected user document like MemberDirectoryEntry"""
+    return {
+        "id": user["_id"],
+        "name": user["name"],
+        "email": user["email"],
+        "memberId": user["memberId"],
+        "membershipType": user["membershipType"],
+        "membershipStatus": user["membershipStatus"],
+        "joinDate": user["joinDate"],
+        "avatar": user.get("avatar")
+    }
+
+@router.get("", response_model=MemberDirectoryPage)
+async def list_members(
+    membership_type: Optional[MembershipType] = Query(None, alias="membershipType"),
+    membership_status: Optional[MembershipStatus] = Query(None, alias="membershipStatus"),
+    joined_after: Optional[datetime] = Query(None, alias="joinedAfter"),
+    joined_before: Optional[datetime] = Query(None, alias="joinedBefore"),
+    name_prefix: Optional[str] = Query(None, alias="namePrefix", min_length=1, max_length=50),
+    sort: str = Query("joinDate", pattern="^(joinDate|name)$"),
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """List members with filters and keyset pagination (admin only)"""
+    
+    # In a real app, check for admin privileges here
+    
+    conditions = []
+    if membership_type:
+        conditions.append({"membershipType": membership_type})
+    if membership_status:
+        conditions.append({"membershipStatus": membership_status})
+    if joined_after or joined_before:
+        join_range = {}
+        if joined_after:
+            join_range["$gte"] = joined_after
+        if joined_before:
+            join_range["$lt"] = joined_before
+        conditions.append({"joinDate": join_range})
+    if name_prefix:
+        # Anchored, case-folded prefix so the nameLower index bounds the scan
+        conditions.append({"nameLower": {"$regex": f"^{re.escape(name_prefix.lower())}"}})
+    
+    # Continue after the last member of the previous page
+    sort_field, direction = DIRECTORY_SORTS[sort]
+    if after:
+        value, last_id = decode_cursor(after)
+        beyond = "$lt" if direction < 0 else "$gt"
+        conditions.append({"$or": [
+            {sort_field: {beyond: value}},
+            {sort_field: value, "_id": {beyond: last_id}}
+        ]})
+    
+    query = {"$and": conditions} if conditions else {}
+    users_cursor = db.users.find(query, DIRECTORY_PROJECTION).sort(
+        [(sort_field, direction), ("_id", direction)]
+    ).limit(limit + 1)
+    users = await users_cursor.to_list(length=limit + 1)
+    
+    # The extra document only tells us whether another page exists
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        next_cursor = encode_cursor(last.get(sort_field), last["_id"])
+    
+    return ORJSONResponse({
+        "members": [directory_entry_dict(user) for user in users],
+        "nextCursor": next_cursor
+    })
+
+@router.get("/count", response_model=MemberCounts)
+async def count_members(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_user: UserResponse = Depends(get_current_user)
+):
+    """Member totals by type and status from the maintained counters (admin only)"""
+    
+    # In a real app, check for admin privileges here
+    
+    counts = await get_member_counts(db)
+    if not counts:
+        return MemberCounts(total=0, byType={}, byStatus={})
+    
+    return MemberCounts(
+        total=counts.get("total", 0),
+        byType=counts.get("byType", {}),
+        byStatus=counts.get("byStatus", {}),
+        updatedAt=counts.get("updatedAt")
+    )
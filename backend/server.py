@@ -1,4 +1,5 @@
 from fastapi import FastAPI, APIRouter
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -11,15 +12,23 @@ import uuid
 from datetime import datetime
 
 # Import database and routes
-from database import connect_to_mongo, close_mongo_connection, get_database
-from routes import auth, events, community, membership, qr
+from database import connect_to_mongo, close_mongo_connection, get_database, mongo_event_listeners, database
+from leader import scheduler
+from profiling import ProfilingMiddleware
+from metrics import registry, MetricsMiddleware, register_executor_gauge, record_startup_complete
+from auth import hash_executor
+from utils import qr_executor
+from cache import cache
+from routes import auth, events, community, membership, qr, search, users, results
+import expiry  # Registers the membership expiry job with the scheduler
+import lifecycle  # Registers the event lifecycle job with the scheduler
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=mongo_event_listeners)
 db = client[os.environ.get('DB_NAME', 'athletics_nt')]
 
 # Create the main app without a prefix
@@ -60,10 +69,24 @@ api_router.include_router(events.router)
 api_router.include_router(community.router)
 api_router.include_router(membership.router)
 api_router.include_router(qr.router)
+api_router.include_router(search.router)
+api_router.include_router(users.router)
+api_router.include_router(results.router)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Prometheus scrape endpoint
+register_executor_gauge("bcrypt_executor_pending", "Password hashes queued or running", hash_executor)
+register_executor_gauge("qr_render_executor_pending", "QR renders queued or running", qr_executor)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -84,9 +107,18 @@ async def startup_db_client():
     """Initialize database connection and default data"""
     await connect_to_mongo()
     logger.info("Connected to MongoDB and initialized default data")
+    
+    # Singleton background jobs run only in the worker holding the leader lease
+    await scheduler.start(database.db)
+    
+    # Hear about cache evictions made by the other workers
+    await cache.start(database.db)
+    record_startup_complete()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Close database connection"""
+    await scheduler.stop()
+    await cache.stop()
     await close_mongo_connection()
     logger.info("Disconnected from MongoDB")
@@ -1,9 +1,15 @@
 import qrcode
 import io
 import base64
-from datetime import datetime
-from typing import Optional
-import uuid
+import struct
+import asyncio
+import functools
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
 
 def generate_qr_code(data: str) -> str:
     """Generate QR code as base64 encoded PNG"""
@@ -25,9 +31,29 @@ def generate_qr_code(data: str) -> str:
     
     return f"data:image/png;base64,{img_str}"
 
-def generate_member_id() -> str:
-    """Generate unique member ID"""
-    return f"2024{str(uuid.uuid4().int)[:3]}"
+class TrackedExecutor:
+    """Thread pool for CPU-heavy work that keeps count of queued and running jobs"""
+    
+    def __init__(self, max_workers: int, name: str):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.pending = 0
+    
+    async def run(self, fn, *args, **kwargs):
+        """Run fn on the pool without blocking the event loop"""
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(fn, *args, **kwargs)
+            )
+        finally:
+            self.pending -= 1
+
+# PNG encoding holds the GIL for most of its work, so a small pool is enough
+qr_executor = TrackedExecutor(max_workers=2, name="qr-render")
+
+async def render_qr_code(data: str) -> str:
+    """Generate a QR code off the event loop"""
+    return await qr_executor.run(generate_qr_code, data)
 
 def format_timestamp(dt: datetime) -> str:
     """Format datetime to human readable string"""
@@ -45,14 +71,21 @@ def format_timestamp(dt: datetime) -> str:
     else:
         return "Just now"
 
+def parse_qr_data(qr_code: str) -> Optional[str]:
+    """Extract the user id from access or member QR code data"""
+    # QR code format: NT-ACCESS-{user_id} or NT-MEMBER-{user_id}-{membership_type}
+    # User ids are uuids, which contain hyphens themselves
+    if qr_code.startswith("NT-ACCESS-"):
+        user_id = qr_code[len("NT-ACCESS-"):]
+    elif qr_code.startswith("NT-MEMBER-"):
+        user_id = qr_code[len("NT-MEMBER-"):].rpartition("-")[0]
+    else:
+        return None
+    return user_id or None
+
 def validate_qr_code(qr_code: str, user_id: str) -> bool:
     """Validate QR code for user access"""
-    # QR code format: NT-ACCESS-{user_id} or NT-MEMBER-{user_id}-{membership_type}
-    if qr_code.startswith("NT-ACCESS-") or qr_code.startswith("NT-MEMBER-"):
-        parts = qr_code.split("-")
-        if len(parts) >= 3 and parts[2] == user_id:
-            return True
-    return False
+    return parse_qr_data(qr_code) == user_id
 
 def create_qr_data(qr_type: str, user_id: str, membership_type: Optional[str] = None) -> str:
     """Create QR code data string"""
@@ -72,4 +105,134 @@ def calculate_age_from_date(date_str: str) -> int:
         age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
         return age
     except:
-        return 0
\ No newline at end of file
+        return 0
+
+# Event dates and times are entered in local time at the venue
+EVENT_TIMEZONE = ZoneInfo(os.environ.get("EVENT_TIMEZONE", "Australia/Darwin"))
+EVENT_DATE_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%Y-%m-%d", "%d %B %Y")
+EVENT_CLOCK_TIME = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*([AaPp])\.?[Mm]\.?")
+EVENT_DEFAULT_LENGTH = timedelta(hours=2)
+
+def parse_event_date(date_str: str) -> Optional[datetime]:
+    for date_format in EVENT_DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str.strip(), date_format)
+        except ValueError:
+            continue
+    return None
+
+def parse_event_times(date_str: str, time_str: str) -> Optional[Tuple[datetime, datetime]]:
+    """Turn an event's date and time strings into naive UTC start and end times.
+    
+    Accepts times like "9:00 AM - 5:00 PM" or "6 PM"; a single time lasts
+    EVENT_DEFAULT_LENGTH and no time at all means the whole day. Returns
+    None when the date cannot be read.
+    """
+    day = parse_event_date(date_str)
+    if day is None:
+        return None
+    
+    clock_times = []
+    for hour, minute, meridiem in EVENT_CLOCK_TIME.findall(time_str or ""):
+        hour = int(hour) % 12 + (12 if meridiem.lower() == "p" else 0)
+        clock_times.append(day.replace(hour=hour, minute=int(minute or 0)))
+    
+    if not clock_times:
+        starts_at, ends_at = day, day + timedelta(days=1)
+    elif len(clock_times) == 1:
+        starts_at, ends_at = clock_times[0], clock_times[0] + EVENT_DEFAULT_LENGTH
+    else:
+        starts_at, ends_at = clock_times[0], clock_times[1]
+        if ends_at <= starts_at:
+            ends_at += timedelta(days=1)  # Runs past midnight
+    
+    def to_utc(local: datetime) -> datetime:
+        return local.replace(tzinfo=EVENT_TIMEZONE).astimezone(timezone.utc).replace(tzinfo=None)
+    
+    return to_utc(starts_at), to_utc(ends_at)
+
+def event_schedule_fields(date_str: str, time_str: str) -> dict:
+    """startsAt, endsAt and the first lifecycle transition for a new or edited event"""
+    times = parse_event_times(date_str, time_str)
+    if times is None:
+        return {"startsAt": None, "endsAt": None, "nextTransitionAt": None}
+    starts_at, ends_at = times
+    # The lifecycle job works out the actual status from the times once this is due
+    return {"startsAt": starts_at, "endsAt": ends_at, "nextTransitionAt": starts_at}
+
+def event_document(event) -> dict:
+    """An Event as stored. Only imported events carry an externalId; elsewhere
+    the key is left out rather than stored as null."""
+    return event.dict(by_alias=True, exclude=None if event.externalId else {"externalId"})
+
+def server_stamped_insert(document: dict) -> dict:
+    """Upsert-by-_id update that inserts `document` with updatedAt from the
+    server clock, like the $currentDate updates the gate delta feed relies on."""
+    fields = {key: value for key, value in document.items() if key not in ("_id", "updatedAt")}
+    return {"$setOnInsert": fields, "$currentDate": {"updatedAt": True}}
+
+# Membership period per plan duration; unknown durations never expire
+PLAN_DURATIONS = {
+    "monthly": timedelta(days=30),
+    "quarterly": timedelta(days=91),
+    "annual": timedelta(days=365),
+}
+
+def plan_expiry(duration: str, start: datetime) -> Optional[datetime]:
+    """End of a membership period of the given plan duration starting at `start`"""
+    length = PLAN_DURATIONS.get(duration.lower())
+    return start + length if length else None
+
+def membership_is_current(user: dict, now: datetime) -> bool:
+    """Gate check on stored fields: active status and an expiry still ahead, if any"""
+    expires_at = user.get("membershipExpiresAt")
+    return user.get("membershipStatus") == "active" and (expires_at is None or expires_at > now)
+
+# Gate snapshot layout: a fixed 32-byte header followed by fixed 32-byte
+# records sorted by memberId, so devices can mmap the file and binary search it.
+GATE_SNAPSHOT_MAGIC = b"NTGS"
+GATE_SNAPSHOT_FORMAT = 1
+GATE_HEADER = struct.Struct("<4sHHIq12x")  # magic, format, record size, count, version
+GATE_MEMBER_ID_BYTES = 16
+GATE_RECORD = struct.Struct(f"<{GATE_MEMBER_ID_BYTES}sBB6xq")  # memberId, status, tier, expiry (epoch seconds)
+
+GATE_STATUS_CODES = {"active": 1, "inactive": 2, "expired": 3}
+GATE_TIER_CODES = {"basic": 1, "premium": 2, "elite": 3}
+
+EPOCH = datetime(1970, 1, 1)
+
+def datetime_to_version(dt: Optional[datetime]) -> int:
+    """Convert a naive UTC datetime to a millisecond version number"""
+    if dt is None:
+        return 0
+    return (dt.replace(tzinfo=None) - EPOCH) // timedelta(milliseconds=1)
+
+def version_to_datetime(version: int) -> datetime:
+    """Convert a millisecond version number back to a naive UTC datetime"""
+    return EPOCH + timedelta(milliseconds=version)
+
+def gate_member_entry(user: dict) -> dict:
+    """Build the compact gate representation of a user document"""
+    expires_at = user.get("membershipExpiresAt")
+    return {
+        "memberId": user["memberId"],
+        "status": GATE_STATUS_CODES.get(user.get("membershipStatus"), 0),
+        "tier": GATE_TIER_CODES.get(user.get("membershipType"), 0),
+        "expiresAt": datetime_to_version(expires_at) // 1000 if expires_at else 0
+    }
+
+def pack_gate_snapshot(entries: Iterable[dict], version: int) -> bytes:
+    """Pack gate entries into the sorted binary snapshot layout"""
+    records = sorted(
+        GATE_RECORD.pack(
+            entry["memberId"].encode("ascii")[:GATE_MEMBER_ID_BYTES],
+            entry["status"],
+            entry["tier"],
+            entry["expiresAt"]
+        )
+        for entry in entries
+    )
+    header = GATE_HEADER.pack(
+        GATE_SNAPSHOT_MAGIC, GATE_SNAPSHOT_FORMAT, GATE_RECORD.size, len(records), version
+    )
+    return header + b"".join(records)
@@ -0,0 +1,119 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from datetime import datetime
+from typing import Optional
+import uuid
+
+# Projection returning the registration count without the registrations array
+REGISTRATION_COUNT_PROJECTION = {"status": 1, "registrationCount": 1, "waitlistCount": 1}
+
+HAS_FREE_SEAT = {"$expr": {"$and": [
+    {"$lt": ["$registrationCount", "$maxCapacity"]},
+    {"$eq": [{"$ifNull": ["$waitlistCount", 0]}, 0]}
+]}}
+NO_FREE_SEAT = {"$expr": {"$or": [
+    {"$gte": ["$registrationCount", "$maxCapacity"]},
+    {"$gt": [{"$ifNull": ["$waitlistCount", 0]}, 0]}
+]}}
+# Seats that the people queueing should already have
+SEAT_FREE_WITH_QUEUE = {"$expr": {"$and": [
+    {"$lt": ["$registrationCount", "$maxCapacity"]},
+    {"$gt": [{"$ifNull": ["$waitlistCount", 0]}, 0]}
+]}}
+
+def registration_id(event_id: str, user_id: str) -> str:
+    return f"{event_id}:{user_id}"
+
+async def record_registration(db: AsyncIOMotorDatabase, event_id: str, user_id: str, registered_at: datetime) -> bool:
+    """Per-user lookup record; upserted by a fixed id so a retry cannot duplicate it.
+    Returns whether this call inserted it."""
+    result = await db.event_registrations.update_one(
+        {"_id": registration_id(event_id, user_id)},
+        {"$setOnInsert": {"eventId": event_id, "userId": user_id, "registeredAt": registered_at}},
+        upsert=True
+    )
+    return result.upserted_id is not None
+
+def promote_head(now: datetime, token: str) -> list:
+    """Pipeline stages that hand a free seat to the head of the waitlist.
+    
+    The head is only promoted if they are not already registered, and
+    `lastPromotion.token` tells the caller who was promoted. Anyone queued
+    who holds a seat is dropped from the waitlist and both counts are
+    recomputed, so the stages also repair counters that drifted.
+    """
+    head = {"$first": {"$ifNull": ["$waitlist.userId", []]}}
+    return [
+        {"$set": {"lastPromotion": {"$cond": [
+            {"$and": [
+                {"$gt": [{"$size": {"$ifNull": ["$waitlist", []]}}, 0]},
+                {"$lt": [{"$size": "$registrations"}, "$maxCapacity"]},
+                {"$not": [{"$in": [head, "$registrations.userId"]}]}
+            ]},
+            {"userId": head, "token": token},
+            "$lastPromotion"
+        ]}}},
+        {"$set": {
+            "registrations": {"$cond": [
+                {"$eq": ["$lastPromotion.token", token]},
+                {"$concatArrays": [
+                    "$registrations",
+                    [{"userId": "$lastPromotion.userId", "registrationDate": now}]
+                ]},
+                "$registrations"
+            ]}
+        }},
+        {"$set": {
+            # Nobody holding a seat stays queued, including the head just promoted
+            "waitlist": {"$filter": {
+                "input": {"$ifNull": ["$waitlist", []]},
+                "cond": {"$not": [{"$in": ["$$this.userId", "$registrations.userId"]}]}
+            }}
+        }},
+        {"$set": {
+            "registrationCount": {"$size": "$registrations"},
+            "waitlistCount": {"$size": "$waitlist"}
+        }}
+    ]
+
+def unregister_and_promote(user_id: str, now: datetime, token: str) -> list:
+    """Pipeline update that frees the user's seat and hands it to the head of the waitlist.
+    
+    Runs as a single document update, so no other registration can take the
+    seat in between.
+    """
+    return [
+        {"$set": {
+            "registrations": {"$filter": {
+                "input": "$registrations",
+                "cond": {"$ne": ["$$this.userId", user_id]}
+            }}
+        }},
+        *promote_head(now, token)
+    ]
+
+async def promote_waitlist(db: AsyncIOMotorDatabase, event_id: str) -> Optional[dict]:
+    """Fill every free seat of an event from its waitlist, one atomic promotion at a time.
+    
+    Needed whenever seats appear without an unregistration, such as a raised
+    maxCapacity; otherwise newcomers would queue behind the waitlist while
+    the seats stay empty. Returns the event's counts after the last change,
+    or None if there was nothing to promote.
+    """
+    updated_event = None
+    while True:
+        token = uuid.uuid4().hex
+        now = datetime.utcnow()
+        promoted = await db.events.find_one_and_update(
+            {"_id": event_id, **SEAT_FREE_WITH_QUEUE},
+            promote_head(now, token),
+            projection={**REGISTRATION_COUNT_PROJECTION, "lastPromotion": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        # Each round seats the head or drops a queued user who already has a seat
+        if promoted is None:
+            return updated_event
+        promotion = promoted.get("lastPromotion") or {}
+        if promotion.get("token") == token:
+            await record_registration(db, event_id, promotion["userId"], now)
+        updated_event = promoted
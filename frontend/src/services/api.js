@@ -55,6 +55,13 @@ export const eventsAPI = {
   
   createEvent: (eventData) => 
     apiClient.post('/events', eventData),
+  
+  // Live registration counts; returns a function that closes the stream
+  subscribeToRegistrations: (onUpdate) => {
+    const source = new EventSource(`${API}/events/stream`);
+    source.addEventListener('registration', (event) => onUpdate(JSON.parse(event.data)));
+    return () => source.close();
+  },
 };
 
 // Community API
@@ -123,6 +130,15 @@ export const qrAPI = {
     apiClient.get('/qr/access-logs'),
 };
 
+// Search API
+export const searchAPI = {
+  search: (query, limit = 10, skip = 0) => 
+    apiClient.get('/search', { params: { q: query, limit, skip } }),
+  
+  autocompleteEvents: (prefix) => 
+    apiClient.get('/search/events/autocomplete', { params: { prefix } }),
+};
+
 // Auth API
 export const authAPI = {
   login: (credentials) => 
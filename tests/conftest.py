@@ -0,0 +1,79 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Read when the backend modules are imported
+os.environ.setdefault("MONGO_URL", os.environ.get("TEST_MONGO_URL", "mongodb://localhost:27017"))
+os.environ.setdefault("REGISTER_IP_PER_MINUTE", "1000000")
+os.environ.setdefault("LOGIN_IP_PER_MINUTE", "1000000")
+os.environ.setdefault("CACHE_INVALIDATION", "none")
+
+TEST_MONGO_URL = os.environ.get("TEST_MONGO_URL")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "integration: needs a MongoDB server at TEST_MONGO_URL")
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def mongo_db():
+    """A throwaway database on the server at TEST_MONGO_URL, with the schema applied"""
+    if not TEST_MONGO_URL:
+        pytest.skip("set TEST_MONGO_URL to run tests against MongoDB")
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo.errors import PyMongoError
+    import database
+
+    client = AsyncIOMotorClient(TEST_MONGO_URL, serverSelectionTimeoutMS=2000)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError as error:
+        client.close()
+        pytest.skip(f"MongoDB at TEST_MONGO_URL is unreachable: {error}")
+
+    db = client[f"athletics_test_{uuid.uuid4().hex[:12]}"]
+    database.database.client = client
+    database.database.db = db
+    await database.create_indexes()
+    await database.initialize_default_data()
+    try:
+        yield db
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+@pytest.fixture
+async def api(mongo_db):
+    """HTTP client for the app, talking to `mongo_db`"""
+    import httpx
+    import server
+    from cache import cache
+
+    server.db = mongo_db
+    cache.local.entries.clear()
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=server.app), base_url="http://test"
+    ) as client:
+        yield client
+
+@pytest.fixture
+def register_member(api):
+    """Registers a new member; returns their auth headers and user record"""
+    async def register(name: str = "Test Athlete") -> dict:
+        response = await api.post("/api/auth/register", json={
+            "name": name,
+            "email": f"{uuid.uuid4().hex[:12]}@example.com",
+            "password": "correct-horse-battery"
+        })
+        assert response.status_code == 200, response.text
+        body = response.json()
+        return {"headers": {"Authorization": f"Bearer {body['access_token']}"}, "user": body["user"]}
+    return register
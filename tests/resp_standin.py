@@ -0,0 +1,102 @@
+"""A small in-process stand-in for a Redis server, for testing the cache.
+
+Speaks RESP2 over TCP and implements just what cache.py uses: GET, SET with
+PX, DEL, PUBLISH and SUBSCRIBE, plus PING, AUTH and SELECT.
+"""
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+class RespStandIn:
+    def __init__(self):
+        # key -> (value, monotonic expiry or None)
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.subscribers: Dict[bytes, Set[asyncio.StreamWriter]] = defaultdict(set)
+        self.commands: List[bytes] = []
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def stop(self):
+        for writers in self.subscribers.values():
+            for writer in writers:
+                writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def subscriber_count(self, channel: str) -> int:
+        return len(self.subscribers[channel.encode()])
+
+    @staticmethod
+    def encode(reply) -> bytes:
+        if isinstance(reply, Exception):
+            return b"-ERR %s\r\n" % str(reply).encode()
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(RespStandIn.encode(item) for item in reply)
+
+    @staticmethod
+    async def read_command(reader: asyncio.StreamReader) -> List[bytes]:
+        header = await reader.readuntil(b"\r\n")
+        if not header.startswith(b"*"):
+            raise ValueError("expected an array of bulk strings")
+        args = []
+        for _ in range(int(header[1:-2])):
+            length = int((await reader.readuntil(b"\r\n"))[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                args = await self.read_command(reader)
+                self.commands.append(args[0].upper())
+                writer.write(self.encode(self.execute(args, writer)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for writers in self.subscribers.values():
+                writers.discard(writer)
+            writer.close()
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: List[bytes], writer: asyncio.StreamWriter):
+        command, args = args[0].upper(), args[1:]
+        if command in (b"PING", b"AUTH", b"SELECT"):
+            return "PONG" if command == b"PING" else "OK"
+        if command == b"GET":
+            return self.get(args[0])
+        if command == b"SET":
+            expires = None
+            if len(args) == 4 and args[2].upper() == b"PX":
+                expires = time.monotonic() + int(args[3]) / 1000
+            self.data[args[0]] = (args[1], expires)
+            return "OK"
+        if command == b"DEL":
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if command == b"PUBLISH":
+            receivers = self.subscribers[args[0]]
+            for receiver in receivers:
+                receiver.write(self.encode([b"message", args[0], args[1]]))
+            return len(receivers)
+        if command == b"SUBSCRIBE":
+            self.subscribers[args[0]].add(writer)
+            return [b"subscribe", args[0], 1]
+        return ValueError(f"unknown command {command.decode()!r}")
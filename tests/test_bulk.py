@@ -0,0 +1,104 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from bulk import ResultLookups, ingest_results, iter_rows
+from member_ids import format_member_id
+from results import summarize_event_results
+
+def lif(header: str, *rows: str) -> io.StringIO:
+    return io.StringIO("\n".join([header, *rows]) + "\n")
+
+def test_lif_rows_carry_the_header_heat_and_wind():
+    rows = list(iter_rows(lif(
+        "12,1,3,Men 100m,+1.2",
+        "1,NT-000001,4,Runner,Sam,Darwin AC,10.52",
+        "DNF,NT-000002,5,Walker,Alex,Darwin AC,"
+    ), "lif"))
+
+    assert rows == [
+        (2, {"heat": 3, "wind": 1.2, "memberId": "NT-000001", "mark": "10.52", "placing": 1}),
+        (3, {"heat": 3, "wind": 1.2, "memberId": "NT-000002", "mark": "DNF"})
+    ]
+
+def test_lif_header_without_heat_or_wind():
+    rows = list(iter_rows(lif("12,,,Men 800m,NWI", "1,NT-000001,4,Runner,Sam,Darwin AC,1:52.34"), "lif"))
+
+    assert rows == [(2, {"memberId": "NT-000001", "mark": "1:52.34", "placing": 1})]
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_heats_and_final_are_stored_apart(mongo_db):
+    await mongo_db.events.insert_one({"_id": "meet-1", "startsAt": datetime(2030, 3, 15, 0, 30)})
+    await mongo_db.users.insert_many([
+        {"_id": f"athlete-{n}", "name": f"Athlete {n}", "email": f"athlete-{n}@example.com", "memberId": f"NT-00000{n}"}
+        for n in (1, 2)
+    ])
+    defaults = {"eventId": "meet-1", "discipline": "100m"}
+
+    for heat, athlete in ((1, 1), (2, 2)):
+        rows = iter_rows(lif(f"12,1,{heat},Men 100m,0.4", f"1,NT-00000{athlete},4,A,B,C,10.9{heat}"), "lif")
+        await ingest_results(mongo_db, rows, defaults, {"round": "heats"})
+    # The timing system numbers the final as round 2; the caller names it
+    final = iter_rows(lif("12,2,1,Men 100m,0.4", "1,NT-000002,4,A,B,C,10.70", "2,NT-000001,5,A,B,C,10.75"), "lif")
+    report = await ingest_results(mongo_db, final, defaults, {"round": "final"})
+
+    assert report.failed == 0
+    stored = await mongo_db.results.find({}, {"_id": 0, "round": 1, "heat": 1, "userId": 1}).to_list(length=None)
+    assert sorted((result["round"], result["heat"], result["userId"]) for result in stored) == [
+        ("final", 1, "athlete-1"), ("final", 1, "athlete-2"), ("heats", 1, "athlete-1"), ("heats", 2, "athlete-2")
+    ]
+    event = await mongo_db.events.find_one({"_id": "meet-1"})
+    assert event["results"]["winner"] == "Athlete 2"
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_files_sharing_lookups_are_summarized_once(mongo_db):
+    await mongo_db.events.insert_one({"_id": "meet-1", "startsAt": datetime(2030, 3, 15, 0, 30)})
+    await mongo_db.users.insert_one(
+        {"_id": "athlete-1", "name": "Athlete 1", "email": "athlete-1@example.com", "memberId": "NT-000001"}
+    )
+    lookups = ResultLookups()
+
+    for discipline, mark in (("100m", "10.90"), ("200m", "21.90")):
+        rows = iter_rows(lif("12,1,1,Men,0.4", f"1,NT-000001,4,A,B,C,{mark}"), "lif")
+        defaults = {"eventId": "meet-1", "discipline": discipline}
+        report = await ingest_results(mongo_db, rows, defaults, {"round": "final"}, lookups)
+        assert report.failed == 0
+
+    assert set(lookups.athletes) == {"NT-000001"} and set(lookups.events) == {"meet-1"}
+    # Until the caller summarizes, the event is left alone
+    assert "results" not in await mongo_db.events.find_one({"_id": "meet-1"})
+    await summarize_event_results(mongo_db, lookups.touched_events)
+    assert (await mongo_db.events.find_one({"_id": "meet-1"}))["results"]["participants"] == 1
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_lif_upload_needs_a_round(api, register_member):
+    member = await register_member()
+    lif_file = lif("12,2,1,Men 100m,0.4", f"1,{member['user']['memberId']},4,A,B,C,10.70").getvalue()
+
+    response = await api.post(
+        "/api/results/ingest", params={"eventId": "meet-1", "discipline": "100m"},
+        files={"file": ("final.lif", lif_file)}, headers=member["headers"]
+    )
+
+    assert response.status_code == 400
+    assert "round" in response.json()["detail"]
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_mistyped_member_ids_are_reported(mongo_db):
+    member_id = format_member_id(4217, 2030)
+    await mongo_db.events.insert_one({"_id": "meet-1", "startsAt": datetime(2030, 3, 15, 0, 30)})
+    await mongo_db.users.insert_one(
+        {"_id": "athlete-1", "name": "Athlete 1", "email": "athlete-1@example.com", "memberId": member_id}
+    )
+    mistyped = member_id[:-3] + str((int(member_id[-3]) + 1) % 10) + member_id[-2:]
+    rows = iter_rows(lif("12,1,1,Men 100m,0.4", f"1,{member_id},4,A,B,C,10.90", f"2,{mistyped},5,A,B,C,10.95"), "lif")
+
+    report = await ingest_results(mongo_db, rows, {"eventId": "meet-1", "discipline": "100m"}, {"round": "final"})
+
+    assert (report.processed, report.failed) == (2, 1)
+    assert [error["error"] for error in report.errors] == ["Invalid memberId check digits"]
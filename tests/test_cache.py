@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from cache import INVALIDATION_CHANNEL, Cache, RedisCache, SQLiteCache
+from tests.resp_standin import RespStandIn
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def standin_and_url():
+    standin = RespStandIn()
+    url = await standin.start()
+    yield standin, url
+    await standin.stop()
+
+async def eventually(check, timeout: float = 5.0):
+    """Wait for `check()` to hold, for things delivered by a background listener"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not check():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+async def workers(make_shared, invalidation: str, url: str = ""):
+    """Two caches as two workers would build them, each with its own connections"""
+    return [
+        Cache(make_shared(), invalidation, invalidation_url=url, worker_id=name)
+        for name in ("worker-a", "worker-b")
+    ]
+
+async def stop(*caches):
+    for cache in caches:
+        await cache.stop()
+
+async def test_redis_round_trip(standin_and_url):
+    _, redis_url = standin_and_url
+    first, second = await workers(lambda: RedisCache(redis_url), "none")
+    try:
+        await first.set("user:a@example.com", {"name": "A"}, ttl=60)
+        # The second worker has nothing locally, so this comes over the wire
+        assert await second.get("user:a@example.com") == {"name": "A"}
+
+        await first.evict("user:a@example.com")
+        assert await first.shared.get("user:a@example.com") is None
+        assert await first.get("user:a@example.com") is None
+    finally:
+        await stop(first, second)
+
+async def test_redis_entries_expire(standin_and_url):
+    _, redis_url = standin_and_url
+    first, second = await workers(lambda: RedisCache(redis_url), "none")
+    try:
+        await first.set("stats", [1, 2, 3], ttl=0.05)
+        await asyncio.sleep(0.1)
+        assert await second.get("stats") is None
+        assert await first.get("stats") is None
+    finally:
+        await stop(first, second)
+
+async def test_get_or_load_loads_once(standin_and_url):
+    _, redis_url = standin_and_url
+    cache = Cache(RedisCache(redis_url))
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return {"plans": 3}
+
+    try:
+        assert await cache.get_or_load("plans", load, ttl=60) == {"plans": 3}
+        assert await cache.get_or_load("plans", load, ttl=60) == {"plans": 3}
+        assert len(loads) == 1
+    finally:
+        await cache.stop()
+
+async def test_redis_eviction_reaches_other_workers(standin_and_url):
+    standin, url = standin_and_url
+    first, second = await workers(lambda: RedisCache(url), "redis", url)
+    await first.start(None)
+    await second.start(None)
+    try:
+        await eventually(lambda: standin.subscriber_count(INVALIDATION_CHANNEL) == 2)
+        await first.set("user:a@example.com", {"name": "A"}, ttl=60)
+        assert await second.get("user:a@example.com") == {"name": "A"}
+
+        await first.evict("user:a@example.com")
+
+        await eventually(lambda: second.local.get("user:a@example.com") is None)
+        assert await second.get("user:a@example.com") is None
+    finally:
+        await stop(first, second)
+
+async def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first, second = await workers(lambda: SQLiteCache(path), "none")
+    try:
+        await first.set("plans", ["basic", "elite"], ttl=60)
+        assert await second.get("plans") == ["basic", "elite"]
+
+        await first.evict("plans")
+        assert await second.shared.get("plans") is None
+        # Without an invalidation channel the other worker keeps its copy until it expires
+        assert second.local.get("plans") == ["basic", "elite"]
+    finally:
+        await stop(first, second)
+
+async def test_sqlite_eviction_reaches_other_workers_over_redis(tmp_path, standin_and_url):
+    standin, url = standin_and_url
+    path = str(tmp_path / "cache.sqlite3")
+    first, second = await workers(lambda: SQLiteCache(path), "redis", url)
+    await first.start(None)
+    await second.start(None)
+    try:
+        await eventually(lambda: standin.subscriber_count(INVALIDATION_CHANNEL) == 2)
+        await first.set("plans", ["basic"], ttl=60)
+        assert await second.get("plans") == ["basic"]
+
+        await first.evict("plans")
+
+        await eventually(lambda: second.local.get("plans") is None)
+        assert await second.get("plans") is None
+    finally:
+        await stop(first, second)
+
+async def test_sqlite_eviction_reaches_other_workers_over_mongo(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    db = AsyncMongoMockClient()["cache_test"]
+    first, second = await workers(lambda: SQLiteCache(path), "mongo")
+    # Change streams need a replica set, so the message is handed over directly
+    first.db = db
+    try:
+        await first.set("plans", ["basic"], ttl=60)
+        assert await second.get("plans") == ["basic"]
+
+        await first.evict("plans")
+        message = await db.cache_invalidations.find_one({}, {"_id": 0})
+        assert message["keys"] == ["plans"]
+
+        first.local.set("plans", ["stale"], 60)
+        first.receive_eviction(message)
+        second.receive_eviction(message)
+        # A worker ignores its own evictions; it already applied them
+        assert first.local.get("plans") == ["stale"]
+        assert second.local.get("plans") is None
+    finally:
+        await stop(first, second)
+
+@pytest.mark.integration
+async def test_mongo_eviction_reaches_other_workers_over_change_streams(tmp_path, mongo_db):
+    hello = await mongo_db.client.admin.command("hello")
+    if "setName" not in hello:
+        pytest.skip("change streams need a replica set")
+    path = str(tmp_path / "cache.sqlite3")
+    first, second = await workers(lambda: SQLiteCache(path), "mongo")
+    await first.start(mongo_db)
+    await second.start(mongo_db)
+    try:
+        # The listener opens its change stream in the background, so keep evicting until it hears one
+        async def evicted():
+            second.local.set("plans", ["basic"], 60)
+            await first.evict("plans")
+            await asyncio.sleep(0.2)
+            return second.local.get("plans") is None
+
+        for _ in range(25):
+            if await evicted():
+                break
+        assert second.local.get("plans") is None
+    finally:
+        await stop(first, second)
@@ -0,0 +1,19 @@
+import pytest
+
+pytestmark = [pytest.mark.anyio, pytest.mark.integration]
+
+async def test_stats_sum_the_post_counters(api, register_member):
+    author, reader = await register_member(), await register_member()
+    post_ids = []
+    for title in ("Track night", "Throws clinic"):
+        response = await api.post(
+            "/api/community/posts", headers=author["headers"], json={"title": title, "content": "See you there"}
+        )
+        post_ids.append(response.json()["id"])
+    for member in (author, reader):
+        await api.post(f"/api/community/posts/{post_ids[0]}/like", headers=member["headers"])
+    await api.post(f"/api/community/posts/{post_ids[1]}/comment", headers=reader["headers"], json={"content": "Count me in"})
+
+    response = await api.get("/api/community/stats")
+
+    assert response.json() == {"totalMembers": 2, "totalPosts": 2, "totalComments": 1, "totalLikes": 2}
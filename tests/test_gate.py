@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import pytest
+
+from utils import (
+    GATE_HEADER, GATE_RECORD, GATE_SNAPSHOT_FORMAT, GATE_SNAPSHOT_MAGIC,
+    datetime_to_version, pack_gate_snapshot
+)
+
+def unpack_snapshot(snapshot: bytes):
+    magic, fmt, record_size, count, version = GATE_HEADER.unpack_from(snapshot)
+    records = [
+        GATE_RECORD.unpack_from(snapshot, GATE_HEADER.size + index * record_size)
+        for index in range(count)
+    ]
+    return (magic, fmt, record_size, count, version), records
+
+def test_snapshot_layout():
+    snapshot = pack_gate_snapshot([
+        {"memberId": "NT-000002", "status": 3, "tier": 1, "expiresAt": 1900000000},
+        {"memberId": "NT-000001", "status": 1, "tier": 3, "expiresAt": 0},
+    ], 1234567890123)
+
+    assert GATE_HEADER.size == GATE_RECORD.size == 32
+    assert len(snapshot) == 32 * 3
+    header, records = unpack_snapshot(snapshot)
+    assert header == (GATE_SNAPSHOT_MAGIC, GATE_SNAPSHOT_FORMAT, 32, 2, 1234567890123)
+    # Sorted by member id so devices can binary search the file
+    assert records == [
+        (b"NT-000001".ljust(16, b"\0"), 1, 3, 0),
+        (b"NT-000002".ljust(16, b"\0"), 3, 1, 1900000000),
+    ]
+
+def test_empty_snapshot_is_just_a_header():
+    assert unpack_snapshot(pack_gate_snapshot([], 0)) == ((GATE_SNAPSHOT_MAGIC, GATE_SNAPSHOT_FORMAT, 32, 0, 0), [])
+
+async def poll(api, headers, **params) -> dict:
+    response = await api.get("/api/qr/gate/delta", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_snapshot_endpoint_matches_the_members(api, mongo_db, register_member):
+    members = [await register_member(f"Athlete {i}") for i in range(3)]
+    headers = members[0]["headers"]
+
+    response = await api.get("/api/qr/gate/snapshot", headers=headers)
+
+    assert response.status_code == 200
+    (magic, _, _, count, version), records = unpack_snapshot(response.content)
+    assert (magic, count) == (GATE_SNAPSHOT_MAGIC, 3)
+    assert [record[0].rstrip(b"\0").decode() for record in records] == sorted(
+        member["user"]["memberId"] for member in members
+    )
+    latest = await mongo_db.users.find_one({}, sort=[("updatedAt", -1)])
+    assert version == datetime_to_version(latest["updatedAt"])
+    assert response.headers["X-Snapshot-Version"] == str(version)
+
+    unchanged = await api.get("/api/qr/gate/snapshot", headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert unchanged.status_code == 304
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_delta_pages_through_members_sharing_a_timestamp(api, mongo_db, register_member):
+    members = [await register_member(f"Athlete {i}") for i in range(5)]
+    headers = members[0]["headers"]
+    # A bulk update stamps every member with the same time
+    stamp = datetime(2030, 1, 1)
+    await mongo_db.users.update_many({}, {"$set": {"updatedAt": stamp, "membershipStatus": "inactive"}})
+
+    seen = []
+    cursor = {"since": datetime_to_version(stamp) - 1}
+    while True:
+        page = await poll(api, headers, limit=2, **cursor)
+        seen.extend(entry["memberId"] for entry in page["members"])
+        assert len(page["members"]) <= 2
+        cursor = {"since": page["version"], "after": page["after"]}
+        if not page["hasMore"]:
+            break
+
+    assert sorted(seen) == sorted(member["user"]["memberId"] for member in members)
+    assert len(seen) == len(set(seen))
+    assert cursor["since"] == datetime_to_version(stamp)
+
+    # Caught up: the cursor does not move and nothing is sent again
+    caught_up = await poll(api, headers, **cursor)
+    assert caught_up["members"] == [] and caught_up["version"] == cursor["since"]
+    assert caught_up["after"] == cursor["after"]
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_only_a_snapshot_resume_reads_the_overlap(api, register_member):
+    first, second = await register_member(), await register_member()
+    snapshot = await api.get("/api/qr/gate/snapshot", headers=first["headers"])
+    version = int(snapshot.headers["X-Snapshot-Version"])
+
+    # Both members were stamped at or before the snapshot version, so only
+    # the overlap window brings them back
+    resumed = await poll(api, first["headers"], since=version)
+    assert {entry["memberId"] for entry in resumed["members"]} == {
+        first["user"]["memberId"], second["user"]["memberId"]
+    }
+
+    following = await poll(api, first["headers"], since=resumed["version"], after=resumed["after"])
+    assert following["members"] == []
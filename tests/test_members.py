@@ -0,0 +1,45 @@
+import pytest
+
+from auth import user_cache_key
+from cache import cache
+from member_stats import get_member_counts, recount_members
+
+pytestmark = [pytest.mark.anyio, pytest.mark.integration]
+
+async def test_profile_change_moves_counters_from_the_stored_type(api, mongo_db, register_member):
+    member = await register_member()
+    # Caches the profile as a basic member
+    assert (await api.get("/api/auth/me", headers=member["headers"])).json()["membershipType"] == "basic"
+
+    # Another worker upgrades the member while this one still holds the cached profile
+    await mongo_db.users.update_one({"_id": member["user"]["id"]}, {"$set": {"membershipType": "premium"}})
+    await recount_members(mongo_db)
+
+    response = await api.put("/api/auth/profile", headers=member["headers"], json={"membershipType": "elite"})
+    assert response.status_code == 200, response.text
+
+    counts = await get_member_counts(mongo_db)
+    assert counts["total"] == 1
+    assert {plan: count for plan, count in counts["byType"].items() if count} == {"elite": 1}
+    assert counts["byStatus"]["active"] == 1
+
+async def test_cached_profile_leaves_out_the_qr_card(api, mongo_db, register_member):
+    member = await register_member()
+    await mongo_db.users.update_one({"_id": member["user"]["id"]}, {"$set": {"qrCode": "data:image/png;base64,card"}})
+
+    profile = (await api.get("/api/auth/me", headers=member["headers"])).json()
+
+    assert profile["qrCode"] == "data:image/png;base64,card"
+    assert "qrCode" not in await cache.get(user_cache_key(member["user"]["email"]))
+
+async def test_verify_rejects_a_mistyped_member_id(api, register_member):
+    member = await register_member()
+    member_id = member["user"]["memberId"]
+    # Swap the last two digits of the sequence number
+    swapped = member_id[:8] + member_id[9] + member_id[8] + member_id[10:]
+    assert swapped != member_id
+
+    assert (await api.post("/api/qr/verify", json={"memberId": swapped})).json() == {
+        "valid": False, "message": "Member ID is mistyped"
+    }
+    assert (await api.post("/api/qr/verify", json={"memberId": member_id})).json()["valid"] is True
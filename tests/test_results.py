@@ -0,0 +1,114 @@
+from datetime import datetime
+
+import pytest
+
+from models import ResultCreate
+from results import ALL_AGE_GROUPS, build_result, parse_mark, save_results, sort_key, wind_is_legal
+
+EVENT = {"_id": "meet-1", "startsAt": datetime(2030, 3, 15, 0, 30)}
+LATER_EVENT = {"_id": "meet-2", "startsAt": datetime(2030, 4, 12, 0, 30)}
+ATHLETE = {"_id": "athlete-1", "name": "Sam Runner", "memberId": "NT-000001"}
+
+@pytest.mark.parametrize("discipline, mark, value", [
+    ("100m", "10.52", 10.52),
+    ("800m", "1:52.34", 112.34),
+    ("10000m", "1:02:03.5", 3723.5),
+    ("LJ", "7.45", 7.45),
+    ("LJ", "7.45m", 7.45),
+    ("HJ", " 2.01 ", 2.01),
+    ("DEC", "8126", 8126),
+])
+def test_parse_mark(discipline, mark, value):
+    assert parse_mark(discipline, mark) == pytest.approx(value)
+
+@pytest.mark.parametrize("mark", ["DNF", "dns", "DQ", "NM", "NH"])
+def test_parse_mark_keeps_non_marks_without_a_value(mark):
+    assert parse_mark("100m", mark) is None
+
+@pytest.mark.parametrize("discipline, mark", [
+    ("100m", "fast"),
+    ("100m", "1:2:3:4"),
+    ("LJ", "seven"),
+    ("HJ", "20.1"),
+    ("100m", "0"),
+    ("50m", "6.1"),
+])
+def test_parse_mark_rejects_bad_marks(discipline, mark):
+    with pytest.raises(ValueError):
+        parse_mark(discipline, mark)
+
+def test_sort_key_puts_the_best_mark_first():
+    assert sorted([10.52, 10.1, 10.9], key=lambda v: sort_key("100m", v)) == [10.1, 10.52, 10.9]
+    assert sorted([7.1, 7.45, 6.9], key=lambda v: sort_key("LJ", v)) == [7.45, 7.1, 6.9]
+    assert sort_key("LJ", None) is None
+
+@pytest.mark.parametrize("discipline, wind, legal", [
+    ("100m", 2.0, True),
+    ("100m", 2.1, False),
+    ("100m", -3.0, True),
+    ("100m", None, True),
+    ("LJ", 4.0, False),
+    ("400m", 4.0, True),
+    ("SP", 4.0, True),
+])
+def test_wind_is_legal(discipline, wind, legal):
+    assert wind_is_legal(discipline, wind) is legal
+
+def result(event=EVENT, **fields) -> dict:
+    entry = ResultCreate(**{"eventId": event["_id"], "discipline": "100m", "userId": ATHLETE["_id"], **fields})
+    return build_result(entry, event, ATHLETE)
+
+async def bests(db, **query) -> dict:
+    """The athlete's bests as {(scope, rankingGroup): mark}"""
+    return {
+        (best["scope"], best["rankingGroup"]): best["mark"]
+        async for best in db.personal_bests.find({"userId": ATHLETE["_id"], **query})
+    }
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_bests_rank_in_every_age_group_raced(mongo_db):
+    await save_results(mongo_db, [
+        result(mark="11.20", ageGroup="U18"),
+        result(LATER_EVENT, mark="10.95", ageGroup="Open")
+    ])
+
+    assert await bests(mongo_db) == {
+        ("pb", ALL_AGE_GROUPS): "10.95", ("2030", ALL_AGE_GROUPS): "10.95",
+        ("pb", "Open"): "10.95", ("2030", "Open"): "10.95",
+        ("pb", "U18"): "11.20", ("2030", "U18"): "11.20"
+    }
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_wind_assisted_marks_are_not_bests(mongo_db):
+    await save_results(mongo_db, [
+        result(mark="10.80", wind=1.5),
+        result(LATER_EVENT, mark="10.60", wind=3.1)
+    ])
+
+    assert set((await bests(mongo_db)).values()) == {"10.80"}
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_downgraded_mark_recomputes_bests(mongo_db):
+    await save_results(mongo_db, [result(mark="10.60"), result(LATER_EVENT, mark="10.90")])
+    assert (await bests(mongo_db, scope="pb"))[("pb", ALL_AGE_GROUPS)] == "10.60"
+
+    # The 10.60 was a timing error and is corrected to a DQ
+    await save_results(mongo_db, [result(mark="DQ")])
+
+    assert set((await bests(mongo_db)).values()) == {"10.90"}
+    stored = await mongo_db.results.find_one({"eventId": EVENT["_id"]})
+    assert stored["mark"] == "DQ" and stored["sortKey"] is None
+
+@pytest.mark.anyio
+@pytest.mark.integration
+async def test_age_group_correction_moves_the_best(mongo_db):
+    await save_results(mongo_db, [result(mark="10.60", ageGroup="Open", gender="F")])
+
+    await save_results(mongo_db, [result(mark="10.60", ageGroup="U20", gender="F")])
+
+    assert await bests(mongo_db, scope="pb") == {("pb", ALL_AGE_GROUPS): "10.60", ("pb", "U20"): "10.60"}
+    best = await mongo_db.personal_bests.find_one({"userId": ATHLETE["_id"], "scope": "pb", "rankingGroup": "U20"})
+    assert (best["ageGroup"], best["gender"]) == ("U20", "F")
@@ -0,0 +1,182 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from bulk import import_events, iter_rows
+from database import backfill_event_registrations
+from waitlist import registration_id
+
+pytestmark = [pytest.mark.anyio, pytest.mark.integration]
+
+EVENT = {
+    "name": "Winter Sprints",
+    "description": "Club sprint meet",
+    "date": "March 15, 2030",
+    "time": "9:00 AM - 5:00 PM",
+    "type": "Sprint",
+    "location": "Darwin",
+    "maxCapacity": 1,
+    "registrationDeadline": "March 1, 2030"
+}
+
+def event_csv(row: dict) -> io.StringIO:
+    stream = io.StringIO()
+    writer = csv.DictWriter(stream, fieldnames=list(row))
+    writer.writeheader()
+    writer.writerow(row)
+    stream.seek(0)
+    return stream
+
+async def create_event(api, headers, **fields) -> str:
+    response = await api.post("/api/events/", headers=headers, json={**EVENT, **fields})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+async def position(api, event_id, member) -> dict:
+    response = await api.get(f"/api/events/{event_id}/waitlist/position", headers=member["headers"])
+    assert response.status_code == 200, response.text
+    return response.json()
+
+async def test_full_event_waitlists_in_order(api, mongo_db, register_member):
+    members = [await register_member(f"Athlete {i}") for i in range(3)]
+    event_id = await create_event(api, members[0]["headers"])
+
+    responses = [
+        (await api.post(f"/api/events/{event_id}/register", headers=member["headers"])).json()
+        for member in members
+    ]
+
+    assert [response["waitlisted"] for response in responses] == [False, True, True]
+    assert [response.get("position") for response in responses[1:]] == [1, 2]
+
+    seated = await position(api, event_id, members[0])
+    assert seated["registered"] and not seated["waitlisted"]
+    assert seated["waitlistLength"] == 2
+    second = await position(api, event_id, members[2])
+    assert second == {**second, "waitlisted": True, "position": 2, "registered": False}
+
+    # Only the seated member keeps the lookup record written before the attempt
+    records = await mongo_db.event_registrations.find({"eventId": event_id}).to_list(length=None)
+    assert [record["userId"] for record in records] == [members[0]["user"]["id"]]
+
+async def test_registering_twice_is_rejected(api, register_member):
+    first, second = await register_member(), await register_member()
+    event_id = await create_event(api, first["headers"])
+    await api.post(f"/api/events/{event_id}/register", headers=first["headers"])
+    await api.post(f"/api/events/{event_id}/register", headers=second["headers"])
+
+    for member in (first, second):
+        response = await api.post(f"/api/events/{event_id}/register", headers=member["headers"])
+        assert response.status_code == 400
+
+async def test_unregister_promotes_the_head(api, mongo_db, register_member):
+    members = [await register_member(f"Athlete {i}") for i in range(3)]
+    event_id = await create_event(api, members[0]["headers"])
+    for member in members:
+        await api.post(f"/api/events/{event_id}/register", headers=member["headers"])
+    leaver, head, next_in_line = (member["user"]["id"] for member in members)
+
+    response = await api.delete(f"/api/events/{event_id}/register", headers=members[0]["headers"])
+    assert response.status_code == 200
+
+    event = await mongo_db.events.find_one({"_id": event_id})
+    assert [registration["userId"] for registration in event["registrations"]] == [head]
+    assert [entry["userId"] for entry in event["waitlist"]] == [next_in_line]
+    assert (event["registrationCount"], event["waitlistCount"]) == (1, 1)
+    assert await mongo_db.event_registrations.find_one({"_id": registration_id(event_id, head)})
+    assert not await mongo_db.event_registrations.find_one({"_id": registration_id(event_id, leaver)})
+
+    promoted = await position(api, event_id, members[1])
+    assert promoted["registered"] and promoted["position"] is None
+    assert (await position(api, event_id, members[2]))["position"] == 1
+
+async def test_leaving_the_waitlist(api, mongo_db, register_member):
+    members = [await register_member(f"Athlete {i}") for i in range(3)]
+    event_id = await create_event(api, members[0]["headers"])
+    for member in members:
+        await api.post(f"/api/events/{event_id}/register", headers=member["headers"])
+
+    response = await api.delete(f"/api/events/{event_id}/register", headers=members[1]["headers"])
+    assert response.json() == {"message": "Successfully left the waitlist"}
+
+    assert not (await position(api, event_id, members[1]))["waitlisted"]
+    assert (await position(api, event_id, members[2]))["position"] == 1
+    event = await mongo_db.events.find_one({"_id": event_id})
+    assert (event["registrationCount"], event["waitlistCount"]) == (1, 1)
+
+    response = await api.delete(f"/api/events/{event_id}/register", headers=members[1]["headers"])
+    assert response.status_code == 404
+
+async def test_raised_capacity_seats_the_waitlist_before_newcomers(api, mongo_db, register_member):
+    members = [await register_member(f"Athlete {i}") for i in range(4)]
+    event_id = await create_event(api, members[0]["headers"])
+    for member in members[:3]:
+        await api.post(f"/api/events/{event_id}/register", headers=member["headers"])
+    await mongo_db.events.update_one({"_id": event_id}, {"$set": {"maxCapacity": 4}})
+
+    # Both queued athletes are seated first, then the newcomer takes the last seat
+    response = await api.post(f"/api/events/{event_id}/register", headers=members[3]["headers"])
+    assert response.json()["waitlisted"] is False
+
+    event = await mongo_db.events.find_one({"_id": event_id})
+    assert [registration["userId"] for registration in event["registrations"]] == [
+        member["user"]["id"] for member in members
+    ]
+    assert (event["registrationCount"], event["waitlistCount"]) == (4, 0)
+    assert await mongo_db.event_registrations.count_documents({"eventId": event_id}) == 4
+
+async def test_import_raising_capacity_promotes_the_waitlist(api, mongo_db, register_member):
+    members = [await register_member(f"Athlete {i}") for i in range(3)]
+    row = {**EVENT, "externalId": "winter-sprints"}
+    await import_events(mongo_db, iter_rows(event_csv(row), "csv"))
+    event_id = (await mongo_db.events.find_one({"externalId": "winter-sprints"}))["_id"]
+    for member in members:
+        await api.post(f"/api/events/{event_id}/register", headers=member["headers"])
+
+    promoted = []
+    row["maxCapacity"] = 2
+    report = await import_events(mongo_db, iter_rows(event_csv(row), "csv"), promoted.append)
+
+    assert report.failed == 0
+    event = await mongo_db.events.find_one({"_id": event_id})
+    assert [registration["userId"] for registration in event["registrations"]] == [
+        member["user"]["id"] for member in members[:2]
+    ]
+    assert [entry["userId"] for entry in event["waitlist"]] == [members[2]["user"]["id"]]
+    assert [(event["registrationCount"], event["waitlistCount"]) for event in promoted] == [(2, 1)]
+
+async def test_registrations_list_the_seated_members(api, register_member):
+    members = [await register_member(f"Athlete {i}") for i in range(3)]
+    event_id = await create_event(api, members[0]["headers"], maxCapacity=2)
+    for member in members:
+        await api.post(f"/api/events/{event_id}/register", headers=member["headers"])
+
+    response = await api.get(f"/api/events/{event_id}/registrations", headers=members[0]["headers"])
+
+    body = response.json()
+    assert body["totalRegistrations"] == 2
+    assert [(entry["userId"], entry["userName"]) for entry in body["registrations"]] == [
+        (member["user"]["id"], member["user"]["name"]) for member in members[:2]
+    ]
+
+async def test_reconcile_restores_and_drops_lookup_records(api, mongo_db, register_member):
+    kept, left = await register_member(), await register_member()
+    event_id = await create_event(api, kept["headers"], maxCapacity=2)
+    for member in (kept, left):
+        await api.post(f"/api/events/{event_id}/register", headers=member["headers"])
+    kept_id, left_id = registration_id(event_id, kept["user"]["id"]), registration_id(event_id, left["user"]["id"])
+    # One record lost, and one left behind by an unregistration that stopped after freeing the seat
+    await mongo_db.event_registrations.delete_one({"_id": kept_id})
+    await mongo_db.events.update_one(
+        {"_id": event_id},
+        {"$pull": {"registrations": {"userId": left["user"]["id"]}}, "$inc": {"registrationCount": -1}}
+    )
+    await mongo_db.event_registrations.update_one(
+        {"_id": left_id}, {"$set": {"registeredAt": datetime.utcnow() - timedelta(hours=1)}}
+    )
+
+    await backfill_event_registrations()
+
+    assert [record["_id"] for record in await mongo_db.event_registrations.find().to_list(length=None)] == [kept_id]